@@ -0,0 +1,425 @@
+# Tên file: acl_compiler.py
+# Vai trò: Biên dịch file ACL (rules.json / rules2.json) thành tập luật OpenFlow tối thiểu
+# Mục đích: Hỗ trợ CIDR, cổng, giao thức, ALLOW/DENY có priority; loại luật bị che
+#           (shadowed) / thừa (redundant), gộp dải liền kề. Kết quả được cache theo
+#           hash của file rules để switch kết nối lại nhận ngay, không biên dịch lại.
+#
+# Định dạng một luật (các trường ngoài src_ip/action đều tuỳ chọn):
+#   {"id": 1, "src_ip": "10.0.0.0/24", "dst_ip": "10.0.0.64", "proto": "udp",
+#    "dst_port": "80" | 80 | "1000-2000", "action": "DENY" | "ALLOW", "priority": 10}
+#   proto: "icmp" | "tcp" | "udp" hoặc số giao thức IP (6, "6", ...)
+# Ngữ nghĩa: priority cao thắng; cùng priority thì luật đứng trước thắng;
+#            không khớp luật nào -> ALLOW (luật mặc định NORMAL của firewall).
+
+import bisect
+import hashlib
+import json
+import os
+import socket
+import time
+from ryu.lib.packet import ether_types
+from prefix_planner import int_to_ip, prefix_mask
+
+ACTIONS = ('ALLOW', 'DENY')
+PROTOCOLS = {'icmp': 1, 'tcp': 6, 'udp': 17}
+PORT_FIELDS = {6: 'tcp_dst', 17: 'udp_dst'}
+ANY_NET = (0, 0)     # Mạng biểu diễn bằng (địa chỉ mạng dạng int, prefixlen)
+
+
+class AclRule(object):
+    __slots__ = ('rid', 'priority', 'order', 'src', 'dst', 'proto', 'ports', 'action', 'level')
+
+    def __init__(self, rid, priority, order, src, dst, proto, ports, action):
+        self.rid = rid
+        self.priority = priority
+        self.order = order
+        self.src = src          # (net, plen)
+        self.dst = dst
+        self.proto = proto      # None = mọi giao thức
+        self.ports = ports      # None hoặc (lo, hi)
+        self.action = action
+        self.level = 0          # Tầng priority OpenFlow (tính khi biên dịch)
+
+    def sig(self):
+        """Các chiều ngoài src (dùng làm khoá nhóm)."""
+        return (self.dst, self.proto, self.ports)
+
+
+def _parse_ports(value, rid):
+    if isinstance(value, int):
+        lo = hi = value
+    else:
+        text = str(value)
+        lo, _, hi = text.partition('-')
+        lo = int(lo)
+        hi = int(hi) if hi else lo
+    if not 0 <= lo <= hi <= 0xffff:
+        raise ValueError(f"Rule {rid}: invalid port range {value!r}")
+    return lo, hi
+
+
+def parse_net(text):
+    """'10.0.0.0/24' | '10.0.0.1' -> (net, plen); bit host bị bỏ như strict=False."""
+    addr, _, plen = str(text).partition('/')
+    plen = int(plen) if plen else 32
+    if not 0 <= plen <= 32:
+        raise ValueError(f"invalid prefix length in {text!r}")
+    try:
+        value = int.from_bytes(socket.inet_aton(addr), 'big')
+    except OSError:
+        raise ValueError(f"invalid IPv4 address {text!r}")
+    if addr.count('.') != 3:
+        raise ValueError(f"invalid IPv4 address {text!r}")
+    return value & prefix_mask(plen), plen
+
+
+def net_contains(a, b):
+    """Mạng a chứa toàn bộ mạng b."""
+    return a[1] <= b[1] and b[0] & prefix_mask(a[1]) == a[0]
+
+
+def net_overlaps(a, b):
+    return net_contains(a, b) or net_contains(b, a)
+
+
+def collapse(nets):
+    """Gộp danh sách mạng thành tập CIDR tối thiểu (bỏ mạng con, gộp 2 nửa anh em)."""
+    out = []
+    for net in sorted(set(nets)):
+        if out and net_contains(out[-1], net):
+            continue
+        out.append(net)
+        while len(out) > 1:
+            (a, plen), (b, plen_b) = out[-2], out[-1]
+            size = 1 << (32 - plen)
+            if plen != plen_b or plen == 0 or a & size or a + size != b:
+                break
+            out[-2:] = [(a, plen - 1)]
+    return out
+
+
+def parse_rule(raw, order):
+    """dict trong file JSON -> AclRule (ValueError nếu luật không hợp lệ)."""
+    rid = raw.get('id', order)
+    action = str(raw.get('action', '')).upper()
+    if action not in ACTIONS:
+        raise ValueError(f"Rule {rid}: action must be ALLOW or DENY")
+    try:
+        src = parse_net(raw.get('src_ip', '0.0.0.0/0'))
+        dst = parse_net(raw['dst_ip']) if 'dst_ip' in raw else ANY_NET
+    except ValueError as e:
+        raise ValueError(f"Rule {rid}: {e}")
+
+    proto = raw.get('proto')
+    if proto is not None:
+        name = str(proto).strip().lower()
+        try:
+            proto = PROTOCOLS[name] if name in PROTOCOLS else int(name)
+        except ValueError:
+            proto = -1
+        if not 0 <= proto <= 255:
+            raise ValueError(f"Rule {rid}: unknown protocol {raw.get('proto')!r}")
+    ports = raw.get('dst_port')
+    if ports is not None:
+        if proto not in PORT_FIELDS:
+            raise ValueError(f"Rule {rid}: dst_port requires proto tcp or udp")
+        ports = _parse_ports(ports, rid)
+        if ports == (0, 0xffff):
+            ports = None
+    return AclRule(rid, int(raw.get('priority', 0)), order, src, dst, proto, ports, action)
+
+
+def _sig_covers(a, b):
+    """Nhóm a phủ toàn bộ nhóm b trên các chiều dst/proto/ports."""
+    dst_a, proto_a, ports_a = a
+    dst_b, proto_b, ports_b = b
+    if not net_contains(dst_a, dst_b):
+        return False
+    if proto_a is None:
+        return True
+    if proto_a != proto_b:
+        return False
+    if ports_a is None:
+        return True
+    return ports_b is not None and ports_a[0] <= ports_b[0] and ports_b[1] <= ports_a[1]
+
+
+def _overlaps(a, b):
+    if not (net_overlaps(a.src, b.src) and net_overlaps(a.dst, b.dst)):
+        return False
+    if a.proto is None or b.proto is None:
+        return True
+    if a.proto != b.proto:
+        return False
+    if a.ports is None or b.ports is None:
+        return True
+    return a.ports[0] <= b.ports[1] and b.ports[0] <= a.ports[1]
+
+
+class CoverIndex(object):
+    """
+    Tập luật đã thấy, nhóm theo sig(); mỗi nhóm là tập prefix src {(plen, net >> (32-plen))}.
+    covers(rule): có luật nào trong tập phủ toàn bộ rule không - O(#nhóm x 33).
+    """
+
+    def __init__(self):
+        self.groups = {}
+
+    def add(self, rule):
+        start, plen = rule.src
+        self.groups.setdefault(rule.sig(), set()).add((plen, start >> (32 - plen)))
+
+    def covers(self, rule):
+        sig = rule.sig()
+        start, length = rule.src
+        for group_sig, nets in self.groups.items():
+            if group_sig != sig and not _sig_covers(group_sig, sig):
+                continue
+            for plen in range(length + 1):
+                if (plen, start >> (32 - plen)) in nets:
+                    return True
+        return False
+
+
+class OverlapIndex(object):
+    """
+    Tìm nhanh các luật có src chồng lấn với một luật: prefix chỉ có thể lồng nhau
+    hoặc rời nhau, nên luật chồng lấn = tổ tiên (33 lần tra dict) + các prefix có
+    điểm bắt đầu nằm trong dải của luật (tìm nhị phân trên danh sách đã sắp xếp).
+    """
+
+    def __init__(self):
+        self.by_prefix = {}     # {(plen, prefix): [rule]}
+        self.starts = []        # [(network_int, seq)] đã sắp xếp
+        self.rules = []
+
+    def add(self, rule):
+        start, plen = rule.src
+        self.by_prefix.setdefault((plen, start >> (32 - plen)), []).append(rule)
+        bisect.insort(self.starts, (start, len(self.rules)))
+        self.rules.append(rule)
+
+    def overlapping(self, rule):
+        start, length = rule.src
+        found = []
+        for plen in range(length):
+            found.extend(self.by_prefix.get((plen, start >> (32 - plen)), ()))
+        end = start + (1 << (32 - length))
+        i = bisect.bisect_left(self.starts, (start, -1))
+        starts = self.starts
+        while i < len(starts) and starts[i][0] < end:
+            found.append(self.rules[starts[i][1]])
+            i += 1
+        return [r for r in found if _overlaps(r, rule)]
+
+
+def port_blocks(lo, hi):
+    """Dải cổng [lo, hi] -> các cặp (value, mask) tối thiểu (OVS hỗ trợ mask cho tcp/udp_dst)."""
+    blocks = []
+    while lo <= hi:
+        size = lo & -lo if lo else 0x10000
+        while size > hi - lo + 1:
+            size >>= 1
+        blocks.append((lo, 0xffff & ~(size - 1)))
+        lo += size
+    return blocks
+
+
+def _merge_ranges(ranges):
+    merged = []
+    for lo, hi in sorted(ranges):
+        if merged and lo <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(hi, merged[-1][1]))
+        else:
+            merged.append((lo, hi))
+    return merged
+
+
+def _net_field(net):
+    start, plen = net
+    if plen == 32:
+        return int_to_ip(start)
+    return (int_to_ip(start), int_to_ip(prefix_mask(plen)))
+
+
+class CompiledFlow(object):
+    """Một luật OpenFlow đầu ra: priority, các trường match, action."""
+    __slots__ = ('priority', 'fields', 'action')
+
+    def __init__(self, priority, fields, action):
+        self.priority = priority
+        self.fields = fields
+        self.action = action
+
+    def match(self, parser):
+        return parser.OFPMatch(**self.fields)
+
+    def actions(self, parser, ofproto):
+        if self.action == 'DENY':
+            return []  # Action rỗng = DROP
+        return [parser.OFPActionOutput(ofproto.OFPP_NORMAL)]
+
+    def key(self):
+        """Khoá ổn định (priority + match) để so sánh giữa 2 lần biên dịch."""
+        return (self.priority, tuple(sorted(self.fields.items())))
+
+
+class CompiledACL(object):
+    __slots__ = ('digest', 'rules_in', 'shadowed', 'redundant', 'flows', 'compile_time')
+
+    def __init__(self, digest, rules_in, shadowed, redundant, flows, compile_time):
+        self.digest = digest
+        self.rules_in = rules_in
+        self.shadowed = shadowed      # [rid] bị luật ưu tiên hơn che hoàn toàn
+        self.redundant = redundant    # [rid] bỏ đi không đổi kết quả
+        self.flows = flows            # [CompiledFlow], priority giảm dần
+        self.compile_time = compile_time
+
+
+def compile_rules(raw_rules, base_priority, digest=None):
+    """Biên dịch danh sách luật; priority OpenFlow = base_priority + tầng của luật."""
+    t0 = time.perf_counter()
+    rules = [parse_rule(raw, order) for order, raw in enumerate(raw_rules)]
+    rules.sort(key=lambda r: (-r.priority, r.order))
+
+    # 1. Luật bị che: một luật ưu tiên hơn phủ toàn bộ nó (bất kể action)
+    higher = CoverIndex()
+    kept = []
+    shadowed = []
+    for rule in rules:
+        if higher.covers(rule):
+            shadowed.append(rule.rid)
+        else:
+            kept.append(rule)
+        higher.add(rule)
+
+    # 2. Luật thừa + tầng priority: duyệt từ ưu tiên thấp lên cao
+    #    Chỉ luật chồng lấn mà KHÁC action mới cần priority cao hơn.
+    lower = {'ALLOW': OverlapIndex(), 'DENY': OverlapIndex()}
+    lower_index = {'ALLOW': CoverIndex(), 'DENY': CoverIndex()}
+    final = []
+    redundant = []
+    for rule in reversed(kept):
+        other = 'DENY' if rule.action == 'ALLOW' else 'ALLOW'
+        clash = lower[other].overlapping(rule)
+        if not clash and (rule.action == 'ALLOW' or lower_index['DENY'].covers(rule)):
+            # ALLOW không che DENY nào = mặc định; DENY đã nằm trong DENY thấp hơn
+            redundant.append(rule.rid)
+            continue
+        rule.level = 1 + max(r.level for r in clash) if clash else 0
+        lower[rule.action].add(rule)
+        lower_index[rule.action].add(rule)
+        final.append(rule)
+
+    # 3. Gộp: cổng liền kề (cùng src), rồi src thành CIDR lớn nhất (cùng phần còn lại)
+    by_src = {}
+    for rule in final:
+        key = (rule.level, rule.action, rule.src, rule.dst, rule.proto)
+        by_src.setdefault(key, []).append(rule.ports)
+    by_rest = {}
+    for (level, action, src, dst, proto), ports in by_src.items():
+        if None in ports:
+            merged = None
+        else:
+            merged = tuple(_merge_ranges(ports))
+        by_rest.setdefault((level, action, dst, proto, merged), []).append(src)
+
+    flows = []
+    for (level, action, dst, proto, ports), srcs in by_rest.items():
+        base = {'eth_type': ether_types.ETH_TYPE_IP}
+        if dst != ANY_NET:
+            base['ipv4_dst'] = _net_field(dst)
+        if proto is not None:
+            base['ip_proto'] = proto
+        port_matches = [None]
+        if ports is not None:
+            port_matches = [block for lo, hi in ports for block in port_blocks(lo, hi)]
+        for src in collapse(srcs):
+            for block in port_matches:
+                fields = dict(base)
+                if src != ANY_NET:
+                    fields['ipv4_src'] = _net_field(src)
+                if block is not None:
+                    value, mask = block
+                    fields[PORT_FIELDS[proto]] = value if mask == 0xffff else (value, mask)
+                flows.append(CompiledFlow(base_priority + level, fields, action))
+    flows.sort(key=lambda f: -f.priority)
+
+    return CompiledACL(digest, len(rules), shadowed, redundant, flows,
+                       time.perf_counter() - t0)
+
+
+# Cache theo SHA-256 của nội dung file rules (dùng chung cho mọi app trong tiến trình)
+_CACHE = {}
+# Bản đã biên dịch giữ trên đĩa (cache_dir): khởi động lại không phải biên dịch lại
+DISK_CACHE_KEEP = 4     # Số bộ luật đã biên dịch giữ lại (cũ hơn thì xoá)
+
+
+def rules_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _disk_cache_path(cache_dir, digest, base_priority):
+    return os.path.join(cache_dir, f"acl-{digest[:32]}-{base_priority}.json")
+
+
+def _load_cached(path, digest):
+    """CompiledACL từ file JSON trong cache_dir; None nếu không đọc được / không khớp digest."""
+    try:
+        with open(path, 'rb') as f:
+            data = json.loads(f.read())
+        if data['digest'] != digest:
+            return None
+        # JSON không có tuple: (ip, mask) / (port, mask) trong match được đổi lại
+        flows = [CompiledFlow(int(priority),
+                              {name: tuple(value) if isinstance(value, list) else value
+                               for name, value in fields.items()}, action)
+                 for priority, fields, action in data['flows']]
+        return CompiledACL(digest, data['rules_in'], data['shadowed'], data['redundant'],
+                           flows, data['compile_time'])
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+
+def _store_cached(path, compiled):
+    cache_dir = os.path.dirname(path)
+    data = {'digest': compiled.digest, 'rules_in': compiled.rules_in,
+            'shadowed': compiled.shadowed, 'redundant': compiled.redundant,
+            'compile_time': compiled.compile_time,
+            'flows': [(flow.priority, flow.fields, flow.action) for flow in compiled.flows]}
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(tmp, path)
+        cached = sorted((os.path.join(cache_dir, name) for name in os.listdir(cache_dir)
+                         if name.startswith('acl-') and name.endswith('.json')),
+                        key=os.path.getmtime)
+        for old in cached[:-DISK_CACHE_KEEP]:
+            os.remove(old)
+    except (OSError, TypeError, ValueError):
+        pass    # Chỉ là cache: lần sau biên dịch lại
+
+
+def compile_file(path, base_priority, loader, cache_dir=None):
+    """
+    Đọc + biên dịch file rules, dùng lại kết quả nếu nội dung file không đổi.
+    loader: hàm bytes -> list luật (json.loads).
+    cache_dir: thư mục giữ bản đã biên dịch qua các lần khởi động (None = chỉ RAM).
+    Trả về (raw_rules, CompiledACL).
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    digest = rules_digest(data)
+    raw_rules = loader(data)
+    key = (digest, base_priority)
+    compiled = _CACHE.get(key)
+    if compiled is None and cache_dir is not None:
+        compiled = _load_cached(_disk_cache_path(cache_dir, digest, base_priority), digest)
+    if compiled is None:
+        compiled = compile_rules(raw_rules, base_priority, digest)
+        if cache_dir is not None:
+            _store_cached(_disk_cache_path(cache_dir, digest, base_priority), compiled)
+    _CACHE[key] = compiled
+    return raw_rules, compiled
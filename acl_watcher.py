@@ -0,0 +1,137 @@
+# Tên file: acl_watcher.py
+# Vai trò: Tự nạp lại file ACL khi thay đổi và chỉ gửi phần chênh lệch xuống switch
+# Mục đích: Không cần khởi động lại controller (và đẩy lại toàn bộ bảng luật) mỗi
+#           lần sửa rules.json; độ trễ cấu hình tỉ lệ với số luật thay đổi.
+
+import json
+import os
+
+from acl_compiler import compile_file, compile_rules, rules_digest, CompiledFlow
+from flow_reconciler import COOKIE_ACL, cookie_flows, match_key
+
+RELOAD_INTERVAL = 1.0    # Chu kỳ kiểm tra file rules (Giây)
+
+
+class AclWatcher(object):
+    """
+    Theo dõi một file rules theo kiểu polling (mtime + size, như inotify đơn giản).
+    - load(): đọc + kiểm tra + biên dịch; lỗi thì giữ nguyên bộ luật cũ.
+    - poll(): nếu file đổi và biên dịch thành công -> (to_add, to_delete).
+    - update(raw_rules): thay bộ luật từ REST API, ghi lại file -> (to_add, to_delete).
+    - reconcile(flows): so với flow ACL đang có trên switch -> (to_add, to_delete).
+    """
+
+    def __init__(self, path, base_priority, logger, cache_dir=None):
+        self.path = path
+        self.base_priority = base_priority
+        self.logger = logger
+        self.cache_dir = cache_dir    # Bản đã biên dịch trên đĩa (xem compile_file)
+        self.stamp = None
+        self.raw_rules = []
+        self.compiled = None
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def load(self):
+        """Trả về True nếu nạp thành công một bộ luật mới (khác nội dung cũ)."""
+        self.stamp = self._stat()
+        try:
+            raw_rules, compiled = compile_file(self.path, self.base_priority, json.loads,
+                                                self.cache_dir)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            self.logger.warning(f"[ACL] Cannot load {self.path}: {e} (keeping current rules)")
+            return False
+        if self.compiled is not None and compiled.digest == self.compiled.digest:
+            return False
+        self.raw_rules = raw_rules
+        self.compiled = compiled
+        self.logger.info(f"[ACL] {self.path}: {len(raw_rules)} rules -> {len(compiled.flows)} flows "
+                         f"({len(compiled.shadowed)} shadowed, {len(compiled.redundant)} redundant, "
+                         f"{compiled.compile_time * 1000:.1f} ms)")
+        return True
+
+    @property
+    def flows(self):
+        return self.compiled.flows if self.compiled is not None else []
+
+    @staticmethod
+    def diff(old_flows, new_flows):
+        """(to_add, to_delete): flow mới/đổi action cần ADD, flow không còn cần DELETE_STRICT."""
+        old = {flow.key(): flow for flow in old_flows}
+        new = {flow.key(): flow for flow in new_flows}
+        to_add = [flow for key, flow in new.items()
+                  if key not in old or old[key].action != flow.action]
+        to_delete = [flow for key, flow in old.items() if key not in new]
+        return to_add, to_delete
+
+    def update(self, raw_rules):
+        """
+        Biên dịch bộ luật mới; luật sai -> ValueError và không đổi gì. Thành công thì
+        ghi đè file (tmp + rename, khởi động lại vẫn giữ) mà poll() không nạp lại lần nữa.
+        """
+        data = json.dumps(raw_rules, indent=4, ensure_ascii=False).encode('utf-8')
+        try:
+            compiled = compile_rules(raw_rules, self.base_priority, rules_digest(data))
+        except (KeyError, TypeError, AttributeError) as e:
+            raise ValueError(f"Invalid rule: {e!r}")
+        tmp = self.path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, self.path)
+        self.stamp = self._stat()
+        old_flows = self.flows
+        self.raw_rules = raw_rules
+        self.compiled = compiled
+        self.logger.info(f"[ACL] API update: {len(raw_rules)} rules -> {len(compiled.flows)} flows "
+                         f"({compiled.compile_time * 1000:.1f} ms)")
+        return self.diff(old_flows, compiled.flows)
+
+    def reconcile(self, flows):
+        """
+        (to_add, to_delete) để bảng ACL của switch khớp bộ luật hiện tại, từ Flow Stats
+        của switch (None = không biết switch có gì -> cài toàn bộ).
+        """
+        if flows is None:
+            return list(self.flows), []
+        existing = {}
+        for stat in cookie_flows(flows, COOKIE_ACL):
+            actions = [action for inst in stat.instructions for action in getattr(inst, 'actions', ())]
+            existing[match_key(stat.priority, stat.match)] = 'ALLOW' if actions else 'DENY'
+        to_add = []
+        for flow in self.flows:
+            if existing.pop(flow.key(), None) != flow.action:
+                to_add.append(flow)
+        # Còn lại: flow của bộ luật cũ (đổi khi controller không chạy) -> xoá
+        to_delete = [CompiledFlow(priority, dict(fields), None)
+                     for priority, fields in existing]
+        return to_add, to_delete
+
+    def poll(self):
+        if self._stat() == self.stamp:
+            return None
+        old_flows = self.flows
+        if not self.load():
+            return None
+        return self.diff(old_flows, self.flows)
+
+
+def push_diff(programmer, datapath, to_add, to_delete, callback=None):
+    """ADD luật mới trước rồi mới DELETE_STRICT luật bị bỏ (không có khoảng hở), chung một lô."""
+    ofproto = datapath.ofproto
+    parser = datapath.ofproto_parser
+    for flow in to_add:
+        inst = [parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS,
+                                             flow.actions(parser, ofproto))]
+        programmer.send(datapath, parser.OFPFlowMod(
+            datapath=datapath, cookie=COOKIE_ACL, priority=flow.priority,
+            match=flow.match(parser), instructions=inst))
+    for flow in to_delete:
+        programmer.send(datapath, parser.OFPFlowMod(
+            datapath=datapath, command=ofproto.OFPFC_DELETE_STRICT, priority=flow.priority,
+            match=flow.match(parser), out_port=ofproto.OFPP_ANY, out_group=ofproto.OFPG_ANY))
+    return programmer.flush(datapath, callback)
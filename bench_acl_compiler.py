@@ -0,0 +1,67 @@
+# Tên file: bench_acl_compiler.py
+# Vai trò: Benchmark biên dịch ACL lớn (100k luật): thời gian + số flow sinh ra
+# Cách chạy: python bench_acl_compiler.py
+# So sánh với cách cũ (mỗi luật DENY = một flow ipv4_src) và đo cache hit khi switch kết nối lại.
+
+import json
+import os
+import random
+import tempfile
+import time
+
+from acl_compiler import compile_rules, compile_file
+
+N_RULES = 100000
+BASE_PRIORITY = 11
+
+
+def make_rules(n, seed=5):
+    """
+    Tập luật giả lập:
+    - 85% DENY /32 ngẫu nhiên trong 10.16.0.0/12 (danh sách đen),
+    - 10% DENY theo dải /24 (một phần trùng/che các /32 ở trên),
+    - 5% ALLOW ngoại lệ priority cao cho web (tcp 80-89 / 443) tới 10.0.0.64.
+    """
+    rnd = random.Random(seed)
+    rules = []
+    for i in range(n):
+        kind = rnd.random()
+        if kind < 0.85:
+            ip = f"10.{16 + rnd.randint(0, 15)}.{rnd.randint(0, 255)}.{rnd.randint(0, 255)}"
+            rules.append({"id": i, "src_ip": ip, "action": "DENY"})
+        elif kind < 0.95:
+            net = f"10.{16 + rnd.randint(0, 15)}.{rnd.randint(0, 255)}.0/24"
+            rules.append({"id": i, "src_ip": net, "action": "DENY"})
+        else:
+            net = f"10.{16 + rnd.randint(0, 15)}.{rnd.randint(0, 255)}.0/26"
+            port = rnd.choice(["80-89", "443"])
+            rules.append({"id": i, "src_ip": net, "dst_ip": "10.0.0.64", "proto": "tcp",
+                          "dst_port": port, "action": "ALLOW", "priority": 10})
+    return rules
+
+
+if __name__ == '__main__':
+    rules = make_rules(N_RULES)
+    naive = sum(1 for r in rules if r['action'] == 'DENY')
+
+    compiled = compile_rules(rules, BASE_PRIORITY)
+    levels = len({f.priority for f in compiled.flows})
+    print(f"{N_RULES} rules | old: {naive} flows (DENY only, no CIDR/ALLOW)")
+    print(f"compiled in {compiled.compile_time:.2f} s -> {len(compiled.flows)} flows "
+          f"({levels} priority levels, {len(compiled.shadowed)} shadowed, "
+          f"{len(compiled.redundant)} redundant)")
+
+    # Cache theo hash file: lần đọc thứ 2 (switch kết nối lại / app khác) không biên dịch lại
+    with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+        json.dump(rules, f)
+        path = f.name
+    try:
+        t0 = time.perf_counter()
+        compile_file(path, BASE_PRIORITY, json.loads)
+        t1 = time.perf_counter()
+        compile_file(path, BASE_PRIORITY, json.loads)
+        t2 = time.perf_counter()
+        print(f"compile_file: first {t1 - t0:.2f} s | cached {(t2 - t1) * 1000:.1f} ms "
+              f"(read + hash + json only)")
+    finally:
+        os.remove(path)
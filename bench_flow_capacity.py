@@ -0,0 +1,61 @@
+# Tên file: bench_flow_capacity.py
+# Vai trò: Kích thước bảng flow của SDNSmartFirewall (reactive) khi bị flood nguồn giả mạo
+# Cách chạy: python bench_flow_capacity.py [số cổng tấn công] [gói/giây mỗi cổng] [giây]
+# So bảng flow không giới hạn (như trước) với TABLE_SIZE nhỏ: số flow lớn nhất trên
+# switch, số flow bị loại, Packet-In của lưu lượng thật (replay_harness.py, SimDatapath).
+
+import logging
+import sys
+
+import smart_firewall
+from flow_capacity import CLASS_FORWARD, CLASS_BLOCK
+from l2_pipeline import MODE_REACTIVE
+from replay_harness import (Replay, SimDatapath, synthetic_l2_traffic,
+                            synthetic_spoofed_flood)
+
+LEGIT_EXCHANGES = 20000
+HOSTS = 64
+
+
+def run(name, table_size, forward_budget, packets):
+    smart_firewall.FORWARDING_MODE = MODE_REACTIVE
+    smart_firewall.SNAPSHOTS = False
+    smart_firewall.TABLE_SIZE = table_size
+    smart_firewall.FLOW_BUDGETS = {CLASS_FORWARD: forward_budget,
+                                   CLASS_BLOCK: smart_firewall.MAX_BLOCK_RULES}
+    app = smart_firewall.SDNSmartFirewall()
+    replay = Replay(app, datapath_class=SimDatapath)
+    replay.connect(1)
+    replay.answer_barriers()
+
+    def tick(now):
+        # Phần của vòng _monitor liên quan tới bảng flow
+        app.capacity.expire(now)
+        for dp in list(app.datapaths.values()):
+            app._enforce_capacity(dp)
+        app._expire_blocks(now)
+
+    result = replay.traffic(packets, name, sample_every=200, tick=tick)
+    flows = app.capacity.switch(1)
+    result.extra.update(tracked=flows.total(), evicted=flows.evicted,
+                        coarse=int(flows.coarse_forwarding()))
+    print(result.report())
+    return result
+
+
+def main():
+    ports = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    pps = float(sys.argv[2]) if len(sys.argv) > 2 else 120
+    duration = float(sys.argv[3]) if len(sys.argv) > 3 else 30
+    logging.disable(logging.WARNING)
+    legit = synthetic_l2_traffic(LEGIT_EXCHANGES, HOSTS, duration * 3)
+    flood = synthetic_spoofed_flood(ports, pps, duration, HOSTS, start=duration)
+    packets = sorted(legit + flood, key=lambda p: p[0])
+    print(f"{len(legit)} legit + {len(flood)} spoofed packets, {ports} port(s) x {pps:g} pps "
+          f"for {duration:g}s")
+    run("unbounded", 10 ** 9, 10 ** 9, packets)
+    run("table 1000", 1000, 800, packets)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+# Tên file: bench_l2_forwarding.py
+# Vai trò: So sánh chuyển mạch reactive và proactive (l2_pipeline.py) trên cùng lưu lượng
+# Cách chạy: python bench_l2_forwarding.py [số trao đổi] [số host] [thời gian (giây)]
+# Lưu lượng đi qua SimDatapath (replay_harness.py): chỉ gói switch không khớp flow mới
+# thành Packet-In. In số Packet-In, Packet-In/giây, kích thước bảng flow (cuối / lớn nhất)
+# và số FlowMod cho LegacySwitch và SDNSmartFirewall ở từng chế độ.
+
+import json
+import logging
+import os
+import sys
+import tempfile
+
+import legacy_switch
+import smart_firewall
+from l2_pipeline import MODE_REACTIVE, MODE_PROACTIVE
+from replay_harness import Replay, SimDatapath, synthetic_l2_traffic
+
+
+def write_host_map(path, hosts):
+    with open(path, 'w') as f:
+        json.dump([{'dpid': 1, 'port': i, 'mac': i.to_bytes(6, 'big').hex(':'),
+                    'ip': f"10.0.{i >> 8}.{i & 255}"} for i in range(1, hosts + 1)], f)
+
+
+def run(name, module, cls, mode, host_map, packets):
+    module.FORWARDING_MODE = mode
+    module.HOST_MAP_FILE = host_map
+    app = cls()
+    replay = Replay(app, datapath_class=SimDatapath)
+    replay.connect(1)
+    replay.answer_barriers()
+    result = replay.traffic(packets, name)
+    result.extra['flow_mods'] = app.flows.flowmods_sent
+    print(result.report())
+    return result
+
+
+def main():
+    exchanges = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    hosts = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+    duration = float(sys.argv[3]) if len(sys.argv) > 3 else 600.0
+    logging.disable(logging.WARNING)
+    packets = synthetic_l2_traffic(exchanges, hosts, duration)
+    print(f"{len(packets)} packets, {hosts} hosts, {duration:g}s (virtual)")
+    with tempfile.TemporaryDirectory() as tmp:
+        host_map = os.path.join(tmp, 'hosts.json')
+        write_host_map(host_map, hosts)
+        missing = os.path.join(tmp, 'none.json')
+        for module, cls in ((legacy_switch, legacy_switch.LegacySwitch),
+                            (smart_firewall, smart_firewall.SDNSmartFirewall)):
+            base = cls.__name__
+            run(f"{base} reactive", module, cls, MODE_REACTIVE, missing, packets)
+            run(f"{base} proactive", module, cls, MODE_PROACTIVE, missing, packets)
+            run(f"{base} proactive+hosts", module, cls, MODE_PROACTIVE, host_map, packets)
+
+
+if __name__ == '__main__':
+    main()
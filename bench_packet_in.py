@@ -0,0 +1,182 @@
+# Tên file: bench_packet_in.py
+# Vai trò: Microbenchmark Packet-In (gói/giây) của handler cũ và fast path
+# Cách chạy: python bench_packet_in.py
+# Handler cũ dựng ryu.lib.packet.Packet cho mỗi gói; fast path chỉ đọc header Ethernet.
+
+import random
+import struct
+import time
+
+from ryu.ofproto import ofproto_v1_3, ofproto_v1_3_parser
+from ryu.lib.packet import packet, ethernet, ether_types
+
+from l2_fastpath import parse_eth, MacTable
+from legacy_switch import LegacySwitch
+from smart_firewall import SDNSmartFirewall
+
+N_PACKETS = 50000
+N_HOSTS = 64
+
+
+class FakeDatapath(object):
+    """Datapath giả: có ofproto/parser thật của Ryu nhưng send_msg không gửi đi đâu."""
+    ofproto = ofproto_v1_3
+    ofproto_parser = ofproto_v1_3_parser
+
+    def __init__(self, dpid=1):
+        self.id = dpid
+        self.sent = 0
+        self.xid = 0
+
+    def set_xid(self, msg):
+        self.xid += 1
+        msg.set_xid(self.xid)
+        return self.xid
+
+    def send_msg(self, msg):
+        self.sent += 1
+
+
+class FakeMsg(object):
+    __slots__ = ('datapath', 'match', 'data', 'buffer_id')
+
+    def __init__(self, datapath, in_port, data):
+        self.datapath = datapath
+        self.match = {'in_port': in_port}
+        self.data = data
+        self.buffer_id = ofproto_v1_3.OFP_NO_BUFFER
+
+
+class FakeEvent(object):
+    __slots__ = ('msg',)
+
+    def __init__(self, msg):
+        self.msg = msg
+
+
+def make_frames(datapath, n, seed=1):
+    """Frame UDP 64 byte giữa N_HOSTS host (MAC 00:00:00:00:00:xx như FinalTopo)."""
+    rnd = random.Random(seed)
+    events = []
+    for _ in range(n):
+        src = rnd.randint(1, N_HOSTS)
+        dst = rnd.randint(1, N_HOSTS)
+        header = struct.pack('!6s6sH', dst.to_bytes(6, 'big'), src.to_bytes(6, 'big'),
+                             ether_types.ETH_TYPE_IP)
+        events.append(FakeEvent(FakeMsg(datapath, src, header + bytes(50))))
+    return events
+
+
+class OldLegacySwitch(LegacySwitch):
+    """Bản sao packet_in_handler cũ của LegacySwitch (Packet đầy đủ + setdefault)."""
+
+    def switch_features_handler(self, ev):
+        super(OldLegacySwitch, self).switch_features_handler(ev)
+        self.mac_to_port.clear()
+
+    def packet_in_handler(self, ev):
+        msg = ev.msg
+        dp = msg.datapath
+        ofp = dp.ofproto
+        parser = dp.ofproto_parser
+        in_port = msg.match['in_port']
+        pkt = packet.Packet(msg.data)
+        eth = pkt.get_protocol(ethernet.ethernet)
+        dst = eth.dst
+        src = eth.src
+        dpid = dp.id
+        self.mac_to_port.setdefault(dpid, {})
+        self.mac_to_port[dpid][src] = in_port
+        if dst in self.mac_to_port[dpid]:
+            out_port = self.mac_to_port[dpid][dst]
+        else:
+            out_port = ofp.OFPP_FLOOD
+        actions = [parser.OFPActionOutput(out_port)]
+        if out_port != ofp.OFPP_FLOOD:
+            match = parser.OFPMatch(in_port=in_port, eth_dst=dst)
+            self.add_flow(dp, 1, match, actions)
+        data = None
+        if msg.buffer_id == ofp.OFP_NO_BUFFER:
+            data = msg.data
+        out = parser.OFPPacketOut(datapath=dp, buffer_id=msg.buffer_id,
+                                  in_port=in_port, actions=actions, data=data)
+        dp.send_msg(out)
+
+
+class OldSmartFirewall(SDNSmartFirewall):
+    """Bản sao packet_in_handler cũ của SDNSmartFirewall."""
+
+    def switch_features_handler(self, ev):
+        super(OldSmartFirewall, self).switch_features_handler(ev)
+        self.mac_to_port.clear()
+
+    def packet_in_handler(self, ev):
+        msg = ev.msg
+        datapath = msg.datapath
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        in_port = msg.match['in_port']
+        pkt = packet.Packet(msg.data)
+        eth = pkt.get_protocol(ethernet.ethernet)
+        if eth.ethertype == ether_types.ETH_TYPE_LLDP:
+            return
+        dst = eth.dst
+        src = eth.src
+        dpid = datapath.id
+        self.mac_to_port.setdefault(dpid, {})
+        self.mac_to_port[dpid][src] = in_port
+        out_port = ofproto.OFPP_FLOOD
+        if dst in self.mac_to_port[dpid]:
+            out_port = self.mac_to_port[dpid][dst]
+        actions = [parser.OFPActionOutput(out_port)]
+        if out_port != ofproto.OFPP_FLOOD:
+            match = parser.OFPMatch(in_port=in_port, eth_dst=dst, eth_src=src)
+            self.add_flow(datapath, 10, match, actions, idle=10)
+        data = None
+        if msg.buffer_id == ofproto.OFP_NO_BUFFER:
+            data = msg.data
+        out = parser.OFPPacketOut(datapath=datapath, buffer_id=msg.buffer_id,
+                                  in_port=in_port, actions=actions, data=data)
+        datapath.send_msg(out)
+
+
+def parse_only(events, fast):
+    """Chỉ đo phần phân tích header + bảng MAC (phần khác nhau giữa 2 cách)."""
+    t0 = time.perf_counter()
+    if fast:
+        table = MacTable(1)
+        for ev in events:
+            eth = parse_eth(ev.msg.data)
+            table.learn(eth[1], ev.msg.match['in_port'])
+            table.get(eth[0])
+    else:
+        mac_to_port = {}
+        for ev in events:
+            eth = packet.Packet(ev.msg.data).get_protocol(ethernet.ethernet)
+            mac_to_port.setdefault(1, {})
+            mac_to_port[1][eth.src] = ev.msg.match['in_port']
+            mac_to_port[1].get(eth.dst)
+    return len(events) / (time.perf_counter() - t0)
+
+
+def full_handler(app, events):
+    datapath = events[0].msg.datapath
+    app.switch_features_handler(FakeEvent(FakeMsg(datapath, 0, b'')))
+    handler = app.packet_in_handler
+    t0 = time.perf_counter()
+    for ev in events:
+        handler(ev)
+    return len(events) / (time.perf_counter() - t0)
+
+
+def report(name, old, new):
+    print(f"{name:<28} old {old:>10.0f} pkt/s | fast {new:>10.0f} pkt/s | x{new / old:.1f}")
+
+
+if __name__ == '__main__':
+    events = make_frames(FakeDatapath(), N_PACKETS)
+    report("header + MAC table", parse_only(events, False), parse_only(events, True))
+    report("LegacySwitch handler", full_handler(OldLegacySwitch(), events),
+           full_handler(LegacySwitch(), events))
+    report("SDNSmartFirewall handler", full_handler(OldSmartFirewall(), events),
+           full_handler(SDNSmartFirewall(), events))
@@ -0,0 +1,83 @@
+# Tên file: bench_prefix_planner.py
+# Vai trò: Benchmark số luật chặn + thời gian cài cho 10k IP tấn công
+# Cách chạy: python bench_prefix_planner.py
+# So sánh 1 luật/IP (cách cũ) với MitigationPlanner (gộp prefix, giới hạn MAX_BLOCK_RULES).
+
+import random
+import time
+
+from ryu.lib.packet import ether_types
+
+from bench_packet_in import FakeDatapath
+from prefix_planner import MitigationPlanner, ipv4_src_field, ip_to_int, int_to_ip
+from smart_firewall import MAX_BLOCK_RULES, MIN_BLOCK_PREFIX, BLOCK_DURATION, BLOCK_PRIORITY
+
+N_ATTACKERS = 10000
+
+
+def spoofed_16(rnd):
+    """IP giả mạo ngẫu nhiên trong một dải /16."""
+    base = ip_to_int('10.1.0.0')
+    return [int_to_ip(base + a) for a in rnd.sample(range(1 << 16), N_ATTACKERS)]
+
+
+def contiguous(rnd):
+    """Dải liên tục (ví dụ một subnet bị chiếm)."""
+    base = ip_to_int('10.2.0.0')
+    return [int_to_ip(base + a) for a in range(N_ATTACKERS)]
+
+
+def botnet(rnd):
+    """Botnet: 40 subnet /24 bị nhiễm dày + rải rác khắp không gian địa chỉ."""
+    ips = set()
+    for _ in range(40):
+        net = rnd.getrandbits(24) << 8
+        for host in rnd.sample(range(256), 200):
+            ips.add(int_to_ip(net | host))
+    while len(ips) < N_ATTACKERS:
+        ips.add(int_to_ip(rnd.getrandbits(32)))
+    return list(ips)
+
+
+def install(datapath, rules):
+    """Dựng + serialize FlowMod (phần việc của send_msg) cho danh sách (net, plen)."""
+    ofproto = datapath.ofproto
+    parser = datapath.ofproto_parser
+    t0 = time.perf_counter()
+    for net, plen in rules:
+        match = parser.OFPMatch(eth_type=ether_types.ETH_TYPE_IP, ipv4_src=ipv4_src_field(net, plen))
+        mod = parser.OFPFlowMod(datapath=datapath, match=match, command=ofproto.OFPFC_ADD,
+                                hard_timeout=BLOCK_DURATION, priority=BLOCK_PRIORITY,
+                                instructions=[])
+        mod.serialize()
+    return time.perf_counter() - t0
+
+
+def run(name, ips):
+    datapath = FakeDatapath()
+    naive = [(ip_to_int(ip), 32) for ip in ips]
+    naive_time = install(datapath, naive)
+
+    planner = MitigationPlanner(MAX_BLOCK_RULES, MIN_BLOCK_PREFIX, BLOCK_DURATION)
+    t0 = time.perf_counter()
+    for ip in ips:
+        planner.block(ip, 0)
+    exact = planner._exact_cover()
+    rules = planner.plan()
+    plan_time = time.perf_counter() - t0
+    install_time = install(datapath, rules)
+    collateral = sum(1 << (32 - plen) for _, plen in rules) - len(ips)
+
+    print(f"{name:<12} | 1 rule/IP: {len(naive):>6} rules {naive_time * 1000:8.1f} ms"
+          f" | exact CIDR: {len(exact):>6} | planned: {len(rules):>4} rules"
+          f" plan {plan_time * 1000:7.1f} ms + install {install_time * 1000:6.1f} ms"
+          f" | collateral {collateral} addr")
+
+
+if __name__ == '__main__':
+    rnd = random.Random(7)
+    print(f"MAX_BLOCK_RULES={MAX_BLOCK_RULES}, MIN_BLOCK_PREFIX=/{MIN_BLOCK_PREFIX}, "
+          f"{N_ATTACKERS} attackers")
+    run("spoofed /16", spoofed_16(rnd))
+    run("contiguous", contiguous(rnd))
+    run("botnet", botnet(rnd))
@@ -0,0 +1,121 @@
+# Tên file: bench_rate_engine.py
+# Vai trò: Benchmark xử lý EventOFPFlowStatsReply với reply tổng hợp 10k/100k flow
+# Cách chạy: python bench_rate_engine.py
+# So sánh vòng lặp dict cũ của _flow_stats_reply_handler với RateEngine (NumPy),
+# và chi phí thêm của baseline EWMA + ngưỡng theo subnet (thresholds.py).
+
+import random
+import time
+
+from rate_engine import RateEngine
+from thresholds import ThresholdTable
+
+THRESHOLD_PPS = 150
+SIZES = [10000, 100000, 400000]
+ROUNDS = 5
+
+
+class FakeStat(object):
+    """Giả lập OFPFlowStats: chỉ cần match, packet_count, byte_count."""
+    __slots__ = ('match', 'packet_count', 'byte_count')
+
+    def __init__(self, match, packet_count, byte_count):
+        self.match = match
+        self.packet_count = packet_count
+        self.byte_count = byte_count
+
+
+def make_reply(n_flows, n_sources, step, seed=1):
+    """Sinh reply: n_flows flow chia cho n_sources IP, bộ đếm tăng theo step."""
+    rnd = random.Random(seed)
+    body = []
+    for i in range(n_flows):
+        src = i % n_sources
+        ip = f"10.{(src >> 16) & 255}.{(src >> 8) & 255}.{src & 255}"
+        # Khoảng 1% nguồn là "kẻ tấn công" với tốc độ cao
+        rate = 2000 if src % 100 == 0 else rnd.randint(0, 50)
+        match = {'eth_type': 0x0800, 'ipv4_src': ip}
+        if i % 10 == 0:
+            # Một phần flow L2 không có ipv4_src (bị bỏ qua)
+            match = {'in_port': 1, 'eth_dst': '00:00:00:00:00:01'}
+        body.append(FakeStat(match, rate * step, rate * step * 1000))
+    return body
+
+
+def legacy_handler(prev_stats, dpid, body, current_time):
+    """Bản sao logic cũ của _flow_stats_reply_handler (không log)."""
+    prev_stats.setdefault(dpid, {})
+    current_traffic = {}
+    for stat in body:
+        if 'ipv4_src' in stat.match:
+            ip_src = stat.match['ipv4_src']
+            if ip_src not in current_traffic:
+                current_traffic[ip_src] = {'pkts': 0, 'bytes': 0}
+            current_traffic[ip_src]['pkts'] += stat.packet_count
+            current_traffic[ip_src]['bytes'] += stat.byte_count
+
+    alerts = []
+    for ip, stats in current_traffic.items():
+        prev = prev_stats[dpid].get(ip)
+        if prev:
+            prev_pkts, prev_bytes, prev_time = prev
+            time_diff = current_time - prev_time
+            if time_diff > 0.1:
+                pps = (stats['pkts'] - prev_pkts) / time_diff
+                if pps > THRESHOLD_PPS:
+                    alerts.append(ip)
+        prev_stats[dpid][ip] = (stats['pkts'], stats['bytes'], current_time)
+    return alerts
+
+
+def engine_handler(engine, dpid, body, current_time):
+    slots, pps, bps = engine.process(dpid, body, current_time)
+    return [ip for ip, _ in engine.over(dpid, slots, pps, THRESHOLD_PPS)]
+
+
+def baseline_handler(engine, table, dpid, body, current_time):
+    slots, pps, bps = engine.process(dpid, body, current_time)
+    scores = engine.score(dpid, slots, pps)
+    flagged = table.flag(engine.addrs(dpid, slots), pps, scores)
+    engine.learn(dpid, slots[~flagged], pps[~flagged])
+    return [ip for ip, _ in engine.select(dpid, slots, pps, flagged)]
+
+
+def run(n_flows):
+    n_sources = n_flows // 4
+    replies = [make_reply(n_flows, n_sources, step) for step in range(ROUNDS + 1)]
+
+    prev_stats = {}
+    engine = RateEngine()
+    scored = RateEngine()
+    table = ThresholdTable((4.0, 50, THRESHOLD_PPS), [('10.0.0.0/24', 6.0, 300, 2000)])
+    legacy_times = []
+    engine_times = []
+    baseline_times = []
+    for step, body in enumerate(replies):
+        now = 1000.0 + step
+        t0 = time.perf_counter()
+        a = legacy_handler(prev_stats, 1, body, now)
+        t1 = time.perf_counter()
+        b = engine_handler(engine, 1, body, now)
+        t2 = time.perf_counter()
+        baseline_handler(scored, table, 1, body, now)
+        t3 = time.perf_counter()
+        if step:
+            assert sorted(a) == sorted(b), "Ket qua khac nhau giua 2 cach tinh"
+            legacy_times.append(t1 - t0)
+            engine_times.append(t2 - t1)
+            baseline_times.append(t3 - t2)
+
+    legacy = min(legacy_times) * 1000
+    fast = min(engine_times) * 1000
+    baseline = min(baseline_times) * 1000
+    per_ip = scored.table(1).memory() / n_sources
+    print(f"{n_flows:>7} flows | {n_sources:>6} IP | legacy {legacy:8.2f} ms"
+          f" | engine {fast:8.2f} ms | x{legacy / fast:.1f} | alerts {len(b)}"
+          f" | + baseline {baseline:8.2f} ms, {per_ip:.0f} B/IP")
+
+
+if __name__ == '__main__':
+    for n in SIZES:
+        run(n)
@@ -0,0 +1,356 @@
+# Tên file: bench_replay.py
+# Vai trò: Bộ benchmark hồi quy cho các app Ryu, chạy offline qua replay_harness.py
+# Cách chạy: python bench_replay.py [-k packet_in] [--json kq.json] [--compare goc.json]
+# Mỗi case bench_* dựng app + trace tổng hợp và trả về ReplayResult (độ trễ p50/p90/p99,
+# message/sự kiện, bộ nhớ). --compare so p50 với một lần chạy trước (CI): chậm hơn quá
+# --tolerance thì thoát với mã 1.
+# Kiểm tra kết quả replay (trace nhỏ hơn): python -m pytest bench_replay.py
+
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+
+from replay_harness import (Replay, EV_CONNECT, EV_PACKET_IN, EV_FLOW_STATS,
+                            synthetic_packet_ins, synthetic_flow_stats)
+from acl_watcher import AclWatcher
+from bench_acl_compiler import make_rules
+
+N_PACKET_IN = 20000
+STATS_ROUNDS = 10
+STATS_FLOWS = 10000
+STATS_SOURCES = 2000
+STATS_ATTACKERS = 20
+ACL_RULES = 10000
+ACL_SWITCHES = 16
+
+
+def connects(*dpids):
+    return [{'type': EV_CONNECT, 'dpid': dpid} for dpid in dpids]
+
+
+def bench_packet_in_legacy(n=N_PACKET_IN):
+    from legacy_switch import LegacySwitch
+    replay = Replay(LegacySwitch())
+    replay.run(connects(1))
+    return replay.run(synthetic_packet_ins(n), 'packet_in_legacy')
+
+
+def bench_packet_in_smart(n=N_PACKET_IN):
+    from smart_firewall import SDNSmartFirewall
+    replay = Replay(SDNSmartFirewall())
+    replay.run(connects(1))
+    return replay.run(synthetic_packet_ins(n), 'packet_in_smart')
+
+
+def bench_flow_stats_smart(attackers=STATS_ATTACKERS, flows=STATS_FLOWS, sources=STATS_SOURCES,
+                           attack_pps=2000, name='flow_stats_smart'):
+    from smart_firewall import SDNSmartFirewall
+    app = SDNSmartFirewall()
+    replay = Replay(app)
+    replay.run(connects(1))
+    trace = synthetic_flow_stats(STATS_ROUNDS, flows, sources,
+                                 attackers=attackers, attack_from=STATS_ROUNDS // 2,
+                                 attack_pps=attack_pps)
+    result = replay.run(trace, name)
+    result.extra['blocked'] = len(app.blocked_ips)
+    return result
+
+
+def bench_acl_install_static(rules=ACL_RULES, switches=ACL_SWITCHES):
+    from static_firewall import StaticFirewall, ACLRULE_PRIORITY
+    app = StaticFirewall()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'rules.json')
+        with open(path, 'w') as f:
+            json.dump(make_rules(rules), f)
+        app.acl = AclWatcher(path, ACLRULE_PRIORITY, app.logger)
+        app.acl.load()
+        app.acl_rules = app.acl.raw_rules
+    replay = Replay(app)
+    result = replay.run(connects(*range(1, switches + 1)), 'acl_install_static')
+    # FlowMod ít nhất một switch nhận được (ACL + ARP + luật mặc định)
+    result.extra.update(acl_flows=len(app.acl.flows),
+                        switch_flowmods=min(dp.counts.get('OFPFlowMod', 0)
+                                            for dp in replay.datapaths.values()))
+    return result
+
+
+CASES = [bench_packet_in_legacy, bench_packet_in_smart, bench_flow_stats_smart,
+         bench_acl_install_static]
+
+
+def compare(results, baseline, tolerance):
+    """Danh sách (case, loại, p50 cũ, p50 mới) chậm hơn baseline quá tolerance."""
+    old = {item['name']: item for item in baseline}
+    slower = []
+    for item in results:
+        base = old.get(item['name'])
+        if base is None:
+            continue
+        for kind, summary in item['events'].items():
+            before = base['events'].get(kind)
+            if before and summary['p50_us'] > before['p50_us'] * (1 + tolerance):
+                slower.append((item['name'], kind, before['p50_us'], summary['p50_us']))
+    return slower
+
+
+# ---------------------------------------------------------------------------
+# Kiểm tra kết quả (pytest): cùng các case trên, trace nhỏ hơn, chạy trong thư mục tạm
+# ---------------------------------------------------------------------------
+
+def _isolated(monkeypatch, tmp_path):
+    # state/ (snapshot, cache ACL) và file số liệu không ghi vào cây mã nguồn
+    monkeypatch.chdir(tmp_path)
+    logging.disable(logging.WARNING)
+
+
+def test_packet_in_messages_per_event(monkeypatch, tmp_path):
+    _isolated(monkeypatch, tmp_path)
+    for case in (bench_packet_in_legacy, bench_packet_in_smart):
+        summary = case(2000).summary(EV_PACKET_IN)
+        # Packet-Out + flow reactive gửi ngay (không Barrier, không chờ lô)
+        assert summary['events'] == 2000
+        assert 1.8 <= summary['msgs_per_event'] <= 2.1, (case.__name__, summary)
+
+
+def test_flow_stats_blocks_attackers(monkeypatch, tmp_path):
+    _isolated(monkeypatch, tmp_path)
+    result = bench_flow_stats_smart(attackers=5, flows=2000, sources=400)
+    assert result.extra['blocked'] == 5
+
+
+def test_flow_stats_benign_trace_blocks_nothing(monkeypatch, tmp_path):
+    _isolated(monkeypatch, tmp_path)
+    result = bench_flow_stats_smart(attackers=0, flows=2000, sources=400)
+    assert result.extra['blocked'] == 0
+
+
+def test_flow_stats_low_baseline_burst_not_blocked(monkeypatch, tmp_path):
+    _isolated(monkeypatch, tmp_path)
+    # Host quen gửi 1..10 pps tăng lên 90 pps: z-score rất cao nhưng vẫn dưới
+    # MIN_ANOMALY_PPS, không được chặn
+    result = bench_flow_stats_smart(attackers=5, flows=400, sources=400, attack_pps=90)
+    assert result.extra['blocked'] == 0
+
+
+def test_flow_stats_anomaly_below_threshold_blocked(monkeypatch, tmp_path):
+    _isolated(monkeypatch, tmp_path)
+    # 130 pps < THRESHOLD_PPS nhưng lệch hẳn khỏi baseline 1..10 pps: z-score chặn
+    result = bench_flow_stats_smart(attackers=5, flows=400, sources=400, attack_pps=130)
+    assert result.extra['blocked'] == 5
+
+
+def _victim_trace(server, clients, client_pps, attackers, attack_pps, period=2.0):
+    """Client quen gửi đều tới server; từ nửa sau có thêm các nguồn mới dồn vào."""
+    counters = {}
+    records = []
+    for step in range(STATS_ROUNDS):
+        senders = [(f"10.2.0.{i + 1}", client_pps) for i in range(clients)]
+        if step >= STATS_ROUNDS // 2:
+            senders += [(f"10.3.0.{i + 1}", attack_pps) for i in range(attackers)]
+        body = []
+        for src, rate in senders:
+            packets = counters[src] = counters.get(src, 0) + rate * period
+            match = {'eth_type': 0x0800, 'ipv4_src': src, 'ipv4_dst': server}
+            body.append([match, packets, packets * 800, period * (step + 1)])
+        records.append({'t': step * period, 'type': EV_FLOW_STATS, 'dpid': 1,
+                        'more': False, 'flows': body})
+    return records
+
+
+def test_victim_blocks_new_sources_not_regular_clients(monkeypatch, tmp_path):
+    import smart_firewall
+    _isolated(monkeypatch, tmp_path)
+    # Server đông: 20 client quen (80 pps, trên VICTIM_SOURCE_PPS) + 10 nguồn mới 60 pps.
+    # Server khai báo trần riêng như h64 trong SOURCE_THRESHOLDS; tầng sketch (ngưỡng cố
+    # định DEST_THRESHOLD_PPS) tắt để chỉ xét nhánh nạn nhân
+    default, _ = smart_firewall.ANALYSIS_SETTINGS['victim_thresholds']
+    monkeypatch.setitem(smart_firewall.ANALYSIS_SETTINGS, 'victim_thresholds',
+                        (default, [('10.0.0.80/32', default[0], default[1], 5000)]))
+    monkeypatch.setitem(smart_firewall.ANALYSIS_SETTINGS, 'sketch', False)
+    app = smart_firewall.SDNSmartFirewall()
+    replay = Replay(app)
+    replay.run(connects(1))
+    replay.run(_victim_trace('10.0.0.80', clients=20, client_pps=80,
+                             attackers=10, attack_pps=60))
+    assert set(app.blocked_ips) == {f"10.3.0.{i + 1}" for i in range(10)}
+
+
+def test_flow_stats_64bit_dpid(monkeypatch, tmp_path):
+    from smart_firewall import SDNSmartFirewall
+    from metrics_store import MetricsReader, METRIC_PPS, METRIC_STATE_BYTES
+    _isolated(monkeypatch, tmp_path)
+    # dpid của OVS thật dùng đủ 64 bit: số liệu theo switch phải ghi và đọc lại được
+    dpid = 0x0000aabbccddeeff
+    app = SDNSmartFirewall()
+    replay = Replay(app)
+    replay.run(connects(dpid))
+    trace = synthetic_flow_stats(STATS_ROUNDS, 400, 400, attackers=3,
+                                 attack_from=STATS_ROUNDS // 2)
+    for record in trace:
+        record['dpid'] = dpid
+    replay.run(trace)
+    app._report_state()
+    app.metrics.close()
+    assert len(app.blocked_ips) == 3
+    records = MetricsReader('smart').last(float('inf'))
+    for metric in (METRIC_PPS, METRIC_STATE_BYTES):
+        keys = set(records['key'][records['metric'] == metric].tolist())
+        assert keys == {dpid}, (metric, keys)
+
+
+def _flow_log(dp):
+    """Ghi lại (command, ipv4_src) của mọi FlowMod gửi tới dp."""
+    log = []
+    send = dp.send_msg
+
+    def record(msg):
+        if msg.__class__.__name__ == 'OFPFlowMod':
+            log.append((msg.command, msg.match.get('ipv4_src')))
+        send(msg)
+    dp.send_msg = record
+    return log
+
+
+def test_block_coalesce_adds_before_deleting(monkeypatch, tmp_path):
+    from smart_firewall import SDNSmartFirewall
+    _isolated(monkeypatch, tmp_path)
+    app = SDNSmartFirewall()
+    replay = Replay(app)
+    replay.run(connects(1))
+    app.api_block(['10.5.0.0'])
+    replay.answer_barriers()
+    log = _flow_log(replay.datapaths[1])
+    ofp = replay.datapaths[1].ofproto
+    # Hai /32 kề nhau -> một /31: luật /31 phải có trước khi /32 cũ bị xoá
+    app.api_block(['10.5.0.1'])
+    assert log == [(ofp.OFPFC_ADD, ('10.5.0.0', '255.255.255.254'))]
+    replay.answer_barriers()
+    assert log[1:] == [(ofp.OFPFC_DELETE_STRICT, '10.5.0.0')]
+
+
+def test_block_moves_to_edge_before_leaving_fallback(monkeypatch, tmp_path):
+    from smart_firewall import SDNSmartFirewall
+    _isolated(monkeypatch, tmp_path)
+    app = SDNSmartFirewall()
+    replay = Replay(app)
+    replay.run(connects(1, 2))
+    # Chưa định vị được: chặn tạm ở switch 2 (switch phát hiện)
+    app._apply_mitigation(None, '10.6.0.9', fallback=[2])
+    app._flush_mitigation()
+    replay.answer_barriers()
+    edge, fallback = _flow_log(replay.datapaths[1]), _flow_log(replay.datapaths[2])
+    ofp = replay.datapaths[1].ofproto
+    # Nguồn xuất hiện ở cổng 7 của switch 1 -> luật chuyển về switch biên
+    mac = 0x020000060009
+    app.locator.learn(0x0a060009, mac)
+    app.mac_to_port[1].learn(mac, 7)
+    app._apply_mitigation(None, '10.6.0.9')
+    app._flush_mitigation()
+    assert edge == [(ofp.OFPFC_ADD, '10.6.0.9')] and fallback == []
+    replay.answer_barriers()
+    assert fallback == [(ofp.OFPFC_DELETE_STRICT, '10.6.0.9')]
+    assert app.mitigation.placement['10.6.0.9'] == {1}
+
+
+def test_acl_install_flow_counts(monkeypatch, tmp_path):
+    from acl_compiler import compile_rules
+    from static_firewall import ACLRULE_PRIORITY
+    _isolated(monkeypatch, tmp_path)
+    expected = len(compile_rules(make_rules(1000), ACLRULE_PRIORITY).flows)
+    result = bench_acl_install_static(1000, 3)
+    assert result.summary(EV_CONNECT)['events'] == 3
+    assert result.extra['acl_flows'] == expected
+    # Mỗi switch nhận đủ flow ACL đã biên dịch + ARP + luật mặc định
+    assert result.extra['switch_flowmods'] == expected + 2
+
+
+def test_snapshot_keeps_blocks_without_placement(monkeypatch, tmp_path):
+    from snapshot_store import StateSnapshots, SEC_BLOCKS, block_records
+    _isolated(monkeypatch, tmp_path)
+    syncs = []
+    monkeypatch.setattr(os, 'fsync', syncs.append)
+    now = 1000.0
+    snapshots = StateSnapshots('smart', logging.getLogger('test'))
+    snapshots.open()
+    # IP bị chặn chưa có switch đặt luật vẫn phải qua được checkpoint (WAL đã bị cắt)
+    blocked = {'10.7.0.1': now + 60, '10.7.0.2': now + 60}
+    sections = [(SEC_BLOCKS, 0, block_records(blocked, {'10.7.0.1': {3}}))]
+    snapshots.checkpoint(sections, now, sync=False)
+    assert not syncs    # Checkpoint định kỳ không fsync
+    snapshots.wal.block(0x0a070003, set(), now + 60)
+    snapshots.close()
+    restored = StateSnapshots('smart', logging.getLogger('test'))
+    restored.open()
+    assert restored.blocks(now) == {0x0a070001: (now + 60, {3}),
+                                    0x0a070002: (now + 60, set()),
+                                    0x0a070003: (now + 60, set())}
+    restored.checkpoint(sections, now + 1)
+    assert len(syncs) == 1
+    restored.close()
+
+
+def test_management_api_rejects_bad_bodies(monkeypatch, tmp_path):
+    from webob import Request
+    from management_api import ManagementController, APP_KEY
+    _isolated(monkeypatch, tmp_path)
+    calls = []
+
+    class App(object):
+        acl_rules = []
+
+        def api_update_rules(self, rules):
+            calls.append(rules)
+            return {'rules': len(rules)}
+
+        def api_block(self, ips, duration=None):
+            calls.append(ips)
+            return {'blocked': len(ips)}
+
+    def post(handler, body):
+        req = Request.blank('/firewall', method='POST', body=json.dumps(body).encode(),
+                            remote_addr='127.0.0.1')
+        return getattr(ManagementController(req, None, {APP_KEY: App()}), handler)(req)
+
+    assert post('add_rules', {'rules': [{'id': 1}, {'id': 2}, {'id': 1}]}).status_int == 400
+    assert post('add_blocks', {'ips': ['10.0.0.1'], 'duration': True}).status_int == 400
+    assert not calls
+    assert post('add_rules', {'rules': [{'id': 1}, {'id': 2}]}).status_int == 200
+    assert post('add_blocks', {'ips': ['10.0.0.1'], 'duration': 30}).status_int == 200
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay benchmarks (no Mininet needed)')
+    parser.add_argument('-k', dest='pattern', default='', help='chỉ chạy case có tên chứa chuỗi này')
+    parser.add_argument('--json', help='ghi kết quả ra file JSON')
+    parser.add_argument('--compare', help='file JSON của lần chạy trước để so sánh')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    # Log cảnh báo của app (ALERT, BLOCKING...) không phải thứ đang đo
+    logging.disable(logging.WARNING)
+    results = []
+    for case in CASES:
+        if args.pattern not in case.__name__:
+            continue
+        result = case()
+        print(result.report())
+        results.append(result.as_dict())
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            slower = compare(results, json.load(f), args.tolerance)
+        for name, kind, before, after in slower:
+            print(f"[REGRESSION] {name}/{kind}: p50 {before:.1f} -> {after:.1f} us")
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+# Tên file: bench_restart.py
+# Vai trò: Đo chi phí khởi động lại controller khi switch vẫn giữ flow (replay_harness.py)
+# Cách chạy: python bench_restart.py [số luật ACL] [số IP bị chặn] [số MAC mỗi switch]
+# So lần kết nối đầu (bảng flow trống) với app mới kết nối lại vào đúng các SimDatapath
+# cũ: số FlowMod phải gửi, thời gian tới khi luật xong, trạng thái khôi phục từ snapshot.
+
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+from replay_harness import Replay, SimDatapath
+from bench_acl_compiler import make_rules
+
+SWITCHES = 4
+
+
+def connect_all(replay, datapaths):
+    """Kết nối (lại) các switch đã có; trả về (giây, FlowMod đã gửi)."""
+    sent = sum(dp.counts.get('OFPFlowMod', 0) for dp in datapaths)
+    start = time.perf_counter()
+    for dp in datapaths:
+        replay.datapaths[dp.id] = dp
+        replay.connect(dp.id)
+        replay.answer_barriers()
+    return (time.perf_counter() - start,
+            sum(dp.counts.get('OFPFlowMod', 0) for dp in datapaths) - sent)
+
+
+def bench_static(tmp, rules):
+    import static_firewall
+    path = os.path.join(tmp, 'rules.json')
+    with open(path, 'w') as f:
+        json.dump(make_rules(rules), f)
+    static_firewall.SNAPSHOT_DIR = os.path.join(tmp, 'state')
+    datapaths = [SimDatapath(dpid) for dpid in range(1, SWITCHES + 1)]
+    for name in ('cold', 'restart'):
+        app = static_firewall.StaticFirewall()
+        start = time.perf_counter()
+        app.acl.path = path
+        app.acl.load()
+        app.acl_rules = app.acl.raw_rules
+        load = time.perf_counter() - start
+        seconds, mods = connect_all(Replay(app), datapaths)
+        print(f"StaticFirewall {name:8s}: load {load * 1000:7.1f} ms | connect {SWITCHES} "
+              f"switch(es) {seconds * 1000:8.1f} ms | {mods:6d} FlowMod(s) | "
+              f"{len(datapaths[0].index)} flows on switch 1")
+
+
+def bench_smart(tmp, blocked, macs):
+    import smart_firewall
+    smart_firewall.SNAPSHOT_DIR = os.path.join(tmp, 'state')
+    datapaths = [SimDatapath(dpid) for dpid in range(1, SWITCHES + 1)]
+
+    app = smart_firewall.SDNSmartFirewall()
+    replay = Replay(app)
+    seconds, mods = connect_all(replay, datapaths)
+    for dpid, table in app.mac_to_port.items():
+        for mac in range(1, macs + 1):
+            table.learn((dpid << 32) | mac, mac % 48 + 1)
+    ips = [f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in range(1, blocked + 1)]
+    # Phần lớn vào checkpoint, phần còn lại chỉ nằm trong WAL
+    split = blocked * 9 // 10
+    start = time.perf_counter()
+    app.api_block(ips[:split])
+    replay.answer_barriers()
+    block_time = time.perf_counter() - start
+    block_mods = sum(dp.counts.get('OFPFlowMod', 0) for dp in datapaths) - mods
+    start = time.perf_counter()
+    app._checkpoint(time.time())
+    checkpoint_time = time.perf_counter() - start
+    app.api_block(ips[split:])
+    replay.answer_barriers()
+    app.snapshots.wal.flush()
+    print(f"SDNSmartFirewall first run: {len(app.blocked_ips)} IP(s) blocked with "
+          f"{block_mods} FlowMod(s) in {block_time * 1000:.1f} ms | checkpoint "
+          f"{app.snapshots.written / 1024:.0f} KB in {checkpoint_time * 1000:.1f} ms")
+    app.snapshots.close()
+
+    start = time.perf_counter()
+    restarted = smart_firewall.SDNSmartFirewall()
+    restore_time = time.perf_counter() - start
+    seconds, mods = connect_all(Replay(restarted), datapaths)
+    print(f"SDNSmartFirewall restart  : init {restore_time * 1000:.1f} ms, "
+          f"{len(restarted.blocked_ips)} IP(s) blocked | reconnect {SWITCHES} switch(es) "
+          f"{seconds * 1000:.1f} ms | {mods} FlowMod(s) | "
+          f"{len(restarted.mac_to_port[1])} MAC(s) on switch 1")
+    restarted.snapshots.close()
+
+
+def main():
+    rules = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    blocked = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    macs = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+    logging.disable(logging.WARNING)
+    with tempfile.TemporaryDirectory() as tmp:
+        bench_static(tmp, rules)
+        bench_smart(tmp, blocked, macs)
+
+
+if __name__ == '__main__':
+    main()
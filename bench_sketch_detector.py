@@ -0,0 +1,95 @@
+# Tên file: bench_sketch_detector.py
+# Vai trò: Benchmark offline tầng sketch (độ chính xác + thông lượng + bộ nhớ)
+# Cách chạy: python bench_sketch_detector.py
+# So sánh với ngưỡng cố định THRESHOLD_PPS theo từng IP nguồn (bộ nhớ theo số nguồn).
+
+import sys
+import time
+
+import numpy as np
+
+from prefix_planner import ip_to_int
+from sketch_detector import SketchDetector, ALERT_DISTRIBUTED
+from smart_firewall import THRESHOLD_PPS, DEST_THRESHOLD_PPS, PAIR_MIN_PPS
+
+N_BACKGROUND = 20000      # Nguồn bình thường mỗi epoch
+N_SERVERS = 200
+EPOCHS = 20
+ATTACK_START = 8
+VICTIM = ip_to_int('10.0.0.64')
+
+
+def background(rnd):
+    srcs = rnd.randint(ip_to_int('10.16.0.0'), ip_to_int('10.31.255.255'), N_BACKGROUND)
+    dsts = ip_to_int('10.0.1.0') + rnd.randint(0, N_SERVERS, N_BACKGROUND)
+    return srcs, dsts, rnd.exponential(1.0, N_BACKGROUND)
+
+
+def single(rnd):
+    return [ip_to_int('10.9.9.9')], [ip_to_int('10.0.0.1')], [400.0]
+
+
+def final_topo(rnd):
+    """9 attacker h2..h10 của FinalTopo, mỗi máy dưới THRESHOLD_PPS."""
+    srcs = [ip_to_int(f'10.0.0.{i}') for i in range(2, 11)]
+    return srcs, [VICTIM] * len(srcs), list(rnd.uniform(60, 90, len(srcs)))
+
+
+def spoofed(rnd):
+    """3000 IP giả mạo, mỗi IP ~5 pps -> không IP nào đáng chặn, chỉ đích bất thường."""
+    srcs = rnd.randint(ip_to_int('172.16.0.0'), ip_to_int('172.31.255.255'), 3000)
+    return list(srcs), [VICTIM] * len(srcs), list(rnd.uniform(4, 6, len(srcs)))
+
+
+def run(name, attack, blockable):
+    rnd = np.random.RandomState(11)
+    detector = SketchDetector(THRESHOLD_PPS, DEST_THRESHOLD_PPS, PAIR_MIN_PPS)
+    exact = {}
+    flagged = set()
+    victim_epoch = None
+    records = 0
+    elapsed = 0.0
+    truth = set()
+    for epoch in range(EPOCHS):
+        srcs, dsts, rates = background(rnd)
+        if epoch >= ATTACK_START:
+            a_src, a_dst, a_rate = attack(rnd)
+            truth.update(a_src)
+            srcs = np.concatenate((srcs, np.asarray(a_src, dtype=np.int64)))
+            dsts = np.concatenate((dsts, np.asarray(a_dst, dtype=np.int64)))
+            rates = np.concatenate((rates, np.asarray(a_rate)))
+        records += len(srcs)
+        src_list, dst_list, rate_list = srcs.tolist(), dsts.tolist(), rates.tolist()
+
+        t0 = time.perf_counter()
+        detector.add(src_list, dst_list, rate_list)
+        alerts = detector.end_epoch(now=epoch * 2.0)
+        elapsed += time.perf_counter() - t0
+
+        # Cách cũ: bộ đếm chính xác theo từng IP nguồn + ngưỡng cố định
+        for src, rate in zip(src_list, rate_list):
+            exact[src] = rate
+        for alert in alerts:
+            if alert.kind == ALERT_DISTRIBUTED and alert.dst == VICTIM and victim_epoch is None:
+                victim_epoch = epoch
+            flagged.update(src for src, _ in alert.sources)
+
+    exact_flagged = {src for src, rate in exact.items() if rate > THRESHOLD_PPS}
+    hits = len(flagged & truth) if blockable else 0
+    precision = hits / len(flagged) if flagged else 1.0
+    recall = hits / len(truth) if blockable else float('nan')
+    old_recall = len(exact_flagged & truth) / len(truth) if blockable else float('nan')
+    lag = '-' if victim_epoch is None else f"+{victim_epoch - ATTACK_START}"
+    exact_bytes = sys.getsizeof(exact) + len(exact) * 2 * 28
+    print(f"{name:<11} | sketch: recall {recall:5.2f} precision {precision:5.2f} "
+          f"victim {lag:>3} | threshold: recall {old_recall:5.2f} | "
+          f"{records / elapsed / 1e6:5.2f} M rec/s | "
+          f"{detector.memory() / 1024:6.0f} KB vs exact {exact_bytes / 1024:6.0f} KB")
+
+
+if __name__ == '__main__':
+    print(f"{EPOCHS} epochs x {N_BACKGROUND} background flows, attack from epoch {ATTACK_START} "
+          f"(THRESHOLD_PPS={THRESHOLD_PPS}, DEST_THRESHOLD_PPS={DEST_THRESHOLD_PPS})")
+    run("single", single, True)
+    run("final_topo", final_topo, True)
+    run("spoofed", spoofed, False)
@@ -0,0 +1,233 @@
+# Tên file: flow_capacity.py
+# Vai trò: Kế toán số flow trên từng switch theo loại luật + ngân sách và chính sách loại bỏ
+# Mục đích: Không app nào biết switch đang giữ bao nhiêu flow: khi bị flood nguồn giả mạo,
+#           packet_in_handler cứ cài flow chuyển mạch, _apply_mitigation cứ thêm luật chặn,
+#           tới khi bảng đầy và FlowMod bị từ chối (TABLE_FULL) mà không ai để ý. Ở đây:
+#             - Số flow theo loại (nhận ra qua cookie) được đếm từ chính các FlowMod gửi
+#               đi (observer của FlowProgrammer), EventOFPFlowRemoved và hạn timeout, rồi
+#               được neo lại theo số thật của switch bằng Table Stats định kỳ.
+#             - Gần đầy: flow chuyển mạch reactive bị xoá trước (LRU theo lần cài / cài
+#               lại gần nhất); luật chặn không bao giờ bị xoá mà được gộp thành prefix
+#               thô hơn, flow chuyển mạch mới chỉ khớp eth_dst (một flow mỗi đích).
+
+import time
+from collections import OrderedDict
+
+from flow_reconciler import match_key, COOKIE_BLOCK, COOKIE_FORWARD, COOKIE_L2, COOKIE_ACL
+from state_store import TimerWheel, container_bytes
+
+TABLE_CAPACITY = 4096      # Số flow tối đa mặc định mỗi switch (Table Stats OF 1.3 không báo)
+DEGRADE_AT = 0.75          # Tỉ lệ đầy -> chuyển sang luật thô hơn ...
+RECOVER_AT = 0.6           # ... và chỉ trở lại luật chi tiết khi xuống dưới mức này
+EVICT_AT = 0.9             # Tỉ lệ đầy (hoặc vượt ngân sách) -> xoá flow chuyển mạch cũ nhất ...
+EVICT_TO = 0.8             # ... cho tới tỉ lệ này của dung lượng / ngân sách
+DEGRADED_BLOCK_SHARE = 4   # Khi suy giảm: ngân sách luật chặn chia cho hệ số này
+MIN_BLOCK_RULES = 16
+
+CLASS_BASE = 'base'        # Table-miss, ARP, chặn cổng Packet-In... (flow không có cookie)
+CLASS_FORWARD = 'forward'  # Chuyển mạch reactive từ Packet-In: loại bỏ được
+CLASS_L2 = 'l2'            # Pipeline proactive (l2_pipeline.py), đã giới hạn theo bảng MAC
+CLASS_BLOCK = 'block'      # Luật chặn IP nguồn: được bảo vệ, chỉ gộp prefix
+CLASS_ACL = 'acl'          # ACL đã biên dịch (StaticFirewall*)
+
+COOKIE_CLASSES = {
+    COOKIE_FORWARD: CLASS_FORWARD,
+    COOKIE_L2: CLASS_L2,
+    COOKIE_BLOCK: CLASS_BLOCK,
+    COOKIE_ACL: CLASS_ACL,
+}
+EVICTABLE = frozenset([CLASS_FORWARD])
+
+
+def flow_key(table_id, priority, match):
+    return (table_id, match_key(priority, match))
+
+
+class SwitchFlows(object):
+    """
+    Flow của một switch.
+    - flows {key: (loại, hạn ước lượng hoặc 0)}, key = (table_id, (priority, match)).
+    - lru: key các flow loại bỏ được, cũ -> mới (key đủ để dựng lại match khi xoá).
+    - drift = số switch báo (Table Stats) - số đang đếm: flow của lần chạy trước,
+      FlowRemoved bị mất, flow idle còn sống quá hạn ước lượng...
+    """
+
+    def __init__(self, dpid, capacity, budgets):
+        self.dpid = dpid
+        self.capacity = capacity
+        self.budgets = budgets
+        self.flows = {}
+        self.counts = {}           # {loại: số flow}
+        self.lru = OrderedDict()
+        self.wheel = TimerWheel()  # Hạn của flow không báo FlowRemoved
+        self.drift = 0
+        self.active = None         # Số flow trong Table Stats gần nhất
+        self.partial = 0           # Cộng dồn reply Table Stats nhiều phần
+        self.degraded = False
+        self.evicted = 0
+        self.full_errors = 0
+
+    def total(self):
+        return max(len(self.flows) + self.drift, 0)
+
+    def count(self, cls):
+        return self.counts.get(cls, 0)
+
+    def budget(self, cls):
+        return self.budgets.get(cls, self.capacity)
+
+    def _count(self, cls, delta):
+        self.counts[cls] = self.counts.get(cls, 0) + delta
+
+    def add(self, key, cls, expires=0):
+        old = self.flows.get(key)
+        if old is None:
+            self._count(cls, 1)
+        elif old[0] != cls:
+            self._count(old[0], -1)
+            self._count(cls, 1)
+        self.flows[key] = (cls, expires)
+        if expires:
+            self.wheel.schedule(key, expires)
+        if cls in EVICTABLE:
+            # Cài lại (Packet-In mới cho cùng flow) = vừa được dùng
+            self.lru[key] = None
+            self.lru.move_to_end(key)
+        elif old is not None:
+            self.lru.pop(key, None)
+
+    def discard(self, key):
+        entry = self.flows.pop(key, None)
+        if entry is None:
+            return False
+        self._count(entry[0], -1)
+        self.lru.pop(key, None)
+        return True
+
+    def expire(self, now):
+        for key in self.wheel.advance(now):
+            entry = self.flows.get(key)
+            if entry is not None and entry[1] and entry[1] <= now:
+                self.discard(key)
+
+    def table_stats(self, body, last=True):
+        """Reply Table Stats (có thể nhiều phần) -> neo số đếm theo số thật của switch."""
+        self.partial += sum(stat.active_count for stat in body)
+        if not last:
+            return None
+        self.active, self.partial = self.partial, 0
+        self.drift = self.active - len(self.flows)
+        return self.active
+
+    def table_full(self):
+        """Switch từ chối FlowMod vì bảng đầy: dung lượng thật không lớn hơn số flow hiện có."""
+        self.full_errors += 1
+        total = self.total()
+        if 0 < total < self.capacity:
+            self.capacity = total
+        self.degraded = True
+
+    def update(self):
+        """Trạng thái suy giảm có trễ: vào ở DEGRADE_AT, ra khi xuống dưới RECOVER_AT."""
+        fill = self.total() / self.capacity
+        self.degraded = fill >= (RECOVER_AT if self.degraded else DEGRADE_AT)
+        return self.degraded
+
+    def coarse_forwarding(self):
+        """Flow chuyển mạch mới chỉ khớp eth_dst (bảng gần đầy hoặc hết ngân sách)."""
+        return self.degraded or self.count(CLASS_FORWARD) >= self.budget(CLASS_FORWARD)
+
+    def block_budget(self):
+        budget = self.budget(CLASS_BLOCK)
+        if self.degraded:
+            budget = max(budget // DEGRADED_BLOCK_SHARE, MIN_BLOCK_RULES)
+        return budget
+
+    def pressure(self):
+        return (self.total() >= self.capacity * EVICT_AT
+                or self.count(CLASS_FORWARD) > self.budget(CLASS_FORWARD))
+
+    def evict(self):
+        """[(table_id, priority, {trường match})] cần DELETE_STRICT, cũ nhất trước."""
+        if not self.pressure():
+            return []
+        total_goal = self.capacity * EVICT_TO
+        forward_goal = self.budget(CLASS_FORWARD) * EVICT_TO
+        victims = []
+        while self.lru and (self.total() > total_goal
+                            or self.count(CLASS_FORWARD) > forward_goal):
+            key, _ = self.lru.popitem(last=False)
+            self.discard(key)
+            table_id, (priority, fields) = key
+            victims.append((table_id, priority, dict(fields)))
+        self.evicted += len(victims)
+        return victims
+
+    def memory(self):
+        return container_bytes(self.flows, self.counts, self.lru) + self.wheel.memory()
+
+
+class FlowCapacity(object):
+    """
+    SwitchFlows của mọi switch. App nối:
+    - observe() làm FlowProgrammer.observer (mọi FlowMod đi qua FlowProgrammer),
+    - removed(msg) từ EventOFPFlowRemoved, adopt() với flow đối chiếu lúc kết nối,
+    - switch(dpid).table_stats() từ EventOFPTableStatsReply, table_full() từ ErrorMsg.
+    Chỉ ADD / DELETE_STRICT được đếm; DELETE không strict do Table Stats bù lại.
+    """
+
+    def __init__(self, capacity=TABLE_CAPACITY, budgets=None):
+        self.capacity = capacity
+        self.budgets = dict(budgets or {})
+        self.switches = {}
+
+    def switch(self, dpid):
+        flows = self.switches.get(dpid)
+        if flows is None:
+            flows = self.switches[dpid] = SwitchFlows(dpid, self.capacity, self.budgets)
+        return flows
+
+    def observe(self, datapath, msg, now=None):
+        if msg.__class__ is not datapath.ofproto_parser.OFPFlowMod:
+            return
+        ofproto = datapath.ofproto
+        flows = self.switch(datapath.id)
+        key = flow_key(msg.table_id, msg.priority, msg.match)
+        if msg.command == ofproto.OFPFC_ADD:
+            timeout = msg.hard_timeout or msg.idle_timeout
+            expires = 0
+            # Flow có SEND_FLOW_REM được bỏ khi FlowRemoved tới; còn lại ước theo timeout
+            if timeout and not msg.flags & ofproto.OFPFF_SEND_FLOW_REM:
+                expires = (time.time() if now is None else now) + timeout
+            flows.add(key, COOKIE_CLASSES.get(msg.cookie, CLASS_BASE), expires)
+        elif msg.command == ofproto.OFPFC_DELETE_STRICT:
+            flows.discard(key)
+
+    def removed(self, msg):
+        flows = self.switches.get(msg.datapath.id)
+        if flows is None:
+            return False
+        return flows.discard(flow_key(msg.table_id, msg.priority, msg.match))
+
+    def adopt(self, dpid, stats, now=None):
+        """Flow đã có trên switch (reply đối chiếu): đếm theo cookie, hạn theo hard timeout."""
+        if now is None:
+            now = time.time()
+        flows = self.switch(dpid)
+        for stat in stats:
+            expires = now + max(stat.hard_timeout - stat.duration_sec, 0) if stat.hard_timeout else 0
+            flows.add(flow_key(stat.table_id, stat.priority, stat.match),
+                      COOKIE_CLASSES.get(stat.cookie, CLASS_BASE), expires)
+        return len(stats)
+
+    def expire(self, now=None):
+        if now is None:
+            now = time.time()
+        for flows in self.switches.values():
+            flows.expire(now)
+
+    def remove(self, dpid):
+        self.switches.pop(dpid, None)
+
+    def memory(self):
+        return sum(flows.memory() for flows in self.switches.values())
@@ -0,0 +1,150 @@
+# Tên file: flow_programmer.py
+# Vai trò: Lớp cài đặt luồng dùng chung cho mọi app (gom FlowMod theo lô + Barrier)
+# Mục đích: add_flow cũ gửi từng OFPFlowMod và không bao giờ biết luật đã thật sự
+#           có hiệu lực chưa. Ở đây FlowMod được xếp hàng theo switch, gửi theo lô,
+#           mỗi lô kết thúc bằng OFPBarrierRequest; BarrierReply = mọi luật trong lô
+#           đã được switch xử lý (lỗi nếu có đến từ EventOFPErrorMsg trước đó).
+
+import time
+from ryu.lib import hub
+
+BATCH_SIZE = 64          # Số FlowMod tối đa mỗi lô (đầy thì gửi ngay)
+FLUSH_INTERVAL = 0.05    # Chu kỳ gửi các lô chưa đầy (Giây)
+
+
+class FlowBatch(object):
+    """Một lô FlowMod đã gửi, chờ BarrierReply."""
+    __slots__ = ('dpid', 'size', 'sent_at', 'done_at', 'errors', 'callbacks', 'xids')
+
+    def __init__(self, dpid, size, callbacks, now):
+        self.dpid = dpid
+        self.size = size
+        self.sent_at = now
+        self.done_at = None
+        self.errors = []          # [(type, code)] từ EventOFPErrorMsg
+        self.callbacks = callbacks
+        self.xids = []
+
+    @property
+    def latency(self):
+        if self.done_at is None:
+            return None
+        return self.done_at - self.sent_at
+
+    @property
+    def ok(self):
+        return not self.errors
+
+
+class FlowProgrammer(object):
+    """
+    Hàng đợi FlowMod theo switch.
+    - send(dp, mod, callback): xếp hàng; callback(batch) được gọi khi lô chứa mod
+      nhận BarrierReply (batch.ok = False nếu switch báo lỗi).
+    - flush(dp): gửi ngay lô đang chờ (dùng sau khi cài một loạt luật).
+    - send_now(dp, mod): gửi ngay, không Barrier (flow reactive từ Packet-In).
+    - App phải chuyển EventOFPBarrierReply / EventOFPErrorMsg vào barrier_reply() / error().
+    - observer(dp, msg): gọi cho mỗi message đúng lúc gửi xuống switch (kế toán bảng flow).
+    """
+
+    def __init__(self, logger, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.logger = logger
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending = {}       # {dpid: (datapath, [msg], [callback])}
+        self.waiting = {}       # {(dpid, barrier_xid): FlowBatch}
+        self.xid_batch = {}     # {(dpid, flowmod_xid): FlowBatch} - để gắn lỗi vào lô
+        self.observer = None
+        # Số liệu
+        self.flowmods_sent = 0
+        self.batches_done = 0
+        self.errors = 0
+        self.last_latency = 0.0
+
+    def send(self, datapath, msg, callback=None):
+        entry = self.pending.get(datapath.id)
+        if entry is None or entry[0] is not datapath:
+            entry = self.pending[datapath.id] = (datapath, [], [])
+        entry[1].append(msg)
+        if callback is not None:
+            entry[2].append(callback)
+        if len(entry[1]) >= self.batch_size:
+            self.flush(datapath)
+
+    def send_now(self, datapath, msg):
+        """Gửi ngay một FlowMod không kèm Barrier; lô đang chờ của switch đi trước (giữ thứ tự)."""
+        if datapath.id in self.pending:
+            self.flush(datapath)
+        if self.observer is not None:
+            self.observer(datapath, msg)
+        datapath.set_xid(msg)
+        datapath.send_msg(msg)
+        self.flowmods_sent += 1
+
+    def flush(self, datapath, callback=None):
+        """Gửi lô đang chờ của switch + BarrierRequest. Trả về FlowBatch (hoặc None)."""
+        dpid = datapath.id
+        entry = self.pending.pop(dpid, None)
+        if entry is None:
+            if callback is None:
+                return None
+            entry = (datapath, [], [])
+        _, msgs, callbacks = entry
+        if callback is not None:
+            callbacks.append(callback)
+
+        batch = FlowBatch(dpid, len(msgs), callbacks, time.time())
+        observer = self.observer
+        for msg in msgs:
+            if observer is not None:
+                observer(datapath, msg)
+            xid = datapath.set_xid(msg)
+            datapath.send_msg(msg)
+            batch.xids.append(xid)
+            self.xid_batch[(dpid, xid)] = batch
+        barrier = datapath.ofproto_parser.OFPBarrierRequest(datapath)
+        xid = datapath.set_xid(barrier)
+        datapath.send_msg(barrier)
+        self.waiting[(dpid, xid)] = batch
+        self.flowmods_sent += len(msgs)
+        return batch
+
+    def flush_all(self):
+        for datapath, _, _ in list(self.pending.values()):
+            self.flush(datapath)
+
+    def run(self):
+        """Vòng lặp (hub thread) gửi các lô chưa đầy sau mỗi flush_interval."""
+        while True:
+            if self.pending:
+                self.flush_all()
+            hub.sleep(self.flush_interval)
+
+    def barrier_reply(self, msg):
+        dpid = msg.datapath.id
+        batch = self.waiting.pop((dpid, msg.xid), None)
+        if batch is None:
+            return None
+        batch.done_at = time.time()
+        for xid in batch.xids:
+            self.xid_batch.pop((dpid, xid), None)
+        self.batches_done += 1
+        self.last_latency = batch.latency
+        for callback in batch.callbacks:
+            callback(batch)
+        return batch
+
+    def error(self, msg):
+        batch = self.xid_batch.get((msg.datapath.id, msg.xid))
+        if batch is None:
+            return None
+        batch.errors.append((msg.type, msg.code))
+        self.errors += 1
+        self.logger.warning(f"[FLOW] Switch {batch.dpid} rejected FlowMod xid={msg.xid} "
+                            f"(type={msg.type}, code={msg.code})")
+        return batch
+
+    def remove(self, dpid):
+        self.pending.pop(dpid, None)
+        self.waiting = {k: b for k, b in self.waiting.items() if k[0] != dpid}
+        self.xid_batch = {k: b for k, b in self.xid_batch.items() if k[0] != dpid}
@@ -0,0 +1,96 @@
+# Tên file: flow_reconciler.py
+# Vai trò: Đối chiếu flow đang có trên switch trước khi cài lại (Flow Stats lọc theo cookie)
+# Mục đích: Switch vẫn giữ flow khi controller khởi động lại hoặc mất kết nối ngắn, nhưng
+#           app từng gửi lại toàn bộ luật chặn / ACL / flow L2 mỗi lần switch kết nối
+#           (hàng nghìn FlowMod cho bảng lớn). Ở đây mọi flow do app cài mang cookie
+#           COOKIE_TAG | loại; khi switch kết nối, một OFPFlowStatsRequest lọc theo
+#           COOKIE_TAG trả về đúng các flow đó, và app chỉ gửi phần chênh lệch.
+
+import time
+
+COOKIE_TAG = 0x5344 << 48          # 'SD' ở 16 bit cao: flow do các app này cài
+COOKIE_TAG_MASK = 0xffff << 48
+COOKIE_BLOCK = COOKIE_TAG | 1      # Luật chặn IP nguồn / prefix (SDNSmartFirewall)
+COOKIE_L2 = COOKIE_TAG | 2         # Flow chuyển mạch proactive (l2_pipeline.py)
+COOKIE_ACL = COOKIE_TAG | 3        # Flow ACL đã biên dịch (StaticFirewall*)
+COOKIE_FORWARD = COOKIE_TAG | 4    # Flow chuyển mạch reactive cài từ Packet-In (SDNSmartFirewall)
+
+RECONCILE_TIMEOUT = 5.0            # Không có reply -> coi như switch trống, cài lại toàn bộ
+
+# Mask đủ bit = khớp chính xác; switch có thể trả về một trong hai dạng
+_FULL_MASKS = ('255.255.255.255', 'ff:ff:ff:ff:ff:ff')
+
+
+def match_key(priority, match):
+    """(priority, các trường match đã sắp xếp) - cùng dạng với CompiledFlow.key()."""
+    fields = []
+    for name, value in match.items():
+        if value.__class__ is tuple and value[1] in _FULL_MASKS:
+            value = value[0]
+        fields.append((name, value))
+    return (priority, tuple(sorted(fields)))
+
+
+def cookie_flows(flows, cookie):
+    """Các OFPFlowStats trong reply có đúng cookie này."""
+    return [stat for stat in flows if stat.cookie == cookie]
+
+
+class Reconciler(object):
+    """
+    Một lượt đối chiếu mỗi switch: request() gửi Flow Stats lọc cookie; reply() gom
+    các phần (OFPMPF_REPLY_MORE) theo xid rồi gọi callback(datapath, [OFPFlowStats]);
+    expire() gọi callback(datapath, None) khi quá hạn (switch không trả lời).
+    """
+
+    def __init__(self, logger, timeout=RECONCILE_TIMEOUT):
+        self.logger = logger
+        self.timeout = timeout
+        self.pending = {}      # {dpid: [xid, flows, callback, hạn, datapath, lúc gửi]}
+        self.done = 0
+        self.timeouts = 0
+        self.last_latency = 0.0
+
+    def request(self, datapath, callback, cookie=COOKIE_TAG, cookie_mask=COOKIE_TAG_MASK,
+                now=None):
+        if now is None:
+            now = time.time()
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        req = parser.OFPFlowStatsRequest(datapath, 0, ofproto.OFPTT_ALL, ofproto.OFPP_ANY,
+                                         ofproto.OFPG_ANY, cookie, cookie_mask, parser.OFPMatch())
+        xid = datapath.set_xid(req)
+        self.pending[datapath.id] = [xid, [], callback, now + self.timeout, datapath, now]
+        datapath.send_msg(req)
+
+    def waiting(self, dpid):
+        return dpid in self.pending
+
+    def reply(self, msg, now=None):
+        """True nếu reply thuộc một lượt đối chiếu (không chuyển cho bộ phân tích)."""
+        dpid = msg.datapath.id
+        entry = self.pending.get(dpid)
+        if entry is None or entry[0] != msg.xid:
+            return False
+        entry[1].extend(msg.body)
+        if msg.flags & msg.datapath.ofproto.OFPMPF_REPLY_MORE:
+            return True
+        del self.pending[dpid]
+        self.done += 1
+        self.last_latency = (time.time() if now is None else now) - entry[5]
+        entry[2](entry[4], entry[1])
+        return True
+
+    def expire(self, now=None):
+        if now is None:
+            now = time.time()
+        for dpid, entry in list(self.pending.items()):
+            if now >= entry[3]:
+                del self.pending[dpid]
+                self.timeouts += 1
+                self.logger.warning(f"[RECONCILE] Switch {dpid}: no flow stats reply after "
+                                    f"{self.timeout:g}s, reinstalling all rules")
+                entry[2](entry[4], None)
+
+    def remove(self, dpid):
+        self.pending.pop(dpid, None)
@@ -0,0 +1,261 @@
+# Tên file: instrumentation.py
+# Vai trò: Counter / gauge / histogram trong RAM cho các app + endpoint /metrics
+# Mục đích: Trước đây chỉ có self.logger.info, và chính các dòng log theo từng IP
+#           nguồn mỗi lượt poll trở thành nút thắt khi bị tấn công. Ở đây đường nóng
+#           chỉ cộng số nguyên (counter) hoặc tăng một ô bucket (histogram); giá trị
+#           được định dạng kiểu Prometheus text chỉ khi có người đọc /metrics (Ryu
+#           WSGI, chạy ryu-manager --wsapi-host 127.0.0.1 để chỉ nghe cục bộ).
+#           LogLimiter thay các dòng log lặp lại bằng một số dòng mỗi cửa sổ thời gian.
+
+import functools
+import heapq
+import math
+import numbers
+import time
+from bisect import bisect_left
+
+from ryu.app.wsgi import ControllerBase, Response, route
+
+TYPE_COUNTER = 'counter'
+TYPE_GAUGE = 'gauge'
+TYPE_HISTOGRAM = 'histogram'
+
+# Bucket mặc định (Giây): 10 us .. 10 s, gần như x2.5 mỗi bậc
+LATENCY_BUCKETS = (1e-05, 2.5e-05, 5e-05, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Bucket cho kích thước (số flow trong một reply...)
+SIZE_BUCKETS = (1, 10, 100, 1000, 10000, 100000, 1000000)
+
+LOG_INTERVAL = 10.0      # Cửa sổ của LogLimiter (Giây)
+LOG_BURST = 20           # Số dòng tối đa mỗi loại log trong một cửa sổ
+
+METRICS_PATH = '/metrics'
+APP_KEY = 'instrumented_app'
+
+
+def _labels_text(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+def _number(value):
+    """Giá trị mẫu theo text format của Prometheus: số nguyên giữ đủ chữ số, float theo repr."""
+    if isinstance(value, numbers.Integral):
+        return str(int(value))
+    value = float(value)
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(value)
+
+
+class Metric(object):
+    """Counter hoặc gauge; `fn` (nếu có) được gọi lúc render thay cho `value`."""
+    __slots__ = ('value', 'labels', 'fn')
+
+    def __init__(self, labels, fn=None):
+        self.value = 0
+        self.labels = labels
+        self.fn = fn
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def set(self, value):
+        self.value = value
+
+    def get(self):
+        return self.fn() if self.fn is not None else self.value
+
+    def lines(self, name):
+        return [f"{name}{_labels_text(self.labels)} {_number(self.get())}"]
+
+
+class Histogram(object):
+    """Histogram bucket cố định: observe() = bisect + cộng một ô (không lưu mẫu)."""
+    __slots__ = ('bounds', 'counts', 'sum', 'count', 'labels')
+
+    def __init__(self, labels, bounds=LATENCY_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)   # Ô cuối: > bucket lớn nhất
+        self.sum = 0.0
+        self.count = 0
+        self.labels = labels
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Ước lượng phân vị theo cận trên của bucket (đủ cho log/benchmark)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def lines(self, name):
+        out = []
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            labels = self.labels + (('le', f"{bound:g}"),)
+            out.append(f"{name}_bucket{_labels_text(labels)} {seen}")
+        labels = self.labels + (('le', '+Inf'),)
+        out.append(f"{name}_bucket{_labels_text(labels)} {self.count}")
+        out.append(f"{name}_sum{_labels_text(self.labels)} {_number(self.sum)}")
+        out.append(f"{name}_count{_labels_text(self.labels)} {self.count}")
+        return out
+
+
+class Registry(object):
+    """
+    Các số liệu của một app, nhóm theo tên (một tên có thể có nhiều bộ nhãn).
+    counter()/gauge()/histogram() trả về cùng đối tượng nếu gọi lại với cùng nhãn,
+    nên có thể gọi lúc khởi tạo và giữ tham chiếu cho đường nóng.
+    """
+
+    def __init__(self):
+        self.families = {}   # {name: (type, help, {labels: metric})}
+        self._handlers = {}  # {tên handler: Histogram} - tra nhanh cho @timed
+
+    def _get(self, kind, name, help, labels, make):
+        family = self.families.get(name)
+        if family is None:
+            family = self.families[name] = (kind, help, {})
+        elif family[0] != kind:
+            raise ValueError(f"Metric {name} already registered as {family[0]}")
+        key = tuple(sorted(labels.items()))
+        metric = family[2].get(key)
+        if metric is None:
+            metric = family[2][key] = make(key)
+        return metric
+
+    def counter(self, name, help, fn=None, **labels):
+        return self._get(TYPE_COUNTER, name, help, labels, lambda key: Metric(key, fn))
+
+    def gauge(self, name, help, fn=None, **labels):
+        return self._get(TYPE_GAUGE, name, help, labels, lambda key: Metric(key, fn))
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS, **labels):
+        return self._get(TYPE_HISTOGRAM, name, help, labels,
+                         lambda key: Histogram(key, buckets))
+
+    def handler(self, name):
+        """Histogram độ trễ của một event handler (dùng bởi @timed)."""
+        histogram = self._handlers.get(name)
+        if histogram is None:
+            histogram = self._handlers[name] = self.histogram(
+                'sdn_handler_seconds', 'Event handler latency', handler=name)
+        return histogram
+
+    def render(self):
+        """Định dạng text exposition của Prometheus."""
+        out = []
+        for name, (kind, help, metrics) in sorted(self.families.items()):
+            out.append(f"# HELP {name} {help}")
+            out.append(f"# TYPE {name} {kind}")
+            for metric in metrics.values():
+                out.extend(metric.lines(name))
+        out.append('')
+        return '\n'.join(out)
+
+
+def timed(name):
+    """
+    Đo thời gian chạy của method handler(self, ev) vào self.stats.handler(name).
+    Đặt dưới @set_ev_cls (set_ev_cls gắn thuộc tính lên hàm bọc ngoài).
+    """
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args):
+            start = time.perf_counter()
+            try:
+                return method(self, *args)
+            finally:
+                self.stats.handler(name).observe(time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+def instrument_flows(registry, flows):
+    """Số liệu của FlowProgrammer (đọc lúc render, không thêm gì vào send())."""
+    registry.counter('sdn_flow_mods_total', 'FlowMods sent to switches',
+                     fn=lambda: flows.flowmods_sent)
+    registry.counter('sdn_flow_batches_total', 'FlowMod batches confirmed by barrier',
+                     fn=lambda: flows.batches_done)
+    registry.counter('sdn_flow_errors_total', 'OpenFlow errors attributed to FlowMods',
+                     fn=lambda: flows.errors)
+    registry.gauge('sdn_flow_batch_latency_seconds', 'Barrier latency of the last batch',
+                   fn=lambda: flows.last_latency)
+
+
+class LogLimiter(object):
+    """
+    Giới hạn số dòng log mỗi loại (key) trong một cửa sổ thời gian; phần bị bỏ
+    được đếm và báo gộp một dòng khi cửa sổ kế tiếp bắt đầu.
+    """
+
+    def __init__(self, logger, burst=LOG_BURST, interval=LOG_INTERVAL, counter=None):
+        self.logger = logger
+        self.burst = burst
+        self.interval = interval
+        self.counter = counter      # Metric đếm tổng số dòng bị bỏ (tuỳ chọn)
+        self.windows = {}           # {key: [hết hạn cửa sổ, đã log, bị bỏ]}
+
+    def take(self, key, count=1, now=None):
+        """Số dòng (<= count) được phép log ngay cho loại `key`."""
+        if now is None:
+            now = time.time()
+        window = self.windows.get(key)
+        if window is None or now >= window[0]:
+            if window is not None and window[2]:
+                self.logger.info(f"[LOG] {window[2]} '{key}' line(s) suppressed "
+                                 f"in the last {self.interval:g}s")
+            window = self.windows[key] = [now + self.interval, 0, 0]
+        allowed = min(count, self.burst - window[1])
+        window[1] += allowed
+        dropped = count - allowed
+        if dropped:
+            window[2] += dropped
+            if self.counter is not None:
+                self.counter.inc(dropped)
+        return allowed
+
+    def allow(self, key, now=None):
+        return self.take(key, 1, now) == 1
+
+    def top(self, key, items, value, now=None):
+        """Các phần tử được log của `items`: ưu tiên giá trị `value` lớn nhất."""
+        allowed = self.take(key, len(items), now)
+        if allowed >= len(items):
+            return items
+        return heapq.nlargest(allowed, items, key=value)
+
+
+class MetricsController(ControllerBase):
+    """GET /metrics: Registry (app.stats) của app dạng Prometheus text."""
+
+    def __init__(self, req, link, data, **config):
+        super(MetricsController, self).__init__(req, link, data, **config)
+        self.app = data[APP_KEY]
+
+    @route('metrics', METRICS_PATH, methods=['GET'])
+    def metrics(self, req, **kwargs):
+        return Response(content_type='text/plain', charset='utf-8',
+                        body=self.app.stats.render().encode('utf-8'))
+
+
+def serve(app, wsgi):
+    """Đăng ký GET /metrics cho app; wsgi = kwargs.get('wsgi') (None khi chạy ngoài ryu-manager)."""
+    if wsgi is None:
+        return False
+    wsgi.register(MetricsController, {APP_KEY: app})
+    return True
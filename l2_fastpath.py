@@ -0,0 +1,156 @@
+# Tên file: l2_fastpath.py
+# Vai trò: Đường xử lý nhanh cho Packet-In (chỉ đọc 14 byte header Ethernet)
+# Mục đích: Khi bị flood, số Packet-In chính là thứ làm sập controller.
+#           Không dựng ryu.lib.packet.Packet cho mỗi gói chỉ để lấy src/dst/ethertype.
+
+import struct
+import time
+from state_store import TimerWheel, container_bytes
+
+# dst (2+4 byte), src (2+4 byte), ethertype: đọc thẳng ra số nguyên, không cắt chuỗi
+ETH_HEADER = struct.Struct('!HIHIH')
+ETH_HEADER_LEN = ETH_HEADER.size       # 14
+VLAN_TAG = struct.Struct('!2xH')       # TCI (bỏ qua) + ethertype bên trong
+IPV4_ADDRS = struct.Struct('!12xII')   # Header IPv4: bỏ 12 byte đầu -> src, dst
+
+ETH_TYPE_8021Q = 0x8100
+ETH_TYPE_8021AD = 0x88a8
+ETH_TYPE_LLDP = 0x88cc
+ETH_TYPE_IP = 0x0800
+BROADCAST = 0xffffffffffff
+
+MAX_MACS = 4096     # Số MAC tối đa mỗi switch (MAC giả mạo không làm phình bảng)
+MAC_TTL = 300       # MAC không gửi gói quá lâu thì quên (Giây)
+
+
+def parse_eth(data):
+    """
+    Trả về (dst, src, ethertype) với MAC là số nguyên 48 bit, hoặc None nếu frame
+    ngắn hơn 14 byte. Với frame gắn VLAN, ethertype là loại gói bên trong tag.
+    """
+    if len(data) < ETH_HEADER_LEN:
+        return None
+    dst_hi, dst_lo, src_hi, src_lo, ethertype = ETH_HEADER.unpack_from(data)
+    if ethertype == ETH_TYPE_8021Q or ethertype == ETH_TYPE_8021AD:
+        if len(data) < ETH_HEADER_LEN + VLAN_TAG.size:
+            return None
+        ethertype = VLAN_TAG.unpack_from(data, ETH_HEADER_LEN)[0]
+    return (dst_hi << 32) | dst_lo, (src_hi << 32) | src_lo, ethertype
+
+
+def ipv4_addrs(data, ethertype):
+    """
+    (src, dst) IPv4 dạng số nguyên của frame đã qua parse_eth(), hoặc None nếu
+    không phải IPv4 / frame bị cắt. Dùng cho Packet-In được lấy mẫu.
+    """
+    if ethertype != ETH_TYPE_IP:
+        return None
+    offset = ETH_HEADER_LEN
+    if data[12] == 0x81 or data[12] == 0x88:     # Có VLAN tag (0x8100 / 0x88a8)
+        offset += VLAN_TAG.size
+    if len(data) < offset + IPV4_ADDRS.size:
+        return None
+    return IPV4_ADDRS.unpack_from(data, offset)
+
+
+def mac_to_text(mac):
+    """48 bit -> 'aa:bb:cc:dd:ee:ff' (chỉ dùng khi cài flow, không dùng trong đường nóng)."""
+    return mac.to_bytes(6, 'big').hex(':')
+
+
+def text_to_mac(text):
+    return int(text.replace(':', ''), 16)
+
+
+class MacTable(object):
+    """
+    Bảng MAC phẳng của một switch: {mac (int): port}.
+    Tạo sẵn khi switch kết nối nên Packet-In không phải setdefault mỗi gói.
+    Có giới hạn: tối đa max_entries MAC (bỏ MAC lâu không gửi gói nhất - LRU) và
+    MAC im lặng quá ttl giây bị xoá (timer wheel, chạy dần trong learn()).
+    """
+    __slots__ = ('dpid', 'ports', 'seen', 'port_macs', 'max_entries', 'ttl', 'wheel',
+                 'next_expire', 'evicted', 'expired')
+
+    def __init__(self, dpid, max_entries=MAX_MACS, ttl=MAC_TTL):
+        self.dpid = dpid
+        self.ports = {}
+        self.seen = {}            # {mac: lần cuối thấy làm nguồn}, thứ tự = LRU
+        self.port_macs = {}       # {port: số MAC học được} - cổng biên chỉ có ít MAC
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.wheel = TimerWheel()
+        self.next_expire = 0.0
+        self.evicted = 0
+        self.expired = 0
+
+    def learn(self, mac, port, now=None):
+        if now is None:
+            now = time.time()
+        seen = self.seen
+        if mac in seen:
+            del seen[mac]         # Đưa xuống cuối thứ tự LRU
+        else:
+            if len(seen) >= self.max_entries:
+                oldest = next(iter(seen))
+                del seen[oldest]
+                self._uncount(self.ports.pop(oldest))
+                self.evicted += 1
+            self.wheel.schedule(mac, now + self.ttl)
+        seen[mac] = now
+        old = self.ports.get(mac)
+        if old != port:
+            if old is not None:
+                self._uncount(old)
+            self.port_macs[port] = self.port_macs.get(port, 0) + 1
+            self.ports[mac] = port
+        if now >= self.next_expire:
+            self.expire(now)
+
+    def expire(self, now=None):
+        """Xoá các MAC im lặng quá ttl; trả về số MAC bị xoá."""
+        if now is None:
+            now = time.time()
+        self.next_expire = now + self.wheel.tick
+        seen = self.seen
+        count = 0
+        for mac in self.wheel.advance(now):
+            last = seen.get(mac)
+            if last is None:
+                continue              # Đã bị LRU loại trước đó
+            if last + self.ttl > now:
+                self.wheel.schedule(mac, last + self.ttl)   # Vẫn hoạt động -> hẹn lại
+                continue
+            del seen[mac]
+            self._uncount(self.ports.pop(mac))
+            count += 1
+        self.expired += count
+        return count
+
+    def _uncount(self, port):
+        left = self.port_macs[port] - 1
+        if left:
+            self.port_macs[port] = left
+        else:
+            del self.port_macs[port]
+
+    def port_load(self, port):
+        """Số MAC đang học được trên cổng (1 = cổng nối host, nhiều = cổng nối switch)."""
+        return self.port_macs.get(port, 0)
+
+    def get(self, mac, default=None):
+        return self.ports.get(mac, default)
+
+    def __contains__(self, mac):
+        return mac in self.ports
+
+    def __len__(self):
+        return len(self.ports)
+
+    def items(self):
+        """Duyệt (mac dạng chuỗi, port) - cho log/hiển thị."""
+        for mac, port in self.ports.items():
+            yield mac_to_text(mac), port
+
+    def memory(self):
+        return container_bytes(self.ports, self.seen, self.port_macs) + self.wheel.memory()
@@ -0,0 +1,180 @@
+# Tên file: l2_pipeline.py
+# Vai trò: Chuyển mạch L2 chủ động (proactive) trên pipeline nhiều bảng OpenFlow 1.3
+# Mục đích: Chế độ cũ (reactive) cài flow in_port+eth_dst(+eth_src) khi có Packet-In,
+#           nên mỗi cặp nguồn/đích mới và mỗi lần flow idle hết hạn lại tốn một vòng
+#           lên controller, và bảng flow lớn theo số cặp. Ở đây:
+#             - Bảng 0 (ACL_TABLE): firewall / ACL / luật chặn; miss -> bảng 1.
+#             - Bảng 1 (FORWARD_TABLE): eth_dst -> cổng, cài ngay khi MAC được học
+#               (một flow mỗi host, không nhân với luật chặn của bảng 0); miss ->
+#               Controller (đích chưa biết: flood).
+#             - Bảng 2 (LEARN_TABLE): eth_src + in_port đã biết -> kết thúc; miss ->
+#               Controller chỉ để học nguồn (gói đã được bảng 1 chuyển đi rồi).
+#           Host đã biết trước (hosts.json, như FinalTopo) được cài ngay khi switch kết nối.
+
+import json
+import time
+
+from flow_reconciler import COOKIE_L2
+from l2_fastpath import mac_to_text, text_to_mac, MAC_TTL, BROADCAST
+from prefix_planner import ip_to_int
+
+MODE_REACTIVE = 'reactive'      # in_port + eth_dst (+ eth_src) khi có Packet-In (cách cũ)
+MODE_PROACTIVE = 'proactive'    # eth_dst -> cổng trên pipeline ACL / FORWARD / LEARN
+
+ACL_TABLE = 0
+FORWARD_TABLE = 1
+LEARN_TABLE = 2
+
+FORWARD_PRIORITY = 10
+MISS_PRIORITY = 0
+# Luật học nguồn hết hạn cứng sau khoảng này: host đang hoạt động gửi lại một Packet-In
+# (làm mới MacTable trước MAC_TTL) mà không cần Packet-In cho mỗi cặp nguồn/đích
+LEARN_REFRESH = MAC_TTL // 2
+RESEND_INTERVAL = 1.0   # Không gửi lại cùng flow cho một MAC trong khoảng này (Giây)
+
+
+def load_host_map(path, logger=None):
+    """
+    hosts.json: [{"dpid": 1, "port": 1, "mac": "00:00:00:00:00:01", "ip": "10.0.0.1"}]
+    -> {dpid: [(mac int, port, ip int hoặc None)]}; file lỗi/thiếu -> {}.
+    """
+    try:
+        with open(path) as f:
+            entries = json.load(f)
+        hosts = {}
+        for entry in entries:
+            ip = entry.get('ip')
+            hosts.setdefault(int(entry['dpid']), []).append(
+                (text_to_mac(entry['mac']), int(entry['port']),
+                 ip_to_int(ip) if ip else None))
+        return hosts
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        if logger is not None:
+            logger.warning(f"[L2] Host map {path} not loaded: {e}")
+        return {}
+
+
+class ProactiveL2(object):
+    """
+    Cài / làm mới flow của pipeline qua FlowProgrammer.
+    - setup(dp): table-miss của 3 bảng, flood broadcast, host biết trước của switch
+      (pin=False: để pin() cài sau, khi đã biết switch còn giữ flow nào).
+    - learned(dp, mac, port): MAC ở cổng -> flow eth_dst (FORWARD) + eth_src (LEARN);
+      gọi lại nhiều lần cũng chỉ gửi khi cổng đổi hoặc đã quá RESEND_INTERVAL.
+    """
+
+    def __init__(self, flows, host_map=None, idle_timeout=MAC_TTL, learn_refresh=LEARN_REFRESH,
+                 priority=FORWARD_PRIORITY):
+        self.flows = flows
+        self.host_map = host_map or {}
+        self.idle_timeout = idle_timeout
+        self.learn_refresh = learn_refresh
+        self.priority = priority
+        self.installed = {}     # {dpid: {mac: (port, lúc gửi)}}
+        self.flows_sent = 0
+
+    def hosts(self, dpid):
+        return self.host_map.get(dpid, ())
+
+    def setup(self, datapath, meter_id=None, pin=True):
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        # Bảng 0: gói không bị firewall xử lý -> sang bảng chuyển mạch
+        self._send(datapath, ACL_TABLE, MISS_PRIORITY, parser.OFPMatch(),
+                   [parser.OFPInstructionGotoTable(FORWARD_TABLE)])
+        # Bảng 1 / 2: miss -> Controller (cùng Meter Packet-In nếu có)
+        to_controller = [parser.OFPActionOutput(ofproto.OFPP_CONTROLLER, ofproto.OFPCML_NO_BUFFER)]
+        for table_id in (FORWARD_TABLE, LEARN_TABLE):
+            inst = [parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS, to_controller)]
+            if meter_id is not None:
+                inst.insert(0, parser.OFPInstructionMeter(meter_id))
+            self._send(datapath, table_id, MISS_PRIORITY, parser.OFPMatch(), inst)
+        # Broadcast: switch tự flood, nguồn vẫn được học ở bảng 2
+        self._send(datapath, FORWARD_TABLE, self.priority,
+                   parser.OFPMatch(eth_dst=mac_to_text(BROADCAST)),
+                   self._forward(datapath, ofproto.OFPP_FLOOD))
+        self.installed[datapath.id] = {}
+        if pin:
+            self.pin(datapath)
+
+    def pin(self, datapath, existing=None):
+        """
+        Cài flow cho host biết trước; existing = forwarding(flows) của switch: host đã có
+        flow tới đúng cổng thì không gửi lại. Trả về số host phải cài.
+        """
+        installed = self.installed.setdefault(datapath.id, {})
+        existing = existing or {}
+        sent = 0
+        for mac, port, _ in self.hosts(datapath.id):
+            # Host biết trước: flow không hết hạn (bản đồ host là nguồn tin cậy) và
+            # không bị learned() ghi đè trừ khi host thật sự xuất hiện ở cổng khác
+            if existing.get(mac) != port:
+                self._install(datapath, mac, port, idle=0)
+                sent += 1
+            installed[mac] = (port, float('inf'))
+        return sent
+
+    @staticmethod
+    def forwarding(flows):
+        """{mac: cổng} của các flow eth_dst ở FORWARD_TABLE trong một Flow Stats reply."""
+        out = {}
+        for stat in flows:
+            if stat.table_id != FORWARD_TABLE or stat.cookie != COOKIE_L2:
+                continue
+            dst = stat.match.get('eth_dst')
+            if dst is None or dst.__class__ is tuple:
+                continue
+            for inst in stat.instructions:
+                for action in getattr(inst, 'actions', ()):
+                    port = getattr(action, 'port', None)
+                    if port is not None:
+                        out[text_to_mac(dst)] = port
+        return out
+
+    def learned(self, datapath, mac, port, now=None):
+        """Trả về True nếu đã gửi flow mới cho MAC."""
+        if mac == BROADCAST or mac & (1 << 40):
+            return False    # MAC multicast / broadcast không bao giờ là nguồn
+        if now is None:
+            now = time.time()
+        installed = self.installed.get(datapath.id)
+        if installed is None:
+            installed = self.installed[datapath.id] = {}
+        last = installed.get(mac)
+        if last is not None and last[0] == port and now - last[1] < RESEND_INTERVAL:
+            return False
+        installed[mac] = (port, now)
+        self._install(datapath, mac, port, self.idle_timeout)
+        return True
+
+    def suppress(self, datapath, in_port, duration, priority):
+        """Cổng đang flood: bỏ gói tới đích chưa biết + Packet-In học nguồn của cổng đó."""
+        parser = datapath.ofproto_parser
+        for table_id in (FORWARD_TABLE, LEARN_TABLE):
+            self._send(datapath, table_id, priority, parser.OFPMatch(in_port=in_port), [],
+                       hard=duration)
+
+    def remove(self, dpid):
+        self.installed.pop(dpid, None)
+
+    def _install(self, datapath, mac, port, idle):
+        parser = datapath.ofproto_parser
+        text = mac_to_text(mac)
+        # Đích: mọi nguồn tới MAC này dùng chung một flow (không theo cặp)
+        self._send(datapath, FORWARD_TABLE, self.priority, parser.OFPMatch(eth_dst=text),
+                   self._forward(datapath, port), idle=idle)
+        # Nguồn đã biết ở cổng này: không lên controller nữa (hết hạn cứng để làm mới)
+        self._send(datapath, LEARN_TABLE, self.priority, parser.OFPMatch(in_port=port, eth_src=text),
+                   [], hard=self.learn_refresh if idle else 0)
+
+    def _forward(self, datapath, port):
+        parser = datapath.ofproto_parser
+        actions = [parser.OFPActionOutput(port)]
+        return [parser.OFPInstructionActions(datapath.ofproto.OFPIT_APPLY_ACTIONS, actions),
+                parser.OFPInstructionGotoTable(LEARN_TABLE)]
+
+    def _send(self, datapath, table_id, priority, match, inst, idle=0, hard=0):
+        self.flows.send(datapath, datapath.ofproto_parser.OFPFlowMod(
+            datapath=datapath, cookie=COOKIE_L2, table_id=table_id, priority=priority,
+            match=match, instructions=inst, idle_timeout=idle, hard_timeout=hard))
+        self.flows_sent += 1
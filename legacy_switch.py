@@ -2,19 +2,41 @@
 # Vai trò: Switch truyền thống (L2 Learning Switch) - Không có Firewall
 # Mục đích: Dùng để chạy Kịch bản 1 (Chứng minh mạng sập khi bị tấn công)
 
+from ryu.app.wsgi import WSGIApplication
 from ryu.base import app_manager
 from ryu.controller import ofp_event
 from ryu.controller.handler import MAIN_DISPATCHER, CONFIG_DISPATCHER, set_ev_cls
 from ryu.ofproto import ofproto_v1_3
-from ryu.lib.packet import packet, ethernet
+from ryu.lib import hub
+from l2_fastpath import parse_eth, mac_to_text, MacTable
+from l2_pipeline import ProactiveL2, load_host_map, MODE_PROACTIVE, MODE_REACTIVE, LEARN_TABLE
+from flow_programmer import FlowProgrammer
+from instrumentation import Registry, timed, instrument_flows, serve
+
+# MODE_REACTIVE: flow in_port+eth_dst cài khi có Packet-In (cách cũ)
+# MODE_PROACTIVE: flow eth_dst -> cổng cài ngay khi học MAC (xem l2_pipeline.py)
+FORWARDING_MODE = MODE_REACTIVE
+HOST_MAP_FILE = 'hosts.json'    # Host biết trước (như FinalTopo), chỉ dùng ở MODE_PROACTIVE
 
 class LegacySwitch(app_manager.RyuApp):
     OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
+    _CONTEXTS = {'wsgi': WSGIApplication}
 
     def __init__(self, *args, **kwargs):
         super(LegacySwitch, self).__init__(*args, **kwargs)
-        # Bảng lưu địa chỉ MAC: {dpid: {mac: port}}
+        # Bảng lưu địa chỉ MAC: {dpid: MacTable}
         self.mac_to_port = {}
+        # FlowMod gửi theo lô + Barrier (xem flow_programmer.py)
+        self.flows = FlowProgrammer(self.logger)
+        self.flow_thread = hub.spawn(self.flows.run)
+        self.l2 = None
+        if FORWARDING_MODE == MODE_PROACTIVE:
+            self.l2 = ProactiveL2(self.flows, load_host_map(HOST_MAP_FILE, self.logger))
+        # Số liệu vận hành cho GET /metrics (xem instrumentation.py)
+        self.stats = Registry()
+        self.pktin_total = self.stats.counter('sdn_packet_in_total', 'Packet-In messages received')
+        instrument_flows(self.stats, self.flows)
+        serve(self, kwargs.get('wsgi'))
         self.logger.info(">>> LEGACY SWITCH ACTIVE (NO FIREWALL PROTECTION) <<<")
 
     @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER)
@@ -26,6 +48,16 @@ class LegacySwitch(app_manager.RyuApp):
         dp = ev.msg.datapath
         ofp = dp.ofproto
         parser = dp.ofproto_parser
+
+        # Tạo sẵn bảng MAC cho Switch (Packet-In không cần setdefault)
+        self.mac_to_port[dp.id] = MacTable(dp.id)
+        if self.l2 is not None:
+            # Pipeline: bảng 0 miss -> bảng 1 (eth_dst), host biết trước cài sẵn
+            self.l2.setup(dp)
+            for mac, port, _ in self.l2.hosts(dp.id):
+                self.mac_to_port[dp.id].learn(mac, port)
+            self.flows.flush(dp)
+            return
         
         # Match: Mọi gói tin (không khớp luồng nào khác)
         match = parser.OFPMatch()
@@ -33,16 +65,29 @@ class LegacySwitch(app_manager.RyuApp):
         actions = [parser.OFPActionOutput(ofp.OFPP_CONTROLLER, ofp.OFPCML_NO_BUFFER)]
         
         self.add_flow(dp, 0, match, actions)
+        self.flows.flush(dp)
 
-    def add_flow(self, dp, prio, match, actions):
-        """Hàm hỗ trợ đẩy luồng (Flow) xuống Switch"""
+    def add_flow(self, dp, prio, match, actions, now=False):
+        """Hàm hỗ trợ đẩy luồng (Flow) xuống Switch (now=True: gửi ngay, không xếp lô)"""
         ofp = dp.ofproto
         parser = dp.ofproto_parser
         inst = [parser.OFPInstructionActions(ofp.OFPIT_APPLY_ACTIONS, actions)]
         mod = parser.OFPFlowMod(datapath=dp, priority=prio, match=match, instructions=inst)
-        dp.send_msg(mod)
+        if now:
+            self.flows.send_now(dp, mod)
+        else:
+            self.flows.send(dp, mod)
+
+    @set_ev_cls(ofp_event.EventOFPBarrierReply, [CONFIG_DISPATCHER, MAIN_DISPATCHER])
+    def _barrier_reply_handler(self, ev):
+        self.flows.barrier_reply(ev.msg)
+
+    @set_ev_cls(ofp_event.EventOFPErrorMsg, [CONFIG_DISPATCHER, MAIN_DISPATCHER])
+    def _error_msg_handler(self, ev):
+        self.flows.error(ev.msg)
 
     @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
+    @timed('packet_in')
     def packet_in_handler(self, ev):
         """
         Xử lý gói tin gửi lên Controller.
@@ -52,37 +97,44 @@ class LegacySwitch(app_manager.RyuApp):
         dp = msg.datapath
         ofp = dp.ofproto
         parser = dp.ofproto_parser
+        self.pktin_total.inc()
         
-        # Lấy thông tin cổng vào và gói tin
+        # Lấy thông tin cổng vào và header Ethernet (fast path, không dựng Packet)
         in_port = msg.match['in_port']
-        pkt = packet.Packet(msg.data)
-        eth = pkt.get_protocol(ethernet.ethernet)
-        
-        dst = eth.dst
-        src = eth.src
+        eth = parse_eth(msg.data)
+        if eth is None:
+            return
+        dst, src, _ = eth
         dpid = dp.id
 
-        # Khởi tạo bảng MAC cho Switch nếu chưa có
-        self.mac_to_port.setdefault(dpid, {})
+        table = self.mac_to_port.get(dpid)
+        if table is None:
+            table = self.mac_to_port[dpid] = MacTable(dpid)
 
         # Học địa chỉ MAC nguồn: Gói tin từ 'src' đến từ cổng 'in_port'
-        # self.logger.info("packet in %s %s %s %s", dpid, src, dst, in_port)
-        self.mac_to_port[dpid][src] = in_port
+        table.learn(src, in_port)
+        if self.l2 is not None:
+            self.l2.learned(dp, src, in_port)
+            if msg.table_id == LEARN_TABLE:
+                self.flows.flush(dp)
+                return    # Chỉ để học nguồn: gói đã được chuyển ở bảng 1
 
         # Kiểm tra xem đã biết cổng của MAC đích chưa
-        if dst in self.mac_to_port[dpid]:
-            out_port = self.mac_to_port[dpid][dst]
-        else:
-            # Nếu chưa biết -> Flooding (Gửi ra tất cả các cổng)
-            out_port = ofp.OFPP_FLOOD
+        # Nếu chưa biết -> Flooding (Gửi ra tất cả các cổng)
+        out_port = table.get(dst, ofp.OFPP_FLOOD)
 
         actions = [parser.OFPActionOutput(out_port)]
 
         # Nếu không phải là Flooding, cài đặt luồng để lần sau Switch tự chuyển
-        if out_port != ofp.OFPP_FLOOD:
-            match = parser.OFPMatch(in_port=in_port, eth_dst=dst)
+        if self.l2 is not None:
+            if out_port != ofp.OFPP_FLOOD:
+                self.l2.learned(dp, dst, out_port)    # Flow của đích đã hết hạn
+            self.flows.flush(dp)
+        elif out_port != ofp.OFPP_FLOOD:
+            match = parser.OFPMatch(in_port=in_port, eth_dst=mac_to_text(dst))
             # Priority 1: Cao hơn mức mặc định (0) nhưng thấp hơn Firewall
-            self.add_flow(dp, 1, match, actions)
+            # Gửi ngay, không chờ FLUSH_INTERVAL của FlowProgrammer
+            self.add_flow(dp, 1, match, actions, now=True)
 
         # Gửi gói tin hiện tại đi (Packet-Out)
         data = None
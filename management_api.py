@@ -0,0 +1,288 @@
+# Tên file: management_api.py
+# Vai trò: REST API quản trị (Ryu WSGI) cho IP bị chặn, luật ACL và sự kiện phát hiện
+# Mục đích: Khi có sự cố, người vận hành không phải sửa JSON rồi khởi động lại để xem
+#           hay đổi trạng thái. Các endpoint chạy trong greenthread của WSGI server:
+#           danh sách được phân trang (không dựng toàn bộ bảng), thao tác hàng loạt
+#           được app xử lý theo khúc và nhường event loop (hub.sleep(0)) giữa các khúc,
+#           FlowMod đi theo lô qua FlowProgrammer -> Packet-In / stats không bị chặn.
+#
+#   GET    /firewall/blocks?offset=&limit=        IP đang bị chặn
+#   POST   /firewall/blocks   {"ips": [...], "duration": giây}
+#   DELETE /firewall/blocks   {"ips": [...]}
+#   GET    /firewall/rules?offset=&limit=         luật chặn đã cài / luật ACL
+#   POST   /firewall/rules    {"rules": [...]}    (thêm / thay theo "id", chỉ app có ACL)
+#   DELETE /firewall/rules    {"ids": [...]}
+#   GET    /firewall/events?since=&limit=         sự kiện sau số thứ tự `since`
+#   GET    /firewall/events/stream?since=         JSON lines, giữ kết nối (chunked)
+#
+# POST / DELETE cần header "Authorization: Bearer <SDN_API_TOKEN>" (hoặc X-Auth-Token);
+# chưa đặt SDN_API_TOKEN thì chỉ client trên chính máy controller (loopback) được đổi
+# trạng thái, vì wsapi của Ryu nghe trên mọi interface.
+
+import hmac
+import ipaddress
+import json
+import math
+import os
+import time
+from collections import deque
+from itertools import islice
+
+from ryu.app.wsgi import ControllerBase, Response, route
+from ryu.lib import hub
+
+EVENT_BUFFER = 10000     # Số sự kiện gần nhất giữ trong RAM
+DEFAULT_PAGE = 100
+MAX_PAGE = 1000
+API_CHUNK = 512          # Số mục xử lý giữa hai lần nhường event loop
+STREAM_INTERVAL = 0.5    # Chu kỳ kiểm tra sự kiện mới của stream (Giây)
+STREAM_HEARTBEAT = 15.0  # Gửi dòng trống nếu im lặng lâu hơn (giữ kết nối qua proxy)
+
+EV_ALERT = 'alert'       # Phát hiện tấn công (nguồn / nạn nhân / flood phân tán)
+EV_BLOCK = 'block'
+EV_UNBLOCK = 'unblock'
+EV_ACL = 'acl'           # Bộ luật ACL thay đổi (file hoặc API)
+
+APP_KEY = 'managed_app'
+API_TOKEN = os.environ.get('SDN_API_TOKEN') or None
+LOCAL_CLIENTS = ('127.0.0.1', '::1')
+
+
+class EventFeed(object):
+    """Ring buffer sự kiện đánh số tăng dần: client đọc tiếp từ số thứ tự đã thấy."""
+
+    def __init__(self, size=EVENT_BUFFER):
+        self.events = deque(maxlen=size)
+        self.seq = 0
+
+    def publish(self, kind, now=None, **fields):
+        self.seq += 1
+        fields['seq'] = self.seq
+        fields['ts'] = time.time() if now is None else now
+        fields['type'] = kind
+        self.events.append(fields)
+
+    def since(self, seq, limit=None):
+        """Sự kiện có số thứ tự > seq (cũ -> mới), tối đa limit."""
+        first = self.seq - len(self.events) + 1
+        start = max(seq + 1 - first, 0)
+        return list(islice(self.events, start, None if limit is None else start + limit))
+
+    def first(self):
+        return self.seq - len(self.events) + 1
+
+
+def chunks(items, size=API_CHUNK):
+    """Chia danh sách thành khúc; giữa hai khúc nhường event loop cho Packet-In / stats."""
+    for start in range(0, len(items), size):
+        if start:
+            hub.sleep(0)
+        yield items[start:start + size]
+
+
+def parse_ips(values):
+    """(IP hợp lệ dạng chuẩn, IP không hợp lệ) từ danh sách chuỗi."""
+    valid = []
+    invalid = []
+    for value in values or ():
+        try:
+            valid.append(str(ipaddress.IPv4Address(str(value).strip())))
+        except ValueError:
+            invalid.append(value)
+    return valid, invalid
+
+
+def _json(data, status=200):
+    return Response(status=status, content_type='application/json', charset='utf-8',
+                    body=json.dumps(data).encode('utf-8'))
+
+
+def _error(status, message):
+    return _json({'error': message}, status)
+
+
+def _int_param(req, name, default, low=0, high=None):
+    try:
+        value = int(req.GET.get(name, default))
+    except ValueError:
+        raise ValueError(f"{name} must be an integer")
+    if value < low:
+        raise ValueError(f"{name} must be >= {low}")
+    return value if high is None else min(value, high)
+
+
+def _request_token(req):
+    auth = req.headers.get('Authorization', '')
+    if auth.startswith('Bearer '):
+        return auth[len('Bearer '):].strip()
+    return req.headers.get('X-Auth-Token')
+
+
+def _rule_id(value):
+    # bool là int trong Python nhưng không phải id hợp lệ
+    if isinstance(value, bool) or not isinstance(value, (str, int)):
+        raise ValueError(f"rule id must be a string or an integer, got {value!r}")
+    return value
+
+
+def _duration(value):
+    # Như _rule_id: true/false không phải số giây
+    if (isinstance(value, bool) or not isinstance(value, (int, float))
+            or not math.isfinite(value) or value <= 0):
+        raise ValueError(f"duration must be a positive number of seconds, got {value!r}")
+    return value
+
+
+def _body(req):
+    try:
+        body = json.loads(req.body or b'{}')
+    except ValueError:
+        raise ValueError("Body must be JSON")
+    if not isinstance(body, dict):
+        raise ValueError("Body must be a JSON object")
+    return body
+
+
+class ManagementController(ControllerBase):
+    """
+    Endpoint dùng chung cho mọi app; app cung cấp phần mình hỗ trợ:
+    api_blocks / api_block / api_unblock, api_rules / api_update_rules, events (EventFeed).
+    Thiếu method -> 404.
+    """
+
+    def __init__(self, req, link, data, **config):
+        super(ManagementController, self).__init__(req, link, data, **config)
+        self.app = data[APP_KEY]
+
+    def _authorized(self, req):
+        if API_TOKEN is None:
+            return req.environ.get('REMOTE_ADDR') in LOCAL_CLIENTS
+        token = _request_token(req)
+        return token is not None and hmac.compare_digest(token.encode(), API_TOKEN.encode())
+
+    def _call(self, name, req, handler, mutating=False):
+        if mutating and not self._authorized(req):
+            if API_TOKEN is None:
+                return _error(403, "Set SDN_API_TOKEN to change state from a remote client")
+            return _error(401, "Missing or invalid API token")
+        method = getattr(self.app, name, None)
+        if method is None:
+            return _error(404, f"{self.app.__class__.__name__} does not support this endpoint")
+        try:
+            return handler(method)
+        except ValueError as e:
+            return _error(400, str(e))
+
+    def _page(self, req, method):
+        offset = _int_param(req, 'offset', 0)
+        limit = _int_param(req, 'limit', DEFAULT_PAGE, 1, MAX_PAGE)
+        total, items = method(offset, limit)
+        following = offset + len(items)
+        return _json({'total': total, 'offset': offset, 'limit': limit, 'items': items,
+                      'next': following if following < total else None})
+
+    @route('firewall_blocks', '/firewall/blocks', methods=['GET'])
+    def list_blocks(self, req, **kwargs):
+        return self._call('api_blocks', req, lambda method: self._page(req, method))
+
+    @route('firewall_block', '/firewall/blocks', methods=['POST'])
+    def add_blocks(self, req, **kwargs):
+        def handle(method):
+            body = _body(req)
+            ips, invalid = parse_ips(body.get('ips'))
+            duration = body.get('duration')
+            if duration is not None:
+                duration = _duration(duration)
+            result = method(ips, duration)
+            result['invalid'] = invalid
+            return _json(result)
+        return self._call('api_block', req, handle, mutating=True)
+
+    @route('firewall_unblock', '/firewall/blocks', methods=['DELETE'])
+    def remove_blocks(self, req, **kwargs):
+        def handle(method):
+            ips, invalid = parse_ips(_body(req).get('ips'))
+            result = method(ips)
+            result['invalid'] = invalid
+            return _json(result)
+        return self._call('api_unblock', req, handle, mutating=True)
+
+    @route('firewall_rules', '/firewall/rules', methods=['GET'])
+    def list_rules(self, req, **kwargs):
+        return self._call('api_rules', req, lambda method: self._page(req, method))
+
+    @route('firewall_rule_add', '/firewall/rules', methods=['POST'])
+    def add_rules(self, req, **kwargs):
+        def handle(method):
+            rules = _body(req).get('rules')
+            if not isinstance(rules, list) or not all(isinstance(r, dict) for r in rules):
+                raise ValueError("rules must be a list of rule objects")
+            # Luật trùng "id" thay thế luật cũ tại chỗ, luật mới nối vào cuối
+            new_ids = {}
+            for rule in rules:
+                if 'id' in rule:
+                    if _rule_id(rule['id']) in new_ids:
+                        raise ValueError(f"duplicate rule id {rule['id']!r}")
+                    new_ids[rule['id']] = rule
+            current = [new_ids.pop(rule['id'], rule) if 'id' in rule else rule
+                       for rule in self.app.acl_rules]
+            current.extend(rule for rule in rules if 'id' not in rule or rule['id'] in new_ids)
+            return _json(method(current))
+        return self._call('api_update_rules', req, handle, mutating=True)
+
+    @route('firewall_rule_remove', '/firewall/rules', methods=['DELETE'])
+    def remove_rules(self, req, **kwargs):
+        def handle(method):
+            ids = _body(req).get('ids')
+            if not isinstance(ids, list):
+                raise ValueError("ids must be a list")
+            ids = set(_rule_id(value) for value in ids)
+            return _json(method([rule for rule in self.app.acl_rules if rule.get('id') not in ids]))
+        return self._call('api_update_rules', req, handle, mutating=True)
+
+    @route('firewall_events', '/firewall/events', methods=['GET'])
+    def events(self, req, **kwargs):
+        feed = self.app.events
+        try:
+            since = _int_param(req, 'since', 0)
+            limit = _int_param(req, 'limit', DEFAULT_PAGE, 1, MAX_PAGE)
+        except ValueError as e:
+            return _error(400, str(e))
+        events = feed.since(since, limit)
+        return _json({'events': events, 'last': events[-1]['seq'] if events else since,
+                      'missed': since + 1 < feed.first()})
+
+    @route('firewall_event_stream', '/firewall/events/stream', methods=['GET'])
+    def stream(self, req, **kwargs):
+        feed = self.app.events
+        try:
+            since = _int_param(req, 'since', feed.seq)
+        except ValueError as e:
+            return _error(400, str(e))
+        # Gửi từng khúc ngay, không gom đủ 4 KB như mặc định của eventlet.wsgi
+        req.environ['eventlet.minimum_write_chunk_size'] = 0
+
+        def lines():
+            last = since
+            quiet = 0.0
+            while True:
+                events = feed.since(last, MAX_PAGE)
+                if events:
+                    last = events[-1]['seq']
+                    quiet = 0.0
+                    yield ''.join(json.dumps(event) + '\n' for event in events).encode('utf-8')
+                    continue
+                hub.sleep(STREAM_INTERVAL)
+                quiet += STREAM_INTERVAL
+                if quiet >= STREAM_HEARTBEAT:
+                    quiet = 0.0
+                    yield b'\n'
+        return Response(content_type='application/x-ndjson', charset='utf-8', app_iter=lines())
+
+
+def serve(app, wsgi):
+    """Đăng ký các endpoint /firewall/* cho app (wsgi = kwargs.get('wsgi'))."""
+    if wsgi is None:
+        return False
+    wsgi.register(ManagementController, {APP_KEY: app})
+    return True
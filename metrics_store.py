@@ -0,0 +1,244 @@
+# Tên file: metrics_store.py
+# Vai trò: Ghi số liệu giám sát (thay cho monitor.dat) + API đọc cho Dashboard
+# Mục đích: monitor.dat cũ mở/ghi/đóng file mỗi giây, đếm lại luật DENY ở mỗi
+#           lần ghi và lớn mãi không giới hạn. Ở đây mọi mẫu vào ring buffer trong
+#           RAM, được ghi theo lô dạng nhị phân kích thước cố định vào các segment
+#           xoay vòng theo dung lượng/thời gian; Dashboard đọc N giây cuối bằng
+#           tìm kiếm nhị phân trên timestamp (không phải đọc lại cả file).
+
+import os
+import struct
+import sys
+import time
+from collections import deque
+
+import numpy as np
+from ryu.lib import hub
+
+METRICS_DIR = 'metrics'          # Thư mục chứa các segment
+RING_SIZE = 4096                 # Số mẫu gần nhất giữ trong RAM
+FLUSH_INTERVAL = 2.0             # Chu kỳ ghi lô xuống đĩa (Giây)
+SAMPLE_INTERVAL = 1.0            # Chu kỳ chụp các gauge/counter (Giây)
+SEGMENT_BYTES = 4 * 1024 * 1024  # Xoay segment khi vượt dung lượng này
+SEGMENT_SECONDS = 3600           # ... hoặc khi segment đã mở lâu hơn (Giây)
+MAX_SEGMENTS = 24                # Số segment giữ lại (cũ hơn thì xoá)
+
+# Định dạng file: MAGIC + các bản ghi (ts float64, metric uint16, key uint64, value float64)
+# key 64 bit: dpid thật của OVS dùng đủ 64 bit (SDNMET1 cũ chỉ có uint32, không đọc nữa)
+MAGIC = b'SDNMET2\n'
+RECORD = struct.Struct('<dHQd')
+DTYPE = np.dtype([('ts', '<f8'), ('metric', '<u2'), ('key', '<u8'), ('value', '<f8')])
+
+# Mã số liệu (key: 0, dpid hoặc IP dạng int tuỳ số liệu)
+METRIC_MODE = 1          # Trạng thái Dashboard: 1 = nguy hiểm (đỏ), 2 = an toàn (xanh)
+METRIC_BLOCKED = 2       # Số luật DENY / số IP đang bị chặn
+METRIC_FLOWS = 3         # Số flow ACL đã biên dịch
+METRIC_PPS = 4           # PPS của switch ở lượt poll (key = dpid)
+METRIC_SOURCE_PPS = 5    # PPS của một IP nguồn (key = IP dạng int)
+METRIC_STATE_BYTES = 6   # Bộ nhớ trạng thái ước lượng của một switch (key = dpid)
+
+METRIC_NAMES = {
+    METRIC_MODE: 'mode',
+    METRIC_BLOCKED: 'blocked',
+    METRIC_FLOWS: 'flows',
+    METRIC_PPS: 'pps',
+    METRIC_SOURCE_PPS: 'source_pps',
+    METRIC_STATE_BYTES: 'state_bytes',
+}
+
+
+def segment_name(prefix, start):
+    """Tên segment sắp xếp được theo thời gian bắt đầu: prefix-<ms>.bin"""
+    return f"{prefix}-{int(start * 1000):013d}.bin"
+
+
+def list_segments(directory, prefix):
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return []
+    head = prefix + '-'
+    return sorted(os.path.join(directory, name) for name in names
+                  if name.startswith(head) and name.endswith('.bin'))
+
+
+class MetricsWriter(object):
+    """
+    Nơi các app publish số liệu.
+    - publish(): một mẫu -> ring buffer + bộ đệm ghi (chưa chạm đĩa).
+    - set()/add(): gauge/counter cập nhật tăng dần; sample() chụp giá trị hiện tại.
+    - flush(): ghi cả lô bằng một lần write, xoay segment nếu cần.
+    """
+
+    def __init__(self, prefix, directory=METRICS_DIR, ring_size=RING_SIZE,
+                 flush_interval=FLUSH_INTERVAL, segment_bytes=SEGMENT_BYTES,
+                 segment_seconds=SEGMENT_SECONDS, max_segments=MAX_SEGMENTS):
+        self.prefix = prefix
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.max_segments = max_segments
+        self.ring = deque(maxlen=ring_size)   # [(ts, metric, key, value)]
+        self.pending = bytearray()
+        self.gauges = {}                      # {(metric, key): giá trị hiện tại}
+        self.file = None
+        self.opened_at = 0.0
+        self.written = 0
+        self.records = 0
+
+    def publish(self, metric, value, key=0, now=None):
+        if now is None:
+            now = time.time()
+        self.ring.append((now, metric, key, value))
+        self.pending += RECORD.pack(now, metric, key, value)
+
+    def set(self, metric, value, key=0):
+        self.gauges[(metric, key)] = value
+
+    def add(self, metric, delta, key=0):
+        self.gauges[(metric, key)] = self.gauges.get((metric, key), 0) + delta
+
+    def get(self, metric, key=0):
+        return self.gauges.get((metric, key), 0)
+
+    def sample(self, now=None):
+        """Publish giá trị hiện tại của mọi gauge (không quét lại dữ liệu gốc)."""
+        if now is None:
+            now = time.time()
+        for (metric, key), value in self.gauges.items():
+            self.publish(metric, value, key, now)
+
+    def last(self, seconds, metric=None, now=None):
+        """Các mẫu trong RAM của `seconds` giây cuối (cũ -> mới), không đọc đĩa."""
+        if now is None:
+            now = time.time()
+        cutoff = now - seconds
+        out = []
+        for record in reversed(self.ring):
+            if record[0] < cutoff:
+                break
+            if metric is None or record[1] == metric:
+                out.append(record)
+        out.reverse()
+        return out
+
+    def _open(self, now):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, segment_name(self.prefix, now))
+        self.file = open(path, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(MAGIC)
+        self.opened_at = now
+        self.written = self.file.tell()
+        # Giữ tối đa max_segments segment (kể cả segment vừa mở)
+        for old in list_segments(self.directory, self.prefix)[:-self.max_segments]:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+
+    def flush(self, now=None):
+        if not self.pending:
+            return 0
+        if now is None:
+            now = time.time()
+        if self.file is not None and (self.written + len(self.pending) > self.segment_bytes
+                                      or now - self.opened_at >= self.segment_seconds):
+            self.file.close()
+            self.file = None
+        if self.file is None:
+            self._open(now)
+        data = bytes(self.pending)
+        self.pending.clear()
+        self.file.write(data)
+        self.file.flush()
+        self.written += len(data)
+        count = len(data) // RECORD.size
+        self.records += count
+        return count
+
+    def close(self):
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def run(self, sample_interval=SAMPLE_INTERVAL):
+        """Vòng lặp (hub thread): chụp gauge mỗi sample_interval, ghi đĩa mỗi flush_interval."""
+        next_flush = time.time() + self.flush_interval
+        while True:
+            hub.sleep(sample_interval)
+            now = time.time()
+            self.sample(now)
+            if now >= next_flush:
+                self.flush(now)
+                next_flush = now + self.flush_interval
+
+
+class MetricsReader(object):
+    """Đọc các segment của một prefix (tiến trình Dashboard, không cần controller)."""
+
+    def __init__(self, prefix, directory=METRICS_DIR):
+        self.prefix = prefix
+        self.directory = directory
+
+    @staticmethod
+    def _load(path):
+        """Bản ghi của một segment dưới dạng mảng NumPy (memmap, chỉ đọc phần cần)."""
+        try:
+            size = os.path.getsize(path)
+            with open(path, 'rb') as f:
+                if f.read(len(MAGIC)) != MAGIC:
+                    return None    # Segment định dạng khác (bản cũ)
+        except OSError:
+            return None
+        count = (size - len(MAGIC)) // DTYPE.itemsize   # Bỏ bản ghi đang ghi dở
+        if count <= 0:
+            return None
+        return np.memmap(path, dtype=DTYPE, mode='r', offset=len(MAGIC), shape=(count,))
+
+    def last(self, seconds, metric=None, key=None, now=None):
+        """Các bản ghi của `seconds` giây cuối (mảng có cột ts/metric/key/value)."""
+        if now is None:
+            now = time.time()
+        cutoff = now - seconds
+        parts = []
+        for path in reversed(list_segments(self.directory, self.prefix)):
+            records = self._load(path)
+            if records is None:
+                continue
+            start = int(np.searchsorted(records['ts'], cutoff))
+            parts.append(np.array(records[start:]))
+            if start > 0:
+                break
+        if not parts:
+            return np.empty(0, dtype=DTYPE)
+        out = np.concatenate(parts[::-1])
+        if metric is not None:
+            out = out[out['metric'] == metric]
+        if key is not None:
+            out = out[out['key'] == key]
+        return out
+
+    def stream(self, seconds, metric=None, key=None, interval=1.0):
+        """Generator cho Dashboard: N giây cuối, sau đó chỉ các bản ghi mới."""
+        records = self.last(seconds, metric, key)
+        since = records['ts'][-1] if len(records) else time.time() - seconds
+        yield records
+        while True:
+            time.sleep(interval)
+            now = time.time()
+            records = self.last(now - since, metric, key, now)
+            records = records[records['ts'] > since]
+            if len(records):
+                since = records['ts'][-1]
+                yield records
+
+
+if __name__ == '__main__':
+    # python metrics_store.py <prefix> [giây]: in CSV ts,metric,key,value
+    prefix = sys.argv[1] if len(sys.argv) > 1 else 'static'
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 60
+    for ts, metric, key, value in MetricsReader(prefix).last(seconds):
+        print(f"{ts:.3f},{METRIC_NAMES.get(int(metric), metric)},{key},{value:g}")
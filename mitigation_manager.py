@@ -0,0 +1,242 @@
+# Tên file: mitigation_manager.py
+# Vai trò: Quản lý tập trung các IP bị chặn trên toàn mạng (vị trí đặt luật + hạn)
+# Mục đích: Trước đây luật DROP chỉ nằm ở switch phát hiện ra tấn công, nên lưu
+#           lượng tấn công vẫn đi qua các switch/đường truyền khác và mỗi switch
+#           tự phát hiện lại. Ở đây IP nguồn được định vị về switch/cổng biên nơi
+#           MAC của nó được học (mac_to_port), mỗi IP chỉ có một hạn chặn chung và
+#           chỉ được đặt ở những switch cần thiết; luật của nhiều switch được đẩy
+#           cùng lúc (Barrier của các switch chờ song song).
+
+import time
+
+from prefix_planner import MitigationPlanner, ip_to_int
+from state_store import TimerWheel, container_bytes
+
+MAX_HOSTS = 65536    # Số cặp IP -> MAC ghi nhớ (LRU, IP giả mạo không làm phình bảng)
+
+
+class HostLocator(object):
+    """
+    IP nguồn -> MAC (học từ Packet-In IPv4) -> (dpid, cổng) qua các MacTable.
+    Một MAC có thể được học ở nhiều switch (cổng nối giữa các switch); cổng biên
+    là cổng có ít MAC nhất (cổng nối host thường chỉ có 1).
+    """
+
+    def __init__(self, mac_tables, max_hosts=MAX_HOSTS):
+        self.mac_tables = mac_tables    # {dpid: MacTable} - dùng chung với app
+        self.max_hosts = max_hosts
+        self.macs = {}                  # {ip (int): mac (int)}, thứ tự = LRU
+
+    def __len__(self):
+        return len(self.macs)
+
+    def learn(self, ip, mac):
+        macs = self.macs
+        if macs.get(ip) == mac:
+            return
+        macs.pop(ip, None)
+        if len(macs) >= self.max_hosts:
+            del macs[next(iter(macs))]
+        macs[ip] = mac
+
+    def locate(self, ip):
+        """[(dpid, port)] của (các) cổng biên gần IP nhất; [] nếu chưa biết."""
+        mac = self.macs.get(ip_to_int(ip) if ip.__class__ is str else ip)
+        if mac is None:
+            return []
+        best = []
+        best_load = None
+        for dpid, table in self.mac_tables.items():
+            port = table.get(mac)
+            if port is None:
+                continue
+            load = table.port_load(port)
+            if best_load is None or load < best_load:
+                best, best_load = [(dpid, port)], load
+            elif load == best_load:
+                best.append((dpid, port))
+        return best
+
+    def memory(self):
+        return container_bytes(self.macs)
+
+
+class PushRound(object):
+    """
+    Một lượt đẩy luật chặn tới nhiều switch: FlowMod + Barrier của mọi switch được
+    gửi trước, rồi mới chờ; callback(round) khi switch cuối cùng xác nhận.
+    """
+    __slots__ = ('started', 'waiting', 'sealed', 'switches', 'failed', 'latency', 'callback')
+
+    def __init__(self, callback, now=None):
+        self.started = time.time() if now is None else now
+        self.waiting = 0
+        self.sealed = False
+        self.switches = 0
+        self.failed = []
+        self.latency = None
+        self.callback = callback
+
+    def expect(self):
+        self.waiting += 1
+        self.switches += 1
+
+    def done(self, batch):
+        self.waiting -= 1
+        if not batch.ok:
+            self.failed.append(batch.dpid)
+        self._finish()
+
+    def seal(self):
+        """Đã gửi xong cho mọi switch của lượt này."""
+        self.sealed = True
+        self._finish()
+
+    def _finish(self):
+        if self.sealed and self.waiting == 0 and self.latency is None and self.switches:
+            self.latency = time.time() - self.started
+            self.callback(self)
+
+
+class MitigationManager(object):
+    """
+    - block(ip, fallback): đặt luật ở switch biên của IP (hoặc ở `fallback` khi
+      chưa định vị được); IP đã bị chặn thì không đặt lại ở switch khác.
+    - relocate(ip): IP đã bị chặn nay định vị được ở switch biên khác nơi đặt luật ->
+      chuyển luật (cả hai phía được đánh dấu dirty; app thêm trước, xoá sau).
+    - blocked: {ip: hạn chặn} chung cho cả mạng; planners: luật prefix theo switch.
+    - expire(now): bỏ IP hết hạn (một timer wheel trung tâm) + đánh dấu switch cần sync.
+    - unblock(ip): gỡ chặn trước hạn (REST API), switch chứa luật được đánh dấu dirty.
+    - restore(ip, until, edges): nạp lại từ snapshot khi controller khởi động.
+    - take_dirty(): các switch có thay đổi cần đẩy ở lượt push tiếp theo.
+    """
+
+    def __init__(self, locator, max_rules, min_prefix_len, block_duration):
+        self.locator = locator
+        self.max_rules = max_rules
+        self.min_prefix_len = min_prefix_len
+        self.block_duration = block_duration
+        self.planners = {}      # {dpid: MitigationPlanner}
+        self.blocked = {}       # {ip: hạn chặn}
+        self.placement = {}     # {ip: {dpid}} - nơi đặt luật của IP
+        self.wheel = TimerWheel()
+        self.dirty = set()
+        self.located = 0        # Số IP đặt được ở switch biên
+        self.unlocated = 0
+
+    def __len__(self):
+        return len(self.blocked)
+
+    def __contains__(self, ip):
+        return ip in self.blocked
+
+    def planner(self, dpid):
+        planner = self.planners.get(dpid)
+        if planner is None:
+            planner = self.planners[dpid] = MitigationPlanner(self.max_rules, self.min_prefix_len,
+                                                              self.block_duration)
+        return planner
+
+    def block(self, ip, fallback=(), now=None, locate=True, duration=None):
+        """Chặn IP; trả về tập dpid đặt luật (rỗng nếu IP đã bị chặn hoặc không có nơi đặt)."""
+        if ip in self.blocked:
+            return set()
+        if now is None:
+            now = time.time()
+        if duration is None:
+            duration = self.block_duration
+        edges = {dpid for dpid, _ in self.locator.locate(ip)} if locate else set()
+        if edges:
+            self.located += 1
+        else:
+            edges = set(fallback)
+            self.unlocated += 1
+        if not edges:
+            return edges
+        until = now + duration
+        self.blocked[ip] = until
+        self.placement[ip] = edges
+        self.wheel.schedule(ip, until)
+        for dpid in edges:
+            self.planner(dpid).block(ip, now, duration)
+        self.dirty |= edges
+        return edges
+
+    def relocate(self, ip, now=None):
+        """Chuyển luật của IP đã bị chặn về switch biên; trả về tập dpid mới (rỗng nếu giữ nguyên)."""
+        until = self.blocked.get(ip)
+        if until is None:
+            return set()
+        edges = {dpid for dpid, _ in self.locator.locate(ip)}
+        old = self.placement.get(ip, set())
+        if not edges or edges == old:
+            return set()
+        if now is None:
+            now = time.time()
+        for dpid in edges - old:
+            self.planner(dpid).block(ip, now, until - now)
+        for dpid in old - edges:
+            planner = self.planners.get(dpid)
+            if planner is not None:
+                planner.unblock(ip)
+        self.placement[ip] = edges
+        self.located += 1
+        self.dirty |= edges | old
+        return edges
+
+    def unblock(self, ip):
+        """Gỡ chặn trước hạn; trả về tập dpid cần sync lại (rỗng nếu IP không bị chặn)."""
+        if self.blocked.pop(ip, None) is None:
+            return set()
+        edges = self.placement.pop(ip, set())
+        for dpid in edges:
+            planner = self.planners.get(dpid)
+            if planner is not None:
+                planner.unblock(ip)
+        self.dirty |= edges
+        return edges
+
+    def expire(self, now=None):
+        """IP hết hạn (dạng chuỗi); switch có prefix thay đổi được đánh dấu dirty."""
+        if now is None:
+            now = time.time()
+        for dpid, planner in self.planners.items():
+            if planner.expire(now):
+                self.dirty.add(dpid)
+        gone = []
+        for ip in self.wheel.advance(now):
+            until = self.blocked.get(ip)
+            if until is not None and until <= now:
+                del self.blocked[ip]
+                self.placement.pop(ip, None)
+                gone.append(ip)
+        return gone
+
+    def restore(self, ip, until, edges, now=None):
+        """Nạp lại một IP bị chặn từ snapshot; luật trên switch được đối chiếu khi switch kết nối."""
+        if now is None:
+            now = time.time()
+        if until <= now or ip in self.blocked:
+            return False
+        self.blocked[ip] = until
+        self.placement[ip] = set(edges)
+        self.wheel.schedule(ip, until)
+        for dpid in edges:
+            self.planner(dpid).block(ip, now, until - now)
+        return True
+
+    def remove(self, dpid):
+        """
+        Switch ngắt kết nối: luật chặn vẫn nằm trên switch tới hard timeout, nên tập IP
+        của nó được giữ lại; lần kết nối sau đối chiếu với flow thật (Reconciler).
+        """
+        self.dirty.discard(dpid)
+
+    def take_dirty(self):
+        dirty = self.dirty
+        self.dirty = set()
+        return dirty
+
+    def memory(self):
+        return (container_bytes(self.blocked, self.placement) + self.wheel.memory()
+                + self.locator.memory())
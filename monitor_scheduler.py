@@ -0,0 +1,135 @@
+# Tên file: monitor_scheduler.py
+# Vai trò: Bộ lập lịch polling thích nghi, rải đều theo thời gian cho nhiều switch
+# Mục đích: Tránh "bão reply" khi gửi stats request cho mọi switch cùng lúc,
+#           và phản ứng nhanh hơn với switch đang có tốc độ gần THRESHOLD_PPS.
+
+import heapq
+import time
+
+# Phân số vàng: rải offset ban đầu đều trên chu kỳ dù số switch thay đổi
+GOLDEN_RATIO = 0.6180339887498949
+
+# Tỉ lệ (PPS cao nhất / THRESHOLD_PPS) để thu ngắn / giãn chu kỳ polling
+NEAR_RATIO = 0.5
+QUIET_RATIO = 0.1
+SHRINK_FACTOR = 0.5
+GROW_FACTOR = 1.25
+
+
+class PollState(object):
+    """Trạng thái polling của một switch."""
+    __slots__ = ('dpid', 'interval', 'due', 'sent_at', 'in_flight',
+                 'lag', 'latency', 'timeouts')
+
+    def __init__(self, dpid, interval, due):
+        self.dpid = dpid
+        self.interval = interval
+        self.due = due              # Thời điểm cần poll tiếp theo
+        self.sent_at = 0.0
+        self.in_flight = False
+        self.lag = 0.0              # Trễ giữa thời điểm cần poll và lúc gửi thật
+        self.latency = 0.0          # Thời gian chờ reply của lần poll gần nhất
+        self.timeouts = 0
+
+
+class MonitorScheduler(object):
+    """
+    Mỗi switch có chu kỳ riêng trong [min_interval, max_interval]:
+    - Tốc độ gần ngưỡng (>= NEAR_RATIO) -> chu kỳ ngắn lại (phát hiện nhanh hơn).
+    - Mạng yên tĩnh (< QUIET_RATIO) -> chu kỳ giãn ra (giảm tải controller).
+    Số request đang chờ reply bị giới hạn bởi max_in_flight; reply quá
+    reply_timeout bị coi là mất và switch được xếp lịch lại.
+    """
+
+    def __init__(self, period, min_interval, max_interval, max_in_flight, reply_timeout):
+        self.period = period
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.max_in_flight = max_in_flight
+        self.reply_timeout = reply_timeout
+        self.states = {}     # {dpid: PollState}
+        self._heap = []      # [(due, dpid)] - mục cũ bị bỏ qua khi lấy ra
+        self._in_flight = 0
+        self._added = 0
+
+    def add(self, dpid, now=None):
+        if now is None:
+            now = time.time()
+        offset = (self._added * GOLDEN_RATIO) % 1.0 * self.period
+        self._added += 1
+        state = PollState(dpid, self.period, now + offset)
+        old = self.states.get(dpid)
+        if old is not None and old.in_flight:
+            self._in_flight -= 1
+        self.states[dpid] = state
+        heapq.heappush(self._heap, (state.due, dpid))
+
+    def remove(self, dpid):
+        state = self.states.pop(dpid, None)
+        if state is not None and state.in_flight:
+            self._in_flight -= 1
+
+    def poll(self, now=None):
+        """Trả về danh sách dpid đến hạn poll (đánh dấu đang chờ reply)."""
+        if now is None:
+            now = time.time()
+        heap = self._heap
+        ready = []
+        while heap and heap[0][0] <= now and self._in_flight < self.max_in_flight:
+            due, dpid = heapq.heappop(heap)
+            state = self.states.get(dpid)
+            if state is None or state.in_flight or state.due != due:
+                continue
+            state.in_flight = True
+            state.sent_at = now
+            state.lag = now - due
+            self._in_flight += 1
+            ready.append(dpid)
+        return ready
+
+    def _reschedule(self, state, now):
+        state.in_flight = False
+        self._in_flight -= 1
+        # Giữ nhịp theo mốc gửi, không cộng dồn độ trễ của reply
+        state.due = max(state.sent_at + state.interval, now)
+        heapq.heappush(self._heap, (state.due, state.dpid))
+
+    def complete(self, dpid, ratio, now=None):
+        """
+        Ghi nhận reply của một lượt poll và điều chỉnh chu kỳ.
+        ratio = PPS cao nhất quan sát được / THRESHOLD_PPS.
+        Trả về độ trễ reply (Giây), None nếu switch không có poll đang chờ.
+        """
+        state = self.states.get(dpid)
+        if state is None or not state.in_flight:
+            return None
+        if now is None:
+            now = time.time()
+        state.latency = now - state.sent_at
+        if ratio >= NEAR_RATIO:
+            state.interval = max(self.min_interval, state.interval * SHRINK_FACTOR)
+        elif ratio < QUIET_RATIO:
+            state.interval = min(self.max_interval, state.interval * GROW_FACTOR)
+        self._reschedule(state, now)
+        return state.latency
+
+    def expire(self, now=None):
+        """Giải phóng các request quá reply_timeout; trả về danh sách dpid bị timeout."""
+        if now is None:
+            now = time.time()
+        expired = []
+        for state in self.states.values():
+            if state.in_flight and now - state.sent_at > self.reply_timeout:
+                state.timeouts += 1
+                state.latency = now - state.sent_at
+                # Switch chậm trả lời -> giãn chu kỳ để không dồn thêm request
+                state.interval = min(self.max_interval, state.interval * GROW_FACTOR)
+                self._reschedule(state, now)
+                expired.append(state.dpid)
+        return expired
+
+    def metrics(self):
+        """Số liệu theo switch: chu kỳ hiện tại, poll lag, độ trễ reply, số lần timeout."""
+        return {dpid: {'interval': s.interval, 'lag': s.lag,
+                       'latency': s.latency, 'timeouts': s.timeouts}
+                for dpid, s in self.states.items()}
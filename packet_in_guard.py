@@ -0,0 +1,66 @@
+# Tên file: packet_in_guard.py
+# Vai trò: Bộ kiểm soát Packet-In (Token Bucket theo dpid + in_port)
+# Mục đích: Flood với IP/MAC nguồn giả mạo biến mỗi gói thành một Packet-In.
+#           Giới hạn ngân sách Packet-In của mỗi cổng để controller vẫn phản hồi được.
+
+import time
+
+# Kết quả kiểm tra
+ADMIT = 0       # Cho xử lý bình thường
+DROP = 1        # Vượt ngân sách -> bỏ qua Packet-In này
+SUPPRESS = 2    # Vượt ngân sách liên tục -> cài luật chặn tạm thời trên switch
+
+
+class TokenBucket(object):
+    __slots__ = ('tokens', 'last', 'rejected', 'suppressed_until')
+
+    def __init__(self, tokens, now):
+        self.tokens = tokens
+        self.last = now
+        self.rejected = 0             # Số Packet-In bị từ chối liên tiếp
+        self.suppressed_until = 0.0
+
+
+class PacketInGuard(object):
+    """
+    Mỗi cặp (dpid, in_port) có một token bucket: rate token/giây, tối đa burst token.
+    Sau suppress_after lần từ chối liên tiếp, admit() trả về SUPPRESS đúng một lần
+    cho mỗi suppress_duration để app cài luật drop/meter trên switch.
+    """
+
+    def __init__(self, rate, burst, suppress_after, suppress_duration):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.suppress_after = suppress_after
+        self.suppress_duration = suppress_duration
+        self.buckets = {}     # {(dpid << 32) | in_port: TokenBucket}
+        self.admitted = 0
+        self.dropped = 0
+
+    def admit(self, dpid, in_port, now=None):
+        if now is None:
+            now = time.monotonic()
+        key = (dpid << 32) | in_port
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(self.burst, now)
+        else:
+            tokens = bucket.tokens + (now - bucket.last) * self.rate
+            bucket.tokens = tokens if tokens < self.burst else self.burst
+            bucket.last = now
+
+        if bucket.tokens >= 1.0:
+            bucket.tokens -= 1.0
+            bucket.rejected = 0
+            self.admitted += 1
+            return ADMIT
+
+        self.dropped += 1
+        bucket.rejected += 1
+        if bucket.rejected >= self.suppress_after and now >= bucket.suppressed_until:
+            bucket.suppressed_until = now + self.suppress_duration
+            return SUPPRESS
+        return DROP
+
+    def remove(self, dpid):
+        self.buckets = {key: b for key, b in self.buckets.items() if key >> 32 != dpid}
@@ -0,0 +1,267 @@
+# Tên file: prefix_planner.py
+# Vai trò: Lập kế hoạch luật chặn theo prefix (gộp CIDR) cho tấn công phân tán
+# Mục đích: Botnet / IP giả mạo trong một dải /16 không còn chiếm một flow entry
+#           cho mỗi IP: tập IP bị chặn được giữ trong prefix trie và gộp thành
+#           số ít luật ipv4_src có mask, tối đa max_rules luật mỗi switch.
+
+import heapq
+import math
+import socket
+import struct
+import time
+
+from state_store import TimerWheel, container_bytes
+
+
+def ip_to_int(ip):
+    return struct.unpack('!I', socket.inet_aton(ip))[0]
+
+
+def int_to_ip(value):
+    return socket.inet_ntoa(struct.pack('!I', value))
+
+
+def prefix_mask(plen):
+    return (0xffffffff << (32 - plen)) & 0xffffffff
+
+
+def prefix_text(net, plen):
+    """(net, plen) -> '10.0.0.0/16' (dùng cho log)."""
+    return f"{int_to_ip(net)}/{plen}"
+
+
+def ipv4_src_field(net, plen):
+    """Giá trị ipv4_src cho OFPMatch: IP đơn hoặc (IP, mask)."""
+    if plen == 32:
+        return int_to_ip(net)
+    return (int_to_ip(net), int_to_ip(prefix_mask(plen)))
+
+
+def ipv4_src_prefix(field):
+    """Ngược của ipv4_src_field: giá trị ipv4_src trong match của switch -> (net, plen)."""
+    if isinstance(field, tuple):
+        net, plen = ip_to_int(field[0]), bin(ip_to_int(field[1])).count('1')
+    else:
+        net, plen = ip_to_int(field), 32
+    return net & prefix_mask(plen), plen
+
+
+class MitigationPlanner(object):
+    """
+    Tập IP bị chặn của một switch.
+    - Trie theo tầng: counts[(plen, net >> (32 - plen))] = số IP bị chặn trong prefix,
+      với mọi plen từ min_prefix_len đến 32 (mỗi IP cập nhật 32 - min + 1 nút).
+    - plan(): phủ "an toàn" nhỏ nhất (chỉ các prefix mà mọi địa chỉ đều bị chặn);
+      nếu vượt max_rules thì gộp các luật kề nhau có chi phí (số địa chỉ vô tội bị
+      chặn oan) thấp nhất, không bao giờ rộng hơn /min_prefix_len.
+    - sync(): so với các luật đang cài -> (cần thêm, cần xoá). Khi IP hết hạn,
+      prefix tự co lại / tách ra ở lần sync tiếp theo.
+    """
+
+    def __init__(self, max_rules, min_prefix_len, block_duration):
+        self.max_rules = max_rules
+        self.min_prefix_len = min_prefix_len
+        self.block_duration = block_duration
+        self.expiry = {}       # {ip (int): thời điểm hết hạn}
+        self.counts = {}       # {(plen, prefix): số IP bị chặn}
+        self.installed = {}    # {(net, plen): thời điểm hết hạn của luật trên switch}
+        self.wheel = TimerWheel()   # Hết hạn IP không cần quét toàn bộ expiry
+
+    def __len__(self):
+        return len(self.expiry)
+
+    def __contains__(self, ip):
+        return ip_to_int(ip) in self.expiry
+
+    def _add_counts(self, addr, delta):
+        counts = self.counts
+        for plen in range(32, self.min_prefix_len - 1, -1):
+            key = (plen, addr >> (32 - plen))
+            value = counts.get(key, 0) + delta
+            if value:
+                counts[key] = value
+            else:
+                del counts[key]
+
+    def block(self, ip, now=None, duration=None):
+        """Chặn (hoặc gia hạn) một IP. Trả về True nếu IP mới."""
+        if now is None:
+            now = time.time()
+        if duration is None:
+            duration = self.block_duration
+        addr = ip_to_int(ip)
+        new = addr not in self.expiry
+        self.expiry[addr] = now + duration
+        if new:
+            self._add_counts(addr, 1)
+            self.wheel.schedule(addr, now + duration)
+        return new
+
+    def unblock(self, ip):
+        """Gỡ chặn trước hạn (mục trong wheel tự bị bỏ qua). Trả về True nếu IP đang bị chặn."""
+        addr = ip_to_int(ip)
+        if self.expiry.pop(addr, None) is None:
+            return False
+        self._add_counts(addr, -1)
+        return True
+
+    def expire(self, now=None):
+        """Bỏ các IP đã hết hạn; trả về danh sách IP (dạng chuỗi)."""
+        if now is None:
+            now = time.time()
+        gone = []
+        for addr in self.wheel.advance(now):
+            until = self.expiry.get(addr)
+            if until is None:
+                continue
+            if until > now:
+                self.wheel.schedule(addr, until)   # Đã được gia hạn
+                continue
+            del self.expiry[addr]
+            self._add_counts(addr, -1)
+            gone.append(addr)
+        return [int_to_ip(addr) for addr in gone]
+
+    def _exact_cover(self):
+        """Các prefix lớn nhất mà toàn bộ địa chỉ đều bị chặn (gộp CIDR không chặn oan)."""
+        counts = self.counts
+        top = set()
+        for addr in self.expiry:
+            plen = 32
+            while plen > self.min_prefix_len:
+                parent = plen - 1
+                if counts.get((parent, addr >> (32 - parent)), 0) != 1 << (32 - parent):
+                    break
+                plen = parent
+            top.add(((addr >> (32 - plen)) << (32 - plen), plen))
+        return sorted(top)
+
+    def _merge_cost(self, left, right):
+        """Prefix nhỏ nhất chứa cả 2 luật và số địa chỉ vô tội nó phủ thêm."""
+        start = left[0]
+        last = right[0] + (1 << (32 - right[1])) - 1
+        plen = 32 - (start ^ last).bit_length()
+        if plen < self.min_prefix_len:
+            return None
+        net = start & prefix_mask(plen)
+        blocked = self.counts.get((plen, net >> (32 - plen)), 0)
+        return (1 << (32 - plen)) - blocked, net, plen
+
+    def plan(self):
+        """Danh sách luật [(net, plen)] đã sắp xếp, tối đa max_rules (nếu có thể)."""
+        rules = self._exact_cover()
+        if len(rules) <= self.max_rules:
+            return rules
+
+        # Danh sách liên kết đôi trên các luật đã sắp xếp + heap các cặp kề nhau
+        nodes = list(rules)
+        prev = list(range(-1, len(nodes) - 1))
+        nxt = list(range(1, len(nodes) + 1))
+        nxt[-1] = -1
+        alive = [True] * len(nodes)
+        heap = []
+
+        def push(i, j):
+            if i < 0 or j < 0:
+                return
+            merged = self._merge_cost(nodes[i], nodes[j])
+            if merged is not None:
+                heapq.heappush(heap, (merged[0], i, j, merged[1], merged[2]))
+
+        for i in range(len(nodes) - 1):
+            push(i, i + 1)
+
+        count = len(nodes)
+        while count > self.max_rules and heap:
+            _, i, j, net, plen = heapq.heappop(heap)
+            if not (alive[i] and alive[j] and nxt[i] == j):
+                continue
+            end = net + (1 << (32 - plen))
+            # Prefix mới có thể nuốt cả các luật lân cận nằm trong nó
+            left, right = i, j
+            while prev[left] >= 0 and nodes[prev[left]][0] >= net:
+                left = prev[left]
+            while nxt[right] >= 0 and nodes[nxt[right]][0] < end:
+                right = nxt[right]
+            k = left
+            while True:
+                alive[k] = False
+                count -= 1
+                if k == right:
+                    break
+                k = nxt[k]
+
+            nodes.append((net, plen))
+            alive.append(True)
+            new = len(nodes) - 1
+            prev.append(prev[left])
+            nxt.append(nxt[right])
+            if prev[left] >= 0:
+                nxt[prev[left]] = new
+            if nxt[right] >= 0:
+                prev[nxt[right]] = new
+            count += 1
+            push(prev[new], new)
+            push(new, nxt[new])
+
+        return sorted(node for node, ok in zip(nodes, alive) if ok)
+
+    def _rule_expiry(self, rules):
+        """Mỗi luật sống đến khi IP bị chặn cuối cùng bên trong nó hết hạn."""
+        out = {}
+        addrs = sorted(self.expiry)
+        k = 0
+        for net, plen in rules:
+            end = net + (1 << (32 - plen))
+            while k < len(addrs) and addrs[k] < net:
+                k += 1
+            until = 0.0
+            while k < len(addrs) and addrs[k] < end:
+                until = max(until, self.expiry[addrs[k]])
+                k += 1
+            out[(net, plen)] = until
+        return out
+
+    def sync(self, now=None):
+        """
+        Tính chênh lệch so với các luật đang cài.
+        Trả về (to_add [(net, plen, hard_timeout)], to_delete [(net, plen)]).
+        Luật có hạn mới xa hơn được ADD lại (OFPFC_ADD thay thế và đặt lại timeout).
+        """
+        if now is None:
+            now = time.time()
+        desired = self._rule_expiry(self.plan())
+        to_delete = [rule for rule in self.installed if rule not in desired]
+        to_add = []
+        for rule, until in desired.items():
+            current = self.installed.get(rule)
+            if current is None or until > current + 1:
+                timeout = min(max(int(math.ceil(until - now)), 1), 0xffff)
+                to_add.append((rule[0], rule[1], timeout))
+        self.installed = desired
+        return to_add, to_delete
+
+    def adopt(self, rules):
+        """
+        Luật đang có thật trên switch (đối chiếu khi kết nối): {(net, plen): hạn}. Luật
+        không chứa IP nào đang bị chặn (trạng thái đã mất) không được nhận: switch tự gỡ
+        khi hết hard timeout thay vì bỏ chặn sớm. Trả về số luật được nhận.
+        """
+        counts = self.counts
+        self.installed = {(net, plen): until for (net, plen), until in rules.items()
+                          if counts.get((plen, net >> (32 - plen)))}
+        return len(self.installed)
+
+    def invalidate(self):
+        """Switch từ chối luật -> lần sync sau cài lại toàn bộ."""
+        self.installed = {}
+
+    def removed(self, net, plen):
+        """Switch báo luật đã bị gỡ (EventOFPFlowRemoved) -> không còn coi là đang cài."""
+        return self.installed.pop((net, plen), None) is not None
+
+    def memory(self):
+        return container_bytes(self.expiry, self.counts, self.installed) + self.wheel.memory()
+
+    def rules(self):
+        return sorted(self.installed)
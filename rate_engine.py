@@ -0,0 +1,298 @@
+# Tên file: rate_engine.py
+# Vai trò: Bộ tính tốc độ (PPS/BPS) theo IP nguồn dùng mảng NumPy cấp phát sẵn
+# Mục đích: Thay vòng lặp dict lồng nhau trong _flow_stats_reply_handler,
+#           để mỗi reply hàng chục nghìn flow vẫn xử lý kịp trong MONITOR_PERIOD.
+
+import time
+import numpy as np
+
+from prefix_planner import ip_to_int
+from state_store import container_bytes
+
+# Khoảng thời gian tối thiểu giữa 2 mẫu để tính tốc độ (tránh chia cho 0)
+MIN_TIME_DIFF = 0.1
+# Số slot cấp phát ban đầu cho mỗi switch (tự nhân đôi khi đầy)
+INITIAL_CAPACITY = 1024
+# Số IP nguồn tối đa mỗi switch; vượt thì bỏ nguồn lâu không có mẫu nhất
+MAX_SOURCES = 65536
+# Baseline EWMA theo từng IP: trọng số mẫu mới và độ lệch chuẩn tối thiểu (PPS)
+EWMA_ALPHA = 0.2
+MIN_STD = 10.0
+WARMUP_SAMPLES = 3      # Số mẫu trước khi baseline được dùng để chấm điểm
+
+# Bản ghi của một nguồn khi chụp trạng thái (snapshot_store.py): bộ đếm lần trước + baseline
+RATES_DTYPE = np.dtype([('addr', '<u4'), ('pkts', '<f8'), ('bytes', '<f8'), ('time', '<f8'),
+                        ('mean', '<f8'), ('var', '<f8'), ('samples', 'u1')])
+
+
+class SwitchRates(object):
+    """
+    Bộ đếm của một switch: bảng IP -> slot và các mảng song song theo slot.
+    Mỗi IP nguồn chiếm cố định một slot, nên không tạo object Python cho từng flow.
+    Slot của nguồn bị loại (hết hạn / vượt max_sources) được tái sử dụng, nên
+    các mảng không lớn quá max_sources.
+    """
+    __slots__ = ('slot_of', 'ips', 'size', 'prev_pkts', 'prev_bytes',
+                 'prev_time', 'seen', 'free', 'max_sources', 'evicted',
+                 'addr', 'mean', 'var', 'samples')
+
+    def __init__(self, capacity=INITIAL_CAPACITY, max_sources=MAX_SOURCES):
+        self.slot_of = {}     # {ip: slot}
+        self.ips = []         # slot -> ip (None = slot trống)
+        self.size = 0
+        self.free = []        # Slot trống để cấp lại
+        self.max_sources = max_sources
+        self.evicted = 0
+        self.prev_pkts = np.zeros(capacity, dtype=np.float64)
+        self.prev_bytes = np.zeros(capacity, dtype=np.float64)
+        self.prev_time = np.zeros(capacity, dtype=np.float64)
+        self.seen = np.zeros(capacity, dtype=bool)
+        # Baseline PPS (EWMA trung bình / phương sai) + IP dạng số cho tra ngưỡng theo subnet
+        self.addr = np.zeros(capacity, dtype=np.uint32)
+        self.mean = np.zeros(capacity, dtype=np.float64)
+        self.var = np.zeros(capacity, dtype=np.float64)
+        self.samples = np.zeros(capacity, dtype=np.uint8)
+
+    def _grow(self, need):
+        capacity = len(self.seen)
+        while capacity < need:
+            capacity *= 2
+        extra = capacity - len(self.seen)
+        self.prev_pkts = np.concatenate((self.prev_pkts, np.zeros(extra)))
+        self.prev_bytes = np.concatenate((self.prev_bytes, np.zeros(extra)))
+        self.prev_time = np.concatenate((self.prev_time, np.zeros(extra)))
+        self.seen = np.concatenate((self.seen, np.zeros(extra, dtype=bool)))
+        self.addr = np.concatenate((self.addr, np.zeros(extra, dtype=np.uint32)))
+        self.mean = np.concatenate((self.mean, np.zeros(extra)))
+        self.var = np.concatenate((self.var, np.zeros(extra)))
+        self.samples = np.concatenate((self.samples, np.zeros(extra, dtype=np.uint8)))
+
+    def slots(self, ips):
+        """Đổi danh sách IP thành mảng slot, cấp slot mới cho IP lần đầu xuất hiện."""
+        slot_of = self.slot_of
+        get = slot_of.get
+        out = np.fromiter([get(ip, -1) for ip in ips], dtype=np.intp, count=len(ips))
+        # Chỉ các IP mới (slot = -1) mới phải đi qua vòng lặp Python
+        new = np.flatnonzero(out < 0)
+        if len(new) and len(slot_of) + len(new) > self.max_sources:
+            self._evict_lru(len(slot_of) + len(new) - self.max_sources, out[out >= 0])
+        free = self.free
+        added = []
+        for i in new:
+            ip = ips[i]
+            slot = slot_of.get(ip)
+            if slot is None:
+                if free:
+                    slot = free.pop()
+                    self.ips[slot] = ip
+                else:
+                    slot = self.size
+                    self.ips.append(ip)
+                    self.size += 1
+                slot_of[ip] = slot
+                added.append(slot)
+            out[i] = slot
+        if self.size > len(self.seen):
+            self._grow(self.size)
+        for slot in added:
+            ip = self.ips[slot]
+            # Key có thể là chuỗi IP hoặc IP dạng int (flow_analysis.py)
+            self.addr[slot] = ip if ip.__class__ is int else ip_to_int(ip)
+        return out
+
+    def release(self, slots):
+        """Trả các slot về danh sách trống (IP bị quên, bộ đếm về 0)."""
+        ips = self.ips
+        for slot in slots.tolist():
+            del self.slot_of[ips[slot]]
+            ips[slot] = None
+        self.seen[slots] = False
+        self.prev_pkts[slots] = 0
+        self.prev_bytes[slots] = 0
+        self.prev_time[slots] = 0
+        self.mean[slots] = 0
+        self.var[slots] = 0
+        self.samples[slots] = 0
+        self.free.extend(slots.tolist())
+        self.evicted += len(slots)
+
+    def _evict_lru(self, count, keep):
+        """Bỏ `count` nguồn có mẫu cũ nhất, trừ các slot trong `keep` (reply hiện tại)."""
+        stamp = np.where(self.seen[:self.size], self.prev_time[:self.size], np.inf)
+        stamp[keep] = np.inf
+        candidates = np.flatnonzero(np.isfinite(stamp))
+        if not len(candidates):
+            return
+        count = min(count, len(candidates))
+        oldest = candidates[np.argpartition(stamp[candidates], count - 1)[:count]]
+        self.release(oldest)
+
+    def expire(self, cutoff):
+        """Quên các nguồn không có mẫu nào từ thời điểm `cutoff`; trả về số nguồn bị bỏ."""
+        size = self.size
+        idle = np.flatnonzero(self.seen[:size] & (self.prev_time[:size] < cutoff))
+        if len(idle):
+            self.release(idle)
+        return len(idle)
+
+    def export(self):
+        """Các nguồn đã có mẫu -> mảng RATES_DTYPE (vector hoá, không duyệt từng IP)."""
+        live = np.flatnonzero(self.seen[:self.size])
+        out = np.empty(len(live), RATES_DTYPE)
+        out['addr'] = self.addr[live]
+        out['pkts'] = self.prev_pkts[live]
+        out['bytes'] = self.prev_bytes[live]
+        out['time'] = self.prev_time[live]
+        out['mean'] = self.mean[live]
+        out['var'] = self.var[live]
+        out['samples'] = self.samples[live]
+        return out
+
+    def restore(self, records):
+        """Nạp lại bản ghi của export(); key là IP dạng int (như flow_analysis.py)."""
+        if not len(records):
+            return
+        slots = self.slots(records['addr'].tolist())
+        self.prev_pkts[slots] = records['pkts']
+        self.prev_bytes[slots] = records['bytes']
+        self.prev_time[slots] = records['time']
+        self.mean[slots] = records['mean']
+        self.var[slots] = records['var']
+        self.samples[slots] = records['samples']
+        self.seen[slots] = True
+
+    def memory(self):
+        arrays = (self.prev_pkts.nbytes + self.prev_bytes.nbytes + self.prev_time.nbytes
+                  + self.seen.nbytes + self.addr.nbytes + self.mean.nbytes + self.var.nbytes
+                  + self.samples.nbytes)
+        return arrays + container_bytes(self.slot_of, self.ips, self.free)
+
+
+class RateEngine(object):
+    """
+    Tính PPS/BPS cho toàn bộ IP nguồn của một reply trong một lượt vector hoá.
+    Ngữ nghĩa giữ nguyên như bản cũ: gộp mọi flow có ipv4_src theo IP,
+    Delta = Mới - Cũ, chỉ tính khi đã có mẫu trước và time_diff > MIN_TIME_DIFF.
+    field='ipv4_dst' cho bộ đếm theo IP đích (bảo vệ nạn nhân).
+    """
+
+    def __init__(self, capacity=INITIAL_CAPACITY, max_sources=MAX_SOURCES, field='ipv4_src'):
+        self.capacity = capacity
+        self.max_sources = max_sources
+        self.field = field
+        self.switches = {}    # {dpid: SwitchRates}
+
+    def table(self, dpid):
+        rates = self.switches.get(dpid)
+        if rates is None:
+            rates = self.switches[dpid] = SwitchRates(self.capacity, self.max_sources)
+        return rates
+
+    def remove(self, dpid):
+        self.switches.pop(dpid, None)
+
+    def expire(self, ttl, now=None):
+        """Bỏ các nguồn không xuất hiện trong flow stats quá ttl giây (mọi switch)."""
+        if now is None:
+            now = time.time()
+        return sum(rates.expire(now - ttl) for rates in self.switches.values())
+
+    def extract(self, body):
+        """Lấy (ips, pkts, bytes) của các flow có trường `field` trong một lượt duyệt."""
+        field = self.field
+        ips = []
+        pkts = []
+        byts = []
+        for stat in body:
+            match = stat.match
+            if field in match:
+                ip = match[field]
+                # ipv4_src có mask = luật chặn theo prefix, không phải một nguồn
+                if ip.__class__ is tuple:
+                    continue
+                ips.append(ip)
+                pkts.append(stat.packet_count)
+                byts.append(stat.byte_count)
+        return ips, pkts, byts
+
+    def update(self, dpid, ips, pkts, byts, now=None):
+        """
+        Cập nhật bộ đếm của switch và trả về (slots, pps, bps) cho các nguồn
+        đã có mẫu trước đó; cả ba là mảng NumPy cùng thứ tự. Dùng over() để
+        đổi slot vượt ngưỡng ra IP, không cần dựng danh sách IP cho mọi nguồn.
+        """
+        if now is None:
+            now = time.time()
+        rates = self.table(dpid)
+        if not ips:
+            return np.empty(0, dtype=np.intp), np.empty(0), np.empty(0)
+
+        slots = rates.slots(ips)
+        size = rates.size
+        # Gom nhóm theo IP nguồn (một IP có thể xuất hiện ở nhiều flow)
+        cur_pkts = np.bincount(slots, weights=np.asarray(pkts, dtype=np.float64), minlength=size)
+        cur_bytes = np.bincount(slots, weights=np.asarray(byts, dtype=np.float64), minlength=size)
+        touched = np.flatnonzero(np.bincount(slots, minlength=size))
+
+        time_diff = now - rates.prev_time[touched]
+        valid = rates.seen[touched] & (time_diff > MIN_TIME_DIFF)
+        idx = touched[valid]
+        dt = time_diff[valid]
+        # Bộ đếm có thể giảm khi flow bị xoá/cài lại -> kẹp về 0
+        pps = np.maximum(cur_pkts[idx] - rates.prev_pkts[idx], 0) / dt
+        bps = np.maximum(cur_bytes[idx] - rates.prev_bytes[idx], 0) / dt
+
+        # Cập nhật số liệu cũ
+        rates.prev_pkts[touched] = cur_pkts[touched]
+        rates.prev_bytes[touched] = cur_bytes[touched]
+        rates.prev_time[touched] = now
+        rates.seen[touched] = True
+
+        return idx, pps, bps
+
+    def process(self, dpid, body, now=None):
+        """Tiện ích: extract() + update() cho một reply EventOFPFlowStatsReply."""
+        ips, pkts, byts = self.extract(body)
+        return self.update(dpid, ips, pkts, byts, now)
+
+    def over(self, dpid, slots, rates, threshold):
+        """Trả về [(ip, rate)] có rate > threshold, không duyệt các nguồn bình thường."""
+        return self.select(dpid, slots, rates, rates > threshold)
+
+    def select(self, dpid, slots, rates, mask):
+        """[(ip, rate)] của các phần tử có mask = True."""
+        names = self.table(dpid).ips
+        return [(names[slots[i]], float(rates[i])) for i in np.flatnonzero(mask)]
+
+    def addrs(self, dpid, slots):
+        """IP dạng số (uint32) của các slot - cho tra ngưỡng theo subnet."""
+        return self.table(dpid).addr[slots]
+
+    def score(self, dpid, slots, rates):
+        """
+        Điểm bất thường z = (rate - trung bình) / độ lệch chuẩn theo baseline của
+        từng IP. IP có ít hơn WARMUP_SAMPLES mẫu chưa có baseline -> điểm 0
+        (chỉ còn ngưỡng tuyệt đối max_pps áp dụng).
+        """
+        table = self.table(dpid)
+        std = np.sqrt(table.var[slots] + MIN_STD * MIN_STD)
+        z = (rates - table.mean[slots]) / std
+        z[table.samples[slots] < WARMUP_SAMPLES] = 0.0
+        return z
+
+    def warm(self, dpid, slots):
+        """True cho các slot đã có baseline (đủ WARMUP_SAMPLES mẫu)."""
+        return self.table(dpid).samples[slots] >= WARMUP_SAMPLES
+
+    def learn(self, dpid, slots, rates, alpha=EWMA_ALPHA):
+        """Cập nhật baseline EWMA (trung bình + phương sai) cho các slot, O(1) mỗi IP."""
+        if not len(slots):
+            return
+        table = self.table(dpid)
+        # Mẫu đầu tiên khởi tạo trung bình (tránh baseline bị kéo về 0)
+        mean = np.where(table.samples[slots] == 0, rates, table.mean[slots])
+        diff = rates - mean
+        incr = alpha * diff
+        table.mean[slots] = mean + incr
+        table.var[slots] = (1.0 - alpha) * (table.var[slots] + diff * incr)
+        table.samples[slots] = np.minimum(table.samples[slots], 254) + 1
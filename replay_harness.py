@@ -0,0 +1,676 @@
+# Tên file: replay_harness.py
+# Vai trò: Chạy các app Ryu (SDNSmartFirewall, StaticFirewall*, LegacySwitch) offline,
+#          không cần Mininet/OVS/root: datapath giả + luồng sự kiện ghi sẵn hoặc sinh ra
+# Mục đích: Đo được hồi quy hiệu năng trên laptop / CI. Sự kiện là message OpenFlow
+#           thật của Ryu (OFPPacketIn, OFPFlowStatsReply...) được gọi thẳng vào handler
+#           đã đăng ký bằng set_ev_cls; ghi lại độ trễ handler (p50/p90/p99), số message
+#           gửi xuống switch cho mỗi sự kiện và bộ nhớ tăng thêm.
+
+import json
+import os
+import random
+import struct
+import time
+import tracemalloc
+from unittest import mock
+
+import numpy as np
+from ryu.controller import ofp_event
+from ryu.controller.handler import MAIN_DISPATCHER
+from ryu.ofproto import ofproto_v1_3, ofproto_v1_3_parser
+
+from l2_fastpath import parse_eth, ipv4_addrs, text_to_mac
+from prefix_planner import ip_to_int
+
+# Loại sự kiện trong trace (một dòng JSON mỗi sự kiện)
+EV_CONNECT = 'connect'          # {"dpid"}
+EV_PACKET_IN = 'packet_in'      # {"dpid", "in_port", "data": hex}
+EV_FLOW_STATS = 'flow_stats'    # {"dpid", "more", "flows": [[match, packets, bytes, duration]]}
+
+
+class FakeDatapath(object):
+    """
+    Datapath giả: ofproto/parser thật của Ryu, send_msg chỉ đếm theo loại message.
+    BarrierRequest được trả lời (Replay.answer_barriers) để FlowProgrammer không giữ lô mãi;
+    Flow Stats lọc theo cookie (đối chiếu khi kết nối) cũng vậy, với bảng flow rỗng.
+    removed: FlowRemoved chờ gửi cho app (chỉ SimDatapath sinh ra).
+    Flow Stats của polling không lọc cookie đi theo trace nên không được trả lời tự động.
+    """
+    ofproto = ofproto_v1_3
+    ofproto_parser = ofproto_v1_3_parser
+
+    def __init__(self, dpid=1):
+        self.id = dpid
+        self.sent = 0
+        self.xid = 0
+        self.counts = {}        # {tên message: số lần gửi}
+        self.barriers = []      # xid của BarrierRequest chưa được trả lời
+        self.stats = []         # OFPFlowStatsRequest lọc cookie chưa được trả lời
+        self.removed = []       # [(_SimFlow, reason, lúc gỡ)] của flow có SEND_FLOW_REM
+
+    def set_xid(self, msg):
+        self.xid += 1
+        msg.set_xid(self.xid)
+        return self.xid
+
+    def send_msg(self, msg):
+        self.sent += 1
+        name = msg.__class__.__name__
+        self.counts[name] = self.counts.get(name, 0) + 1
+        if name == 'OFPBarrierRequest':
+            if msg.xid is None:
+                self.set_xid(msg)
+            self.barriers.append(msg.xid)
+        elif name == 'OFPFlowStatsRequest' and msg.cookie_mask:
+            if msg.xid is None:
+                self.set_xid(msg)
+            self.stats.append(msg)
+
+    def flow_stats(self, req):
+        return []
+
+
+class _SimFlow(object):
+    __slots__ = ('table_id', 'priority', 'key', 'fields', 'dst', 'goto', 'controller',
+                 'idle', 'hard', 'installed', 'last', 'packets', 'cookie', 'match',
+                 'instructions', 'flags')
+
+    def __init__(self, table_id, priority, key, fields, dst, goto, controller, idle, hard, now,
+                 cookie=0, match=None, instructions=(), flags=0):
+        self.table_id = table_id
+        self.priority = priority
+        self.key = key
+        self.fields = fields      # [(tên trường, giá trị, mask hoặc None)]
+        self.dst = dst            # eth_dst khớp chính xác (để tra theo đích) hoặc None
+        self.goto = goto
+        self.controller = controller
+        self.idle = idle
+        self.hard = hard
+        self.installed = now
+        self.last = now
+        self.packets = 0
+        self.cookie = cookie
+        self.match = match            # OFPMatch gốc: Flow Stats trả lại đúng dạng đã gửi
+        self.instructions = instructions
+        self.flags = flags
+
+    def expired(self, now):
+        return ((self.hard and now - self.installed >= self.hard)
+                or (self.idle and now - self.last >= self.idle))
+
+    def matches(self, packet):
+        for name, value, mask in self.fields:
+            field = packet.get(name)
+            if field is None:
+                return False
+            if mask is None:
+                if field != value:
+                    return False
+            elif field & mask != value & mask:
+                return False
+        return True
+
+
+def _match_value(name, value):
+    if name in ('eth_dst', 'eth_src'):
+        return text_to_mac(value)
+    if name in ('ipv4_src', 'ipv4_dst'):
+        return ip_to_int(value)
+    return value
+
+
+class SimDatapath(FakeDatapath):
+    """
+    Switch mô phỏng tối giản: áp dụng FlowMod (ADD / DELETE / DELETE_STRICT, idle /
+    hard timeout theo đồng hồ ảo) vào các bảng, process() cho một frame đi qua
+    pipeline (Goto-Table) và trả về bảng sinh Packet-In nếu gói lên controller.
+    Dùng để đo số Packet-In và kích thước bảng flow của một chiến lược chuyển mạch.
+    """
+
+    def __init__(self, dpid=1):
+        super(SimDatapath, self).__init__(dpid)
+        self.tables = {}        # {table_id: ({eth_dst: [flow]}, [flow không khớp đích])}
+        self.index = {}         # {(table_id, priority, match): flow}
+        self.packets = 0
+        self.packet_ins = 0
+        self.expired = 0
+
+    def send_msg(self, msg):
+        super(SimDatapath, self).send_msg(msg)
+        if msg.__class__.__name__ == 'OFPFlowMod':
+            self._flow_mod(msg)
+
+    def _flow_mod(self, mod):
+        ofp = self.ofproto
+        fields = []
+        dst = None
+        for name, value in mod.match._fields2:
+            if isinstance(value, tuple):
+                fields.append((name, _match_value(name, value[0]), _match_value(name, value[1])))
+            else:
+                fields.append((name, _match_value(name, value), None))
+                if name == 'eth_dst':
+                    dst = fields[-1][1]
+        key = (mod.table_id, mod.priority, tuple(sorted(fields)))
+        if mod.command == ofp.OFPFC_DELETE_STRICT:
+            self._remove(self.index.get(key))
+            return
+        if mod.command == ofp.OFPFC_DELETE:
+            wanted = set(fields)
+            for flow in list(self.index.values()):
+                if (mod.table_id in (ofp.OFPTT_ALL, flow.table_id)
+                        and wanted.issubset(flow.fields)):
+                    self._remove(flow)
+            return
+        goto = None
+        controller = False
+        for inst in mod.instructions:
+            if isinstance(inst, self.ofproto_parser.OFPInstructionGotoTable):
+                goto = inst.table_id
+            for action in getattr(inst, 'actions', ()):
+                if getattr(action, 'port', None) == ofp.OFPP_CONTROLLER:
+                    controller = True
+        self._remove(self.index.get(key))    # ADD cùng match + priority = thay thế
+        flow = _SimFlow(mod.table_id, mod.priority, key, fields, dst, goto, controller,
+                        mod.idle_timeout, mod.hard_timeout, time.time(), mod.cookie,
+                        mod.match, mod.instructions, mod.flags)
+        self.index[key] = flow
+        by_dst, other = self.tables.setdefault(mod.table_id, ({}, []))
+        if dst is not None:
+            by_dst.setdefault(dst, []).append(flow)
+        else:
+            other.append(flow)
+
+    def flow_stats(self, req):
+        """OFPFlowStats của các flow còn hạn khớp cookie / cookie_mask của request."""
+        parser = self.ofproto_parser
+        now = time.time()
+        body = []
+        for flow in self.index.values():
+            if flow.cookie & req.cookie_mask != req.cookie & req.cookie_mask or flow.expired(now):
+                continue
+            duration = now - flow.installed
+            body.append(parser.OFPFlowStats(
+                table_id=flow.table_id, duration_sec=int(duration),
+                duration_nsec=int(duration % 1 * 1e9), priority=flow.priority,
+                idle_timeout=flow.idle, hard_timeout=flow.hard, flags=0, cookie=flow.cookie,
+                packet_count=flow.packets, byte_count=0, match=flow.match,
+                instructions=flow.instructions))
+        return body
+
+    def _remove(self, flow):
+        if flow is None or self.index.pop(flow.key, None) is None:
+            return
+        by_dst, other = self.tables[flow.table_id]
+        if flow.dst is not None:
+            by_dst[flow.dst].remove(flow)
+            if not by_dst[flow.dst]:
+                del by_dst[flow.dst]
+        else:
+            other.remove(flow)
+
+    def _lookup(self, table_id, packet, now):
+        table = self.tables.get(table_id)
+        if table is None:
+            return None
+        best = None
+        for flows in (table[0].get(packet['eth_dst'], ()), table[1]):
+            for flow in list(flows):
+                if flow.expired(now):
+                    self._timeout(flow, now)
+                elif (best is None or flow.priority > best.priority) and flow.matches(packet):
+                    best = flow
+        return best
+
+    def process(self, in_port, data, now=None):
+        """Cho một frame vào switch; trả về table_id sinh Packet-In, hoặc None."""
+        if now is None:
+            now = time.time()
+        self.packets += 1
+        dst, src, ethertype = parse_eth(data)
+        packet = {'in_port': in_port, 'eth_dst': dst, 'eth_src': src, 'eth_type': ethertype}
+        addrs = ipv4_addrs(data, ethertype)
+        if addrs is not None:
+            packet['ipv4_src'], packet['ipv4_dst'] = addrs
+        table_id = 0
+        while True:
+            flow = self._lookup(table_id, packet, now)
+            if flow is None:
+                return None           # Không có table-miss: switch bỏ gói
+            flow.last = now
+            flow.packets += 1
+            if flow.controller:
+                self.packet_ins += 1
+                return table_id
+            if flow.goto is None:
+                return None
+            table_id = flow.goto
+
+    def expire(self, now=None):
+        if now is None:
+            now = time.time()
+        for flow in list(self.index.values()):
+            if flow.expired(now):
+                self._timeout(flow, now)
+
+    def _timeout(self, flow, now):
+        self._remove(flow)
+        self.expired += 1
+        if flow.flags & self.ofproto.OFPFF_SEND_FLOW_REM:
+            hard = flow.hard and now - flow.installed >= flow.hard
+            self.removed.append((flow, self.ofproto.OFPRR_HARD_TIMEOUT if hard
+                                 else self.ofproto.OFPRR_IDLE_TIMEOUT, now))
+
+    def table_sizes(self):
+        sizes = {}
+        for flow in self.index.values():
+            sizes[flow.table_id] = sizes.get(flow.table_id, 0) + 1
+        return sizes
+
+
+class VirtualClock(object):
+    """time.time() ảo: sự kiện cách nhau đúng 1/rate giây mà không phải chờ thật."""
+
+    def __init__(self, start=1000000.0):
+        self.now = start
+
+    def time(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+# ---------------------------------------------------------------------------
+# Dựng sự kiện Ryu từ bản ghi trace
+# ---------------------------------------------------------------------------
+
+def packet_in_event(datapath, in_port, data, table_id=0):
+    parser = datapath.ofproto_parser
+    msg = parser.OFPPacketIn(datapath, buffer_id=datapath.ofproto.OFP_NO_BUFFER,
+                             total_len=len(data), reason=0, table_id=table_id, cookie=0,
+                             match=parser.OFPMatch(in_port=in_port), data=data)
+    return ofp_event.EventOFPPacketIn(msg)
+
+
+def flow_stats_event(datapath, flows, more=False):
+    """flows: [(match dict, packets, bytes, duration giây)]."""
+    parser = datapath.ofproto_parser
+    msg = parser.OFPFlowStatsReply(datapath)
+    msg.flags = datapath.ofproto.OFPMPF_REPLY_MORE if more else 0
+    body = []
+    for match, packets, byts, duration in flows:
+        body.append(parser.OFPFlowStats(
+            table_id=0, duration_sec=int(duration), duration_nsec=int(duration % 1 * 1e9),
+            priority=10, idle_timeout=0, hard_timeout=0, flags=0, cookie=0,
+            packet_count=int(packets), byte_count=int(byts),
+            match=parser.OFPMatch(**match), instructions=[]))
+    msg.body = body
+    return ofp_event.EventOFPFlowStatsReply(msg)
+
+
+def flow_stats_reply_event(datapath, req, body):
+    """Reply (một phần) cho một OFPFlowStatsRequest đã gửi, cùng xid."""
+    msg = datapath.ofproto_parser.OFPFlowStatsReply(datapath)
+    msg.xid = req.xid
+    msg.flags = 0
+    msg.body = body
+    return ofp_event.EventOFPFlowStatsReply(msg)
+
+
+def flow_removed_event(datapath, flow, reason, now):
+    duration = now - flow.installed
+    msg = datapath.ofproto_parser.OFPFlowRemoved(
+        datapath, cookie=flow.cookie, priority=flow.priority, reason=reason,
+        table_id=flow.table_id, duration_sec=int(duration),
+        duration_nsec=int(duration % 1 * 1e9), idle_timeout=flow.idle, hard_timeout=flow.hard,
+        packet_count=flow.packets, byte_count=0, match=flow.match)
+    return ofp_event.EventOFPFlowRemoved(msg)
+
+
+def features_event(datapath):
+    msg = datapath.ofproto_parser.OFPSwitchFeatures(datapath, datapath_id=datapath.id,
+                                                    n_buffers=0, n_tables=254,
+                                                    auxiliary_id=0, capabilities=0)
+    return ofp_event.EventOFPSwitchFeatures(msg)
+
+
+def barrier_event(datapath, xid):
+    msg = datapath.ofproto_parser.OFPBarrierReply(datapath)
+    msg.xid = xid
+    return ofp_event.EventOFPBarrierReply(msg)
+
+
+def handlers(app):
+    """{lớp sự kiện: [bound method]} - đúng những gì Ryu sẽ gọi (set_ev_cls)."""
+    table = {}
+    for name in dir(app.__class__):
+        method = getattr(app, name, None)
+        callers = getattr(method, 'callers', None)
+        if not callers:
+            continue
+        for ev_cls in callers:
+            table.setdefault(ev_cls, []).append(method)
+    return table
+
+
+# ---------------------------------------------------------------------------
+# Trace ghi sẵn / sinh tổng hợp
+# ---------------------------------------------------------------------------
+
+def load_trace(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save_trace(path, records):
+    with open(path, 'w') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+
+
+def ethernet_frame(src_mac, dst_mac, src_ip=None, dst_ip=None, size=64):
+    """Frame IPv4 tối giản (chỉ các trường app đọc: MAC, ethertype, IP nguồn/đích)."""
+    header = struct.pack('!6s6sH', dst_mac.to_bytes(6, 'big'), src_mac.to_bytes(6, 'big'), 0x0800)
+    ip = bytearray(20)
+    ip[0] = 0x45
+    if src_ip is not None:
+        struct.pack_into('!II', ip, 12, src_ip, dst_ip or 0)
+    return header + bytes(ip) + bytes(max(size - 34, 0))
+
+
+def synthetic_packet_ins(n, hosts=64, switches=1, seed=1):
+    """Packet-In giữa `hosts` host (MAC/IP như FinalTopo), host i nằm ở cổng i."""
+    rnd = random.Random(seed)
+    records = []
+    for _ in range(n):
+        src = rnd.randint(1, hosts)
+        dst = rnd.randint(1, hosts)
+        data = ethernet_frame(src, dst, 0x0a000000 + src, 0x0a000000 + dst)
+        records.append({'type': EV_PACKET_IN, 'dpid': rnd.randint(1, switches),
+                        'in_port': src, 'data': data.hex()})
+    return records
+
+
+def synthetic_flow_stats(rounds, flows, sources, attackers=0, attack_from=0, period=2.0,
+                         switches=1, seed=1, attack_pps=2000):
+    """
+    Mỗi vòng: một reply / switch với `flows` flow chia cho `sources` IP nguồn;
+    từ vòng attack_from, mỗi flow của `attackers` nguồn đầu tiên gửi attack_pps.
+    Trường 't' là thời điểm tương đối (cho VirtualClock).
+    """
+    rnd = random.Random(seed)
+    base = [rnd.randint(1, 10) for _ in range(sources)]    # pps mỗi flow
+    counters = {}    # {(dpid, flow): số gói tích luỹ}
+    records = []
+    for step in range(rounds):
+        for dpid in range(1, switches + 1):
+            body = []
+            for i in range(flows):
+                src = i % sources
+                rate = attack_pps if src < attackers and step >= attack_from else base[src]
+                packets = counters[(dpid, i)] = counters.get((dpid, i), 0) + rate * period
+                match = {'eth_type': 0x0800,
+                         'ipv4_src': f"10.{(src >> 16) & 255}.{(src >> 8) & 255}.{src & 255}",
+                         'ipv4_dst': f"10.1.{(i >> 8) & 15}.{i & 255}"}
+                body.append([match, packets, packets * 800, period * (step + 1)])
+            records.append({'t': step * period, 'type': EV_FLOW_STATS, 'dpid': dpid,
+                            'more': False, 'flows': body})
+    return records
+
+
+def synthetic_l2_traffic(exchanges, hosts=64, duration=600.0, server_share=0.5, seed=1):
+    """
+    Lưu lượng cho SimDatapath trên một switch: host i (MAC/IP i) ở cổng i, host cuối
+    là server. Mỗi trao đổi = gói đi + gói trả lời, rải đều ngẫu nhiên trong `duration`
+    giây; server_share trao đổi là tới server, còn lại giữa hai host ngẫu nhiên.
+    Trả về [(t, dpid, in_port, frame)] theo thời gian.
+    """
+    rnd = random.Random(seed)
+    server = hosts
+    packets = []
+    for _ in range(exchanges):
+        t = rnd.uniform(0, duration)
+        src = rnd.randint(1, hosts - 1)
+        dst = server if rnd.random() < server_share else rnd.randint(1, hosts)
+        if dst == src:
+            continue
+        for a, b, at in ((src, dst, t), (dst, src, t + 0.001)):
+            frame = ethernet_frame(a, b, 0x0a000000 + a, 0x0a000000 + b)
+            packets.append((at, 1, a, frame))
+    packets.sort(key=lambda p: p[0])
+    return packets
+
+
+def synthetic_spoofed_flood(ports, pps, duration, hosts=64, start=0.0, seed=1):
+    """
+    Flood nguồn giả mạo cho SimDatapath: mỗi cổng 1..ports gửi pps gói/giây với MAC /
+    IP nguồn ngẫu nhiên (mỗi gói một nguồn mới) tới host ngẫu nhiên trong 2..hosts.
+    """
+    rnd = random.Random(seed)
+    packets = []
+    for port in range(1, ports + 1):
+        for k in range(int(pps * duration)):
+            src = (0x02 << 40) | rnd.getrandbits(32)      # Unicast, locally administered
+            dst = rnd.randint(2, hosts)
+            packets.append((start + k / pps + rnd.random() / pps, 1, port,
+                            ethernet_frame(src, dst, rnd.getrandbits(32), 0x0a000000 + dst)))
+    packets.sort(key=lambda p: p[0])
+    return packets
+
+
+# ---------------------------------------------------------------------------
+# Replay
+# ---------------------------------------------------------------------------
+
+class ReplayResult(object):
+    """Số liệu của một lần replay, theo loại sự kiện."""
+
+    def __init__(self, name):
+        self.name = name
+        self.latency = {}       # {loại: [giây]}
+        self.messages = {}      # {loại: tổng số message gửi xuống switch}
+        self.memory = 0         # Byte tăng thêm sau replay
+        self.wall = 0.0
+        self.extra = {}         # Số liệu riêng của từng case (IP bị chặn, Packet-In...)
+
+    def add(self, kind, seconds, messages):
+        self.latency.setdefault(kind, []).append(seconds)
+        self.messages[kind] = self.messages.get(kind, 0) + messages
+
+    def summary(self, kind):
+        values = np.asarray(self.latency.get(kind, ()), dtype=np.float64) * 1e6
+        if not len(values):
+            return None
+        p50, p90, p99 = np.percentile(values, (50, 90, 99))
+        return {'events': len(values), 'p50_us': p50, 'p90_us': p90, 'p99_us': p99,
+                'max_us': values.max(), 'events_per_s': len(values) / (values.sum() / 1e6),
+                'msgs_per_event': self.messages.get(kind, 0) / len(values)}
+
+    def as_dict(self):
+        return {'name': self.name, 'memory_bytes': self.memory, 'wall_s': self.wall,
+                'events': {kind: self.summary(kind) for kind in self.latency},
+                'extra': self.extra}
+
+    def report(self):
+        lines = [f"{self.name}: {self.wall:.2f}s, memory +{self.memory / 1024:.0f} KB"]
+        for kind in self.latency:
+            s = self.summary(kind)
+            lines.append(f"  {kind:<11} n={s['events']:<7} p50 {s['p50_us']:9.1f} us | "
+                         f"p90 {s['p90_us']:9.1f} us | p99 {s['p99_us']:9.1f} us | "
+                         f"{s['events_per_s']:>10,.0f} ev/s | {s['msgs_per_event']:.2f} msg/ev")
+        if self.extra:
+            lines.append('  ' + ' | '.join(f"{key} {value:g}" if isinstance(value, (int, float))
+                                           else f"{key} {value}"
+                                           for key, value in self.extra.items()))
+        return '\n'.join(lines)
+
+
+def _rss():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+class Replay(object):
+    """
+    Điều khiển một app với datapath giả.
+    - rate: số sự kiện/giây trên đồng hồ ảo (None = theo trường 't' của trace,
+      hoặc liên tiếp nếu không có); realtime=True thì chờ thật giữa các sự kiện.
+    - trace_memory: đo bộ nhớ bằng tracemalloc (chính xác hơn RSS nhưng chậm hơn).
+    """
+
+    def __init__(self, app, rate=None, realtime=False, trace_memory=False,
+                 datapath_class=FakeDatapath):
+        self.app = app
+        self.datapath_class = datapath_class
+        self.rate = rate
+        self.realtime = realtime
+        self.trace_memory = trace_memory
+        self.handlers = handlers(app)
+        self.datapaths = {}
+        self.clock = VirtualClock()
+
+    def datapath(self, dpid):
+        dp = self.datapaths.get(dpid)
+        if dp is None:
+            dp = self.datapaths[dpid] = self.datapath_class(dpid)
+        return dp
+
+    def dispatch(self, ev):
+        for method in self.handlers.get(ev.__class__, ()):
+            method(ev)
+
+    def answer_barriers(self):
+        """
+        Trả BarrierReply / Flow Stats (đối chiếu) cho mọi request đã gửi và chuyển các
+        FlowRemoved đang chờ (không tính vào độ trễ); lặp tới khi hết vì handler có thể
+        sinh thêm FlowMod + Barrier.
+        """
+        flows = getattr(self.app, 'flows', None)
+        while True:
+            # Thay cho hub thread FlowProgrammer.run(): gửi các lô FlowMod chưa đầy
+            if flows is not None and flows.pending:
+                flows.flush_all()
+            answered = False
+            for dp in list(self.datapaths.values()):
+                while dp.stats:
+                    req = dp.stats.pop(0)
+                    self.dispatch(flow_stats_reply_event(dp, req, dp.flow_stats(req)))
+                    answered = True
+                while dp.barriers:
+                    self.dispatch(barrier_event(dp, dp.barriers.pop(0)))
+                    answered = True
+                while dp.removed:
+                    self.dispatch(flow_removed_event(dp, *dp.removed.pop(0)))
+                    answered = True
+            if not answered:
+                return
+
+    def connect(self, dpid):
+        dp = self.datapath(dpid)
+        self.dispatch(features_event(dp))
+        ev = ofp_event.EventOFPStateChange(dp)
+        ev.state = MAIN_DISPATCHER
+        self.dispatch(ev)
+        return dp
+
+    def event(self, record):
+        """Bản ghi trace -> (loại, sự kiện Ryu); connect xử lý riêng vì gồm 2 sự kiện."""
+        kind = record['type']
+        dp = self.datapath(record['dpid'])
+        if kind == EV_PACKET_IN:
+            return kind, packet_in_event(dp, record['in_port'], bytes.fromhex(record['data']),
+                                         record.get('table_id', 0))
+        if kind == EV_FLOW_STATS:
+            return kind, flow_stats_event(dp, record['flows'], record.get('more', False))
+        return kind, None
+
+    def run(self, records, name=None):
+        result = ReplayResult(name or self.app.__class__.__name__)
+        # Dựng trước mọi sự kiện: chi phí tạo message không tính vào handler
+        events = [(record, self.event(record)) for record in records]
+        if self.trace_memory:
+            tracemalloc.start()
+            mem_start = tracemalloc.get_traced_memory()[0]
+        else:
+            mem_start = _rss()
+        interval = 1.0 / self.rate if self.rate else 0.0
+        start_clock = self.clock.now
+        start = time.perf_counter()
+        with mock.patch('time.time', self.clock.time):
+            for i, (record, (kind, ev)) in enumerate(events):
+                if self.rate:
+                    due = i * interval
+                else:
+                    due = record.get('t', self.clock.now - start_clock)
+                wait = start_clock + due - self.clock.now
+                if wait > 0:
+                    self.clock.advance(wait)
+                    if self.realtime:
+                        time.sleep(wait)
+                sent = sum(d.sent for d in self.datapaths.values())
+                t0 = time.perf_counter()
+                if kind == EV_CONNECT:
+                    # Kết nối tính tới khi luật đã cài xong, gồm lượt đối chiếu Flow Stats
+                    self.connect(record['dpid'])
+                    self.answer_barriers()
+                else:
+                    self.dispatch(ev)
+                elapsed = time.perf_counter() - t0
+                result.add(kind, elapsed, sum(d.sent for d in self.datapaths.values()) - sent)
+                self.answer_barriers()
+        result.wall = time.perf_counter() - start
+        if self.trace_memory:
+            result.memory = tracemalloc.get_traced_memory()[0] - mem_start
+            tracemalloc.stop()
+        else:
+            result.memory = _rss() - mem_start
+        return result
+
+    def traffic(self, packets, name=None, sample_every=1000, tick=None, tick_interval=1.0):
+        """
+        Frame đi qua SimDatapath ([(t, dpid, in_port, frame)], t tăng dần): chỉ gói
+        switch gửi lên mới thành Packet-In cho app. extra: số gói, số Packet-In,
+        Packet-In/giây (đồng hồ ảo), kích thước bảng flow cuối cùng và lớn nhất.
+        tick(now): gọi mỗi tick_interval giây ảo, thay cho vòng Monitor (hub thread) của app.
+        """
+        result = ReplayResult(name or self.app.__class__.__name__)
+        start_clock = self.clock.now
+        start = time.perf_counter()
+        peak = 0
+        next_tick = start_clock + tick_interval
+        with mock.patch('time.time', self.clock.time):
+            for i, (t, dpid, in_port, data) in enumerate(packets):
+                wait = start_clock + t - self.clock.now
+                if wait > 0:
+                    self.clock.advance(wait)
+                if tick is not None and self.clock.now >= next_tick:
+                    tick(self.clock.now)
+                    self.answer_barriers()
+                    next_tick = self.clock.now + tick_interval
+                dp = self.datapath(dpid)
+                table_id = dp.process(in_port, data, self.clock.now)
+                if table_id is not None:
+                    ev = packet_in_event(dp, in_port, data, table_id)
+                    sent = dp.sent
+                    t0 = time.perf_counter()
+                    self.dispatch(ev)
+                    result.add(EV_PACKET_IN, time.perf_counter() - t0, dp.sent - sent)
+                    self.answer_barriers()
+                if i % sample_every == 0:
+                    for sim in self.datapaths.values():
+                        sim.expire(self.clock.now)
+                    peak = max(peak, sum(sum(sim.table_sizes().values())
+                                         for sim in self.datapaths.values()))
+        result.wall = time.perf_counter() - start
+        duration = max(self.clock.now - start_clock, 1e-9)
+        packet_ins = len(result.latency.get(EV_PACKET_IN, ()))
+        flows = sum(sum(sim.table_sizes().values()) for sim in self.datapaths.values())
+        result.extra.update(packets=len(packets), packet_ins=packet_ins,
+                            packet_in_pct=round(100.0 * packet_ins / max(len(packets), 1), 2),
+                            packet_in_rate=round(packet_ins / duration, 2),
+                            flows=flows, peak_flows=max(peak, flows))
+        return result
@@ -0,0 +1,190 @@
+# Tên file: shard_coordinator.py
+# Vai trò: Chia switch cho nhiều tiến trình controller (shard) + gộp quyết định chặn
+# Mục đích: Mỗi shard chỉ làm MASTER (poll, phân tích, cài luật) cho các switch
+#           có dpid % SHARD_COUNT == SHARD_INDEX. Nguồn bị chặn ở một shard được
+#           báo cho các shard khác qua UDP (JSON) để chặn trên toàn mạng; mỗi IP
+#           chỉ được báo lại khi hạn chặn mới xa hơn hạn đã biết (không lặp vòng).
+#           Chỉ nhận datagram từ địa chỉ của peer đã cấu hình; có secret chung thì mỗi
+#           datagram còn phải mang HMAC-SHA256 đúng (32 byte đầu).
+
+import hashlib
+import hmac
+import ipaddress
+import json
+import math
+import socket
+import time
+
+from ryu.lib import hub
+
+COORD_PORT = 6700            # Cổng UDP mặc định của shard 0 (shard i: COORD_PORT + i)
+MAX_DATAGRAM = 60000         # Giới hạn kích thước một gói UDP (byte)
+COORD_BIND = '127.0.0.1'     # Địa chỉ nghe mặc định (shard chạy trên nhiều máy: đặt IP nội bộ)
+MAX_PEER_BLOCK = 3600        # Hạn chặn xa nhất nhận từ peer (giây kể từ lúc nhận)
+MAC_SIZE = hashlib.sha256().digest_size
+
+
+def _sign(secret, data):
+    return hmac.new(secret, data, hashlib.sha256).digest()
+
+
+def _resolve(host):
+    try:
+        return socket.gethostbyname(host)
+    except OSError:
+        return host
+
+
+def shard_of(dpid, shards):
+    """Shard sở hữu switch dpid."""
+    return dpid % shards if shards > 1 else 0
+
+
+class BlockCoordinator(object):
+    """
+    - publish([(ip, until)]): gửi các IP mới bị chặn (hoặc được gia hạn) cho peer,
+      trả về phần chưa gửi được.
+    - run(callback): hub thread nhận tin từ peer, gọi callback(ip, until) cho IP
+      chưa biết hoặc có hạn mới xa hơn. Datagram không từ peer, sai HMAC hoặc có IP
+      / hạn không hợp lệ bị bỏ (đếm trong rejected); lỗi của callback không làm
+      dừng thread.
+    """
+
+    def __init__(self, shard_index, port, peers, logger, bind=COORD_BIND, secret=None,
+                 max_block=MAX_PEER_BLOCK):
+        self.shard_index = shard_index
+        self.port = port
+        self.peers = list(peers)    # [(host, port)]
+        self.logger = logger
+        self.bind = bind
+        self.secret = secret.encode() if isinstance(secret, str) else secret
+        self.max_block = max_block
+        self.allowed = set(_resolve(host) for host, _ in self.peers)
+        self.known = {}             # {ip: hạn chặn xa nhất đã biết}
+        self.sock = None
+        self.sent = 0
+        self.received = 0
+        self.rejected = 0
+
+    def _remember(self, ip, until):
+        """True nếu (ip, until) là thông tin mới."""
+        if self.known.get(ip, 0) >= until:
+            return False
+        self.known[ip] = until
+        return True
+
+    def _datagrams(self, fresh):
+        """[(data, [(ip, until)])]: chia theo số byte đã mã hoá, mỗi datagram <= MAX_DATAGRAM."""
+        head = json.dumps({'shard': self.shard_index, 'blocks': []}).encode()[:-2]
+        budget = MAX_DATAGRAM - len(head) - 2 - (MAC_SIZE if self.secret else 0)
+        out = []
+        parts, entries, size = [], [], 0
+        for entry in fresh:
+            part = json.dumps(entry).encode()
+            if parts and size + len(part) + 1 > budget:
+                out.append((parts, entries))
+                parts, entries, size = [], [], 0
+            parts.append(part)
+            entries.append(entry)
+            size += len(part) + 1
+        if parts:
+            out.append((parts, entries))
+        datagrams = []
+        for parts, entries in out:
+            data = head + b','.join(parts) + b']}'
+            if self.secret:
+                data = _sign(self.secret, data) + data
+            datagrams.append((data, entries))
+        return datagrams
+
+    def publish(self, blocks):
+        """
+        Gửi cho mọi peer; IP chỉ được ghi nhận (không gửi lại) khi datagram chứa nó tới
+        được mọi peer. Trả về các (ip, until) chưa gửi được để thử lại lần sau.
+        """
+        fresh = [(ip, until) for ip, until in blocks if self.known.get(ip, 0) < until]
+        if not fresh or not self.peers:
+            return []
+        if self.sock is None:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        failed = []
+        for data, entries in self._datagrams(fresh):
+            ok = True
+            for peer in self.peers:
+                try:
+                    self.sock.sendto(data, peer)
+                except OSError as e:
+                    ok = False
+                    self.logger.warning(f"[SHARD] Cannot reach peer {peer}: {e}")
+            if not ok:
+                failed.extend(entries)
+                continue
+            for ip, until in entries:
+                self._remember(ip, until)
+            self.sent += len(entries)
+        return failed
+
+    def expire(self, now=None):
+        if now is None:
+            now = time.time()
+        for ip in [ip for ip, until in self.known.items() if until <= now]:
+            del self.known[ip]
+
+    def _reject(self, addr, reason):
+        self.rejected += 1
+        self.logger.debug(f"[SHARD] Dropped message from {addr}: {reason}")
+
+    def decode(self, data, addr, now=None):
+        """Datagram -> [(ip, until)] hợp lệ từ shard khác; None nếu bị bỏ."""
+        if addr[0] not in self.allowed:
+            self._reject(addr, "not a configured peer")
+            return None
+        if self.secret:
+            mac, data = data[:MAC_SIZE], data[MAC_SIZE:]
+            if not hmac.compare_digest(mac, _sign(self.secret, data)):
+                self._reject(addr, "bad HMAC")
+                return None
+        try:
+            msg = json.loads(data)
+            shard = msg['shard']
+            entries = list(msg['blocks'])
+        except (ValueError, KeyError, TypeError):
+            self._reject(addr, "malformed")
+            return None
+        if shard == self.shard_index:
+            return None
+        if now is None:
+            now = time.time()
+        blocks = []
+        for entry in entries:
+            try:
+                ip, until = entry
+                ip = ipaddress.ip_address(ip)
+                until = float(until)
+            except (ValueError, TypeError):
+                self._reject(addr, f"bad block {entry!r}")
+                continue
+            if ip.version != 4 or not math.isfinite(until) or until <= now:
+                self._reject(addr, f"bad block {entry!r}")
+                continue
+            blocks.append((str(ip), min(until, now + self.max_block)))
+        return blocks
+
+    def run(self, callback):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind((self.bind, self.port))
+        self.logger.info(f"[SHARD] Shard {self.shard_index} listening on "
+                         f"{self.bind}:{self.port}/udp, {len(self.peers)} peer(s)"
+                         f"{', HMAC' if self.secret else ''}")
+        while True:
+            data, addr = sock.recvfrom(65535)
+            blocks = self.decode(data, addr)
+            for ip, until in blocks or ():
+                if not self._remember(ip, until):
+                    continue
+                self.received += 1
+                try:
+                    callback(ip, until)
+                except Exception:
+                    self.logger.exception(f"[SHARD] Peer block {ip} from {addr} failed")
+            hub.sleep(0)
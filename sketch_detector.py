@@ -0,0 +1,299 @@
+# Tên file: sketch_detector.py
+# Vai trò: Tầng phát hiện dạng streaming chạy song song với ngưỡng THRESHOLD_PPS
+# Mục đích: Ngưỡng cố định theo từng IP nguồn bỏ sót tấn công phân tán tốc độ
+#           thấp (9 attacker h2..h10 cùng đánh 10.0.0.64, mỗi máy dưới ngưỡng) và
+#           tốn bộ nhớ theo số nguồn. Ở đây mỗi switch chỉ giữ vài sketch cỡ cố
+#           định: Count-Min (ước lượng PPS), Space-Saving (ứng viên heavy hitter)
+#           và histogram băm (entropy nguồn/đích), cập nhật theo lô NumPy.
+
+import heapq
+import math
+import time
+
+import numpy as np
+
+SKETCH_WIDTH = 2048      # Số cột mỗi hàng Count-Min (luỹ thừa của 2)
+SKETCH_DEPTH = 4         # Số hàm băm
+TOP_K = 64               # Số ứng viên heavy hitter theo dõi (nguồn / đích / cặp)
+ENTROPY_BINS = 1024      # Số ô histogram băm để ước lượng entropy
+WINDOW_EPOCHS = 5        # Cửa sổ trượt (trung bình mũ) tính theo số lượt poll
+ENTROPY_DROP = 1.0       # Entropy đích giảm >= bao nhiêu bit so với nền -> bất thường
+MIN_SOURCES = 3          # Số nguồn tối thiểu để coi là tấn công nhiều-một
+MIN_EPOCH_TIME = 0.1     # Tránh chia cho 0 khi đổi số gói lấy mẫu ra PPS
+MAX_SAMPLES = 65536      # Số mẫu Packet-In tối đa giữ chờ một epoch
+
+ALERT_SINGLE = 'single'            # Một nguồn vượt ngưỡng
+ALERT_DISTRIBUTED = 'distributed'  # Nhiều nguồn -> một đích
+
+_HASH_SEED = 0x5EED
+
+
+def _row_params(depth, seed):
+    rnd = np.random.RandomState(seed)
+    # Nhân-dịch (multiply-shift): hệ số lẻ 64 bit, tràn số là chủ ý
+    mul = rnd.randint(1, 1 << 62, size=depth, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    add = rnd.randint(0, 1 << 62, size=depth, dtype=np.uint64)
+    return mul[:, None], add[:, None]
+
+
+def _hash(keys, mul, add, bits):
+    with np.errstate(over='ignore'):
+        return ((keys[None, :] * mul + add) >> np.uint64(64 - bits)).astype(np.intp)
+
+
+class CountMinSketch(object):
+    """Count-Min: ước lượng trội (không bao giờ thấp hơn giá trị thật)."""
+
+    def __init__(self, width=SKETCH_WIDTH, depth=SKETCH_DEPTH, seed=_HASH_SEED):
+        self.bits = int(math.log2(width))
+        self.width = 1 << self.bits
+        self.depth = depth
+        self.mul, self.offset = _row_params(depth, seed)
+        self.table = np.zeros((depth, self.width))
+
+    def add(self, keys, weights):
+        """keys: mảng uint64, weights: mảng float cùng độ dài."""
+        if not len(keys):
+            return
+        index = _hash(keys, self.mul, self.offset, self.bits)
+        for row in range(self.depth):
+            self.table[row] += np.bincount(index[row], weights=weights, minlength=self.width)
+
+    def estimate(self, keys):
+        if not len(keys):
+            return np.empty(0)
+        index = _hash(keys, self.mul, self.offset, self.bits)
+        return self.table[np.arange(self.depth)[:, None], index].min(axis=0)
+
+    def scale(self, factor):
+        self.table *= factor
+
+    @property
+    def nbytes(self):
+        return self.table.nbytes
+
+
+class SpaceSaving(object):
+    """
+    Space-Saving: giữ tối đa k key; key mới thay key nhỏ nhất và thừa hưởng số
+    đếm của nó (error). Mọi key có tổng > N/k chắc chắn nằm trong bảng.
+    """
+
+    def __init__(self, k=TOP_K):
+        self.k = k
+        self.counts = {}
+        self.errors = {}
+        self.heap = []    # (count, key); mỗi key đúng một mục, có thể cũ (nhỏ hơn thật)
+
+    def update(self, key, weight):
+        counts = self.counts
+        if key in counts:
+            counts[key] += weight
+            return
+        if len(counts) < self.k:
+            counts[key] = weight
+            self.errors[key] = 0.0
+            heapq.heappush(self.heap, (weight, key))
+            return
+        heap = self.heap
+        while True:
+            count, victim = heap[0]
+            current = counts[victim]
+            if current == count:
+                break
+            heapq.heapreplace(heap, (current, victim))   # Mục cũ -> cập nhật rồi xét lại
+        heapq.heapreplace(heap, (count + weight, key))
+        del counts[victim]
+        del self.errors[victim]
+        counts[key] = count + weight
+        self.errors[key] = count
+
+    def scale(self, factor):
+        for key in self.counts:
+            self.counts[key] *= factor
+            self.errors[key] *= factor
+        self.heap = [(count, key) for key, count in self.counts.items()]
+        heapq.heapify(self.heap)
+
+    def arrays(self):
+        """(keys uint64, count) của các ứng viên; count là cận trên như Count-Min."""
+        keys = np.fromiter(self.counts, dtype=np.uint64, count=len(self.counts))
+        counts = np.fromiter(self.counts.values(), dtype=np.float64, count=len(self.counts))
+        return keys, counts
+
+    def items(self):
+        """[(key, count, error)] giảm dần theo count."""
+        return sorted(((key, count, self.errors[key]) for key, count in self.counts.items()),
+                      key=lambda item: -item[1])
+
+
+def entropy_bits(hist):
+    total = hist.sum()
+    if total <= 0:
+        return 0.0
+    p = hist[hist > 0] / total
+    return max(0.0, float(-(p * np.log2(p)).sum()))
+
+
+class Alert(object):
+    __slots__ = ('kind', 'sources', 'dst', 'rate', 'src_entropy', 'dst_entropy')
+
+    def __init__(self, kind, sources, dst, rate, src_entropy, dst_entropy):
+        self.kind = kind
+        self.sources = sources      # [(ip int, pps ước lượng)]
+        self.dst = dst              # ip int (0 = không rõ / tấn công một nguồn)
+        self.rate = rate
+        self.src_entropy = src_entropy
+        self.dst_entropy = dst_entropy
+
+
+class SketchDetector(object):
+    """
+    Bộ phát hiện của một switch. Mỗi lượt poll là một epoch:
+    - add(): PPS của từng flow có ipv4_src (packet_count / duration, tách từ reply
+      bởi flow_analysis.py),
+    - sample(): Packet-In được lấy mẫu (mỗi mẫu đại diện `weight` gói),
+    - end_epoch(): đưa epoch vào cửa sổ trượt (trung bình mũ WINDOW_EPOCHS) và
+      trả về danh sách Alert.
+    Bộ nhớ cố định: 3 Count-Min + 3 Space-Saving + 2 histogram, không phụ thuộc
+    số nguồn; mỗi cập nhật là O(depth).
+    """
+
+    def __init__(self, single_pps, dest_pps, pair_pps, window=WINDOW_EPOCHS, top_k=TOP_K,
+                 width=SKETCH_WIDTH, depth=SKETCH_DEPTH, bins=ENTROPY_BINS):
+        self.single_pps = single_pps
+        self.dest_pps = dest_pps
+        self.pair_pps = pair_pps
+        self.keep = 1.0 - 1.0 / window      # Hệ số giữ lại của cửa sổ trượt
+        self.top_k = top_k
+        self.src_cm = CountMinSketch(width, depth, _HASH_SEED)
+        self.dst_cm = CountMinSketch(width, depth, _HASH_SEED + 1)
+        self.pair_cm = CountMinSketch(width, depth, _HASH_SEED + 2)
+        self.src_top = SpaceSaving(top_k)
+        self.dst_top = SpaceSaving(top_k)
+        self.pair_top = SpaceSaving(top_k)
+        self.bins = bins
+        self.src_hist = np.zeros(bins)
+        self.dst_hist = np.zeros(bins)
+        self.baseline_dst_entropy = None
+        self.epochs = 0
+        self.last_epoch = None
+        self._keys = []       # Epoch hiện tại: các lô (src, dst, pps)
+        self._samples = []    # Packet-In lấy mẫu: (src, dst, số gói)
+
+    def add(self, srcs, dsts, rates):
+        if len(srcs):
+            self._keys.append((np.asarray(srcs, dtype=np.uint64),
+                               np.asarray(dsts, dtype=np.uint64),
+                               np.asarray(rates, dtype=np.float64)))
+
+    def sample(self, src, dst, weight=1):
+        if len(self._samples) < MAX_SAMPLES:
+            self._samples.append((src, dst, weight))
+
+    def _epoch_arrays(self, now):
+        parts = list(self._keys)
+        if self._samples:
+            dt = max(now - self.last_epoch, MIN_EPOCH_TIME) if self.last_epoch else 1.0
+            samples = np.asarray(self._samples, dtype=np.float64)
+            parts.append((samples[:, 0].astype(np.uint64), samples[:, 1].astype(np.uint64),
+                          samples[:, 2] / dt))
+        self._keys = []
+        self._samples = []
+        if not parts:
+            return None
+        return (np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts]),
+                np.concatenate([p[2] for p in parts]))
+
+    def _update_top(self, top, keys, rates):
+        """Gộp theo key rồi chỉ đưa ~2k key lớn nhất của epoch vào Space-Saving."""
+        uniq, inverse = np.unique(keys, return_inverse=True)
+        sums = np.bincount(inverse, weights=rates)
+        limit = 2 * self.top_k
+        if len(uniq) > limit:
+            best = np.argpartition(sums, len(sums) - limit)[-limit:]
+            uniq, sums = uniq[best], sums[best]
+        update = top.update
+        for key, value in zip(uniq.tolist(), sums.tolist()):
+            update(key, value)
+
+    def _hist_add(self, hist, keys, weights):
+        index = (keys * np.uint64(0x9E3779B97F4A7C15)) >> np.uint64(64 - int(math.log2(self.bins)))
+        hist += np.bincount(index.astype(np.intp), weights=weights, minlength=self.bins)
+
+    def end_epoch(self, now=None):
+        if now is None:
+            now = time.time()
+        arrays = self._epoch_arrays(now)
+        self.last_epoch = now
+        # Cửa sổ trượt: mọi thành phần cùng suy giảm rồi cộng epoch mới * (1 - keep)
+        keep = self.keep
+        for part in (self.src_cm, self.dst_cm, self.pair_cm,
+                     self.src_top, self.dst_top, self.pair_top):
+            part.scale(keep)
+        self.src_hist *= keep
+        self.dst_hist *= keep
+        if arrays is not None:
+            srcs, dsts, rates = arrays
+            weights = rates * (1.0 - keep)
+            pairs = (srcs << np.uint64(32)) | dsts
+            with np.errstate(over='ignore'):
+                self.src_cm.add(srcs, weights)
+                self.dst_cm.add(dsts, weights)
+                self.pair_cm.add(pairs, weights)
+                self._hist_add(self.src_hist, srcs, weights)
+                self._hist_add(self.dst_hist, dsts, weights)
+            self._update_top(self.src_top, srcs, weights)
+            self._update_top(self.dst_top, dsts, weights)
+            self._update_top(self.pair_top, pairs, weights)
+        self.epochs += 1
+        return self.detect()
+
+    def entropy(self):
+        return entropy_bits(self.src_hist), entropy_bits(self.dst_hist)
+
+    def detect(self):
+        # Cửa sổ chưa đầy: trung bình mũ còn thấp hơn thật -> chia lại cho phần đã có
+        fill = 1.0 - self.keep ** self.epochs if self.epochs else 1.0
+        src_h, dst_h = self.entropy()
+        alerts = []
+
+        # 1. Một nguồn vượt ngưỡng (heavy hitter theo nguồn)
+        # Cả hai sketch đều ước lượng trội -> lấy giá trị nhỏ hơn
+        keys, counts = self.src_top.arrays()
+        rates = np.minimum(self.src_cm.estimate(keys), counts) / fill
+        for key, rate in zip(keys.tolist(), rates.tolist()):
+            if rate > self.single_pps:
+                alerts.append(Alert(ALERT_SINGLE, [(key, rate)], 0, rate, src_h, dst_h))
+
+        # 2. Nhiều nguồn -> một đích: đích nóng + đủ nguồn góp phần hoặc entropy đích sụp
+        collapsed = (self.baseline_dst_entropy is not None
+                     and self.baseline_dst_entropy - dst_h >= ENTROPY_DROP)
+        pair_keys, counts = self.pair_top.arrays()
+        pair_rates = np.minimum(self.pair_cm.estimate(pair_keys), counts) / fill
+        keys, counts = self.dst_top.arrays()
+        rates = np.minimum(self.dst_cm.estimate(keys), counts) / fill
+        hot = False
+        for dst, rate in zip(keys.tolist(), rates.tolist()):
+            if not dst or rate <= self.dest_pps:
+                continue
+            hot = True
+            sources = [(pair >> 32, pair_rate)
+                       for pair, pair_rate in zip(pair_keys.tolist(), pair_rates.tolist())
+                       if pair & 0xffffffff == dst and pair_rate > self.pair_pps]
+            # Entropy sụp: báo cả khi từng nguồn quá nhỏ để chặn (nguồn giả mạo)
+            if len(sources) >= MIN_SOURCES or collapsed:
+                sources.sort(key=lambda item: -item[1])
+                alerts.append(Alert(ALERT_DISTRIBUTED, sources, dst, rate, src_h, dst_h))
+
+        # Nền entropy đích chỉ học khi không có đích nóng
+        if not hot:
+            if self.baseline_dst_entropy is None:
+                self.baseline_dst_entropy = dst_h
+            else:
+                self.baseline_dst_entropy += 0.1 * (dst_h - self.baseline_dst_entropy)
+        return alerts
+
+    def memory(self):
+        sketches = self.src_cm.nbytes + self.dst_cm.nbytes + self.pair_cm.nbytes
+        return sketches + self.src_hist.nbytes + self.dst_hist.nbytes
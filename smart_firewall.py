@@ -8,206 +8,988 @@
 #   [3] Iqbal et al. (2023): Phân tích thông số mạng (Throughput/PPS) để phát hiện bất thường.
 # ==============================================================================
 
+import os
 import time
-from operator import attrgetter
+from itertools import islice
+from operator import itemgetter
+from ryu.app.wsgi import WSGIApplication
 from ryu.base import app_manager
 from ryu.controller import ofp_event
-from ryu.controller.handler import CONFIG_DISPATCHER, MAIN_DISPATCHER, set_ev_cls
+from ryu.controller.handler import CONFIG_DISPATCHER, MAIN_DISPATCHER, DEAD_DISPATCHER, set_ev_cls
 from ryu.ofproto import ofproto_v1_3
-from ryu.lib.packet import packet, ethernet, ether_types, ipv4, arp
+from ryu.lib.packet import ether_types
 from ryu.lib import hub
+from stats_poller import StatsPoller, POLL_AGGREGATE
+from monitor_scheduler import MonitorScheduler
+from l2_fastpath import parse_eth, mac_to_text, MacTable, ipv4_addrs, ETH_TYPE_LLDP, ETH_TYPE_IP
+from l2_pipeline import (ProactiveL2, load_host_map, MODE_PROACTIVE, MODE_REACTIVE,
+                         ACL_TABLE, LEARN_TABLE)
+from packet_in_guard import PacketInGuard, ADMIT, SUPPRESS
+from flow_programmer import FlowProgrammer
+from mitigation_manager import MitigationManager, HostLocator, PushRound
+from prefix_planner import ipv4_src_field, ipv4_src_prefix, prefix_text, ip_to_int, int_to_ip
+from sketch_detector import ALERT_DISTRIBUTED, MAX_SAMPLES
+from flow_analysis import FlowAnalyzer, encode_stats
+from shard_coordinator import shard_of, BlockCoordinator, COORD_PORT, COORD_BIND
+from metrics_store import (MetricsWriter, METRIC_BLOCKED, METRIC_PPS, METRIC_SOURCE_PPS,
+                           METRIC_STATE_BYTES)
+from state_store import format_bytes
+from instrumentation import Registry, LogLimiter, timed, instrument_flows, serve, SIZE_BUCKETS
+from management_api import (EventFeed, chunks, serve as serve_management, EV_ALERT, EV_BLOCK,
+                            EV_UNBLOCK)
+from snapshot_store import (StateSnapshots, SNAPSHOT_DIR, SEC_BLOCKS, SEC_HOSTS, SEC_MACS,
+                            SEC_SOURCES, SEC_DESTS, block_records, host_records, mac_records,
+                            restore_macs, CHECKPOINT_INTERVAL, WAL_FLUSH_INTERVAL)
+from flow_reconciler import Reconciler, COOKIE_BLOCK, COOKIE_FORWARD, cookie_flows
+from flow_capacity import FlowCapacity, CLASS_FORWARD, CLASS_BLOCK
 
 # --- CẤU HÌNH NGƯỠNG (Dựa trên phân tích tham số mạng của Iqbal et al.) ---
 THRESHOLD_PPS = 150    # Ngưỡng gói tin/giây (Sensitivity Analysis)
 BLOCK_DURATION = 30    # Thời gian chặn (Giây) - Cơ chế "Reset Victim" của Sapkota
 MONITOR_PERIOD = 2     # Chu kỳ lấy mẫu thống kê (Giây)
+BLOCK_PRIORITY = 200   # > Forwarding (10) -> luật chặn được khớp trước
+MAX_BLOCK_RULES = 256  # Số luật chặn tối đa mỗi switch (gộp prefix khi vượt)
+MIN_BLOCK_PREFIX = 16  # Không bao giờ chặn dải rộng hơn /16
+
+# --- CẤU HÌNH POLLING (xem stats_poller.py) ---
+POLL_MODE = POLL_AGGREGATE        # 'flow' | 'filtered' | 'aggregate' | 'port'
+PRE_THRESHOLD_PPS = THRESHOLD_PPS # PPS tổng của switch để kéo chi tiết theo IP nguồn
+POLL_COOKIE = 0                   # Lọc flow stats chi tiết theo cookie (0/0 = không lọc)
+POLL_COOKIE_MASK = 0
+
+# --- CẤU HÌNH LẬP LỊCH POLLING (xem monitor_scheduler.py) ---
+MONITOR_TICK = 0.1          # Bước lặp của vòng Monitor (Giây)
+MIN_POLL_INTERVAL = 0.5     # Chu kỳ ngắn nhất khi switch gần ngưỡng
+MAX_POLL_INTERVAL = 10      # Chu kỳ dài nhất khi mạng yên tĩnh
+MAX_IN_FLIGHT = 32          # Số stats request chờ reply cùng lúc
+REPLY_TIMEOUT = 1.5         # Reply trễ hơn mức này coi như mất
+
+# --- CẤU HÌNH KIỂM SOÁT PACKET-IN (xem packet_in_guard.py) ---
+PACKET_IN_RATE = 100        # Ngân sách Packet-In mỗi cổng (gói/giây)
+PACKET_IN_BURST = 200       # Số Packet-In tối đa dồn một lúc
+SUPPRESS_AFTER = 500        # Số Packet-In bị từ chối liên tiếp trước khi chặn cổng
+SUPPRESS_DURATION = 10      # Thời gian chặn Packet-In của cổng (Giây)
+SUPPRESS_PRIORITY = 1       # > Table-miss (0), < Forwarding (10): flow đã học vẫn chạy
+PACKET_IN_METER_PPS = 0     # > 0: giới hạn Packet-In của cả switch bằng OpenFlow Meter
+PACKET_IN_METER_ID = 1
+
+# --- GIỚI HẠN TRẠNG THÁI THEO SWITCH (xem state_store.py) ---
+SOURCE_TTL = 60                 # IP nguồn không còn flow quá lâu thì quên bộ đếm (Giây)
+MAX_SOURCES_PER_SWITCH = 65536  # Số IP nguồn tối đa có bộ đếm (LRU)
+MAC_TTL = 300                   # MAC im lặng quá lâu thì quên (Giây)
+MAX_MACS_PER_SWITCH = 4096      # Số MAC tối đa mỗi switch (LRU)
+STATE_REPORT_INTERVAL = 60      # Chu kỳ báo cáo bộ nhớ trạng thái (Giây)
+
+# --- PHÁT HIỆN DẠNG SKETCH (xem sketch_detector.py) ---
+SKETCH_DETECTION = True     # Bật tầng heavy hitter + entropy song song với THRESHOLD_PPS
+DEST_THRESHOLD_PPS = 300    # Đích nhận quá mức này -> xét tấn công nhiều-một
+PAIR_MIN_PPS = 20           # Nguồn góp >= mức này vào đích nóng thì bị chặn
+PACKET_IN_SAMPLE = 16       # Lấy mẫu 1/N Packet-In IPv4 đưa vào sketch
+
+# --- NGƯỠNG THÍCH NGHI (baseline EWMA trong rate_engine.py, xem thresholds.py) ---
+# Nguồn / đích bất thường khi PPS > min_pps và (z-score > z hoặc PPS > max_pps)
+ANOMALY_Z = 4.0             # Số độ lệch chuẩn so với baseline của chính IP đó
+# Baseline vài pps + MIN_STD (rate_engine.py) cho z > 4 từ ~55 pps: nguồn dưới mức này
+# không bị xét (đợt tải hợp lệ của host ít dùng). Từ đây tới THRESHOLD_PPS chỉ chặn khi
+# lệch hẳn khỏi baseline của chính nó; host quen gửi ~100 pps không bị chặn ở 130 pps
+MIN_ANOMALY_PPS = 100
+VICTIM_Z = 4.0
+MIN_VICTIM_PPS = 100        # Đích nhận ít hơn mức này không bị coi là nạn nhân
+VICTIM_SOURCE_PPS = 50      # Nguồn gửi tới nạn nhân >= mức này thì bị chặn ...
+VICTIM_SOURCE_Z = 2.0       # ... nếu là nguồn mới hoặc có z-score > mức này (client quen thì không)
+VICTIM_MIN_SOURCES = 3      # Ít nguồn hơn = tấn công một nguồn, để ngưỡng theo nguồn xử lý
+# (subnet, z, min_pps, max_pps) - prefix dài hơn được ưu tiên
+SOURCE_THRESHOLDS = [
+    ('10.0.0.64/32', 6.0, 300, 2000),   # Web server h64: trả lời nhiều là bình thường
+]
+VICTIM_THRESHOLDS = []
+
+# --- ĐẶT LUẬT CHẶN (xem mitigation_manager.py) ---
+EDGE_MITIGATION = True      # Chặn ở switch biên nơi MAC của nguồn được học (gần nguồn nhất)
+MAX_HOSTS = 65536           # Số cặp IP -> MAC ghi nhớ để định vị nguồn
+
+# --- DUNG LƯỢNG BẢNG FLOW (xem flow_capacity.py) ---
+TABLE_SIZE = 4096               # Số flow mỗi switch (switch báo TABLE_FULL thì hạ theo số thật)
+FLOW_BUDGETS = {CLASS_FORWARD: 3072,            # Flow chuyển mạch reactive; vượt -> xoá cũ nhất
+                CLASS_BLOCK: MAX_BLOCK_RULES}   # Luật chặn (không bị xoá, gộp prefix khi gần đầy)
+TABLE_STATS_INTERVAL = 10       # Chu kỳ lấy số flow thật của switch (Giây)
+COARSE_FORWARD_PRIORITY = 9     # Flow chỉ khớp eth_dst khi bảng gần đầy (< flow chi tiết 10)
+
+# --- CHUYỂN MẠCH L2 (xem l2_pipeline.py) ---
+# MODE_REACTIVE: flow in_port+eth_dst+eth_src (idle 10s) cài khi có Packet-In (cách cũ)
+# MODE_PROACTIVE: bảng 0 firewall, bảng 1 eth_dst -> cổng cài ngay khi học MAC, bảng 2 học nguồn
+FORWARDING_MODE = MODE_REACTIVE
+HOST_MAP_FILE = 'hosts.json'    # Host biết trước (như FinalTopo), chỉ dùng ở MODE_PROACTIVE
+
+# --- CHẾ ĐỘ NHIỀU TIẾN TRÌNH (xem shard_coordinator.py) ---
+# Chạy SDN_SHARDS tiến trình ryu-manager (SDN_SHARD_INDEX = 0..N-1), switch cấu hình
+# đủ N controller: mỗi shard làm MASTER cho các switch có dpid % N == index.
+SHARD_COUNT = int(os.environ.get('SDN_SHARDS', 1))
+SHARD_INDEX = int(os.environ.get('SDN_SHARD_INDEX', 0))
+# Cổng UDP của shard này; peer mặc định là các shard khác trên cùng máy. Chỉ nghe trên
+# SHARD_BIND và chỉ nhận tin từ SHARD_PEERS; SDN_SHARD_SECRET (chung cho mọi shard)
+# bật HMAC cho mỗi tin - nên đặt khi shard chạy trên nhiều máy
+SHARD_PORT = COORD_PORT + SHARD_INDEX
+SHARD_BIND = os.environ.get('SDN_SHARD_BIND', COORD_BIND)
+SHARD_SECRET = os.environ.get('SDN_SHARD_SECRET') or None
+SHARD_PEERS = [(host, int(port)) for host, port in
+               (peer.rsplit(':', 1) for peer in os.environ.get('SDN_SHARD_PEERS', '').split(',')
+                if peer)] or [('127.0.0.1', COORD_PORT + i)
+                              for i in range(SHARD_COUNT) if i != SHARD_INDEX]
+NETWORK_WIDE_BLOCK = True   # Nguồn chưa định vị được -> chặn trên mọi switch (False: chỉ switch phát hiện)
+
+# --- KHÔI PHỤC SAU KHỞI ĐỘNG LẠI (xem snapshot_store.py, flow_reconciler.py) ---
+# Checkpoint định kỳ + WAL chặn/gỡ chặn trong thư mục state/ (mỗi shard một bộ file);
+# switch kết nối lại -> đối chiếu flow còn trên switch, chỉ gửi phần chênh lệch
+SNAPSHOTS = True
+SNAPSHOT_PREFIX = f'smart-{SHARD_INDEX}'
+
+# --- GIÁM SÁT VẬN HÀNH (xem instrumentation.py) ---
+# Số liệu ở GET /metrics (Ryu WSGI: ryu-manager --wsapi-host 127.0.0.1 --wsapi-port 8080)
+LOG_LINES = 20              # Số dòng log tối đa mỗi loại (Analysis, ALERT, BLOCKING) ...
+LOG_WINDOW = 10             # ... trong mỗi cửa sổ này (Giây); phần còn lại chỉ được đếm
+# REST API quản trị /firewall/* (xem management_api.py) dùng chung WSGI server với /metrics
+
+# Tham số cho FlowAnalyzer
+ANALYSIS_SETTINGS = dict(
+    threshold_pps=THRESHOLD_PPS, dest_pps=DEST_THRESHOLD_PPS, pair_pps=PAIR_MIN_PPS,
+    source_thresholds=((ANOMALY_Z, MIN_ANOMALY_PPS, THRESHOLD_PPS), SOURCE_THRESHOLDS),
+    victim_thresholds=((VICTIM_Z, MIN_VICTIM_PPS, DEST_THRESHOLD_PPS), VICTIM_THRESHOLDS),
+    victim_source_pps=VICTIM_SOURCE_PPS, victim_source_z=VICTIM_SOURCE_Z,
+    max_sources=MAX_SOURCES_PER_SWITCH, sketch=SKETCH_DETECTION)
 
 class SDNSmartFirewall(app_manager.RyuApp):
     OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
+    _CONTEXTS = {'wsgi': WSGIApplication}
 
     def __init__(self, *args, **kwargs):
         super(SDNSmartFirewall, self).__init__(*args, **kwargs)
         self.datapaths = {}
+        # Mỗi switch có lịch poll riêng, rải đều trong MONITOR_PERIOD
+        self.scheduler = MonitorScheduler(MONITOR_PERIOD, MIN_POLL_INTERVAL, MAX_POLL_INTERVAL,
+                                          MAX_IN_FLIGHT, REPLY_TIMEOUT)
         self.monitor_thread = hub.spawn(self._monitor)
+
+        # FlowMod gửi theo lô + Barrier (xem flow_programmer.py)
+        self.flows = FlowProgrammer(self.logger)
+        self.flow_thread = hub.spawn(self.flows.run)
+        # Số flow theo loại trên từng switch, đếm từ chính các FlowMod gửi đi
+        self.capacity = FlowCapacity(TABLE_SIZE, FLOW_BUDGETS)
+        self.flows.observer = self.capacity.observe
         
-        # Lưu trữ thống kê cũ để tính Delta (Tốc độ tức thời)
-        self.prev_stats = {} 
+        # Phân tích flow stats (Delta theo IP nguồn/đích, baseline EWMA, sketch) nằm
+        # trong FlowAnalyzer (xem flow_analysis.py); kết quả đi qua _on_verdict()
+        self.analyzer = FlowAnalyzer(**ANALYSIS_SETTINGS)
+        self.analysis_state = {}    # {dpid: (số nguồn, số nguồn bị bỏ, byte)}
+        # Packet-In IPv4 lấy mẫu cho tầng sketch, gửi kèm lô phân tích kế tiếp
+        self.samples = {}
+
+        # Chia switch giữa các shard + báo IP bị chặn cho shard khác
+        self.role_generation = int(time.time() * 1000)
+        self.coordinator = None
+        self.to_publish = []
+        if SHARD_COUNT > 1:
+            self.coordinator = BlockCoordinator(SHARD_INDEX, SHARD_PORT, SHARD_PEERS, self.logger,
+                                                bind=SHARD_BIND, secret=SHARD_SECRET)
+            self.coord_thread = hub.spawn(self.coordinator.run, self._peer_block)
+
+        # Chuyển mạch chủ động trên pipeline nhiều bảng (None = reactive như cũ)
+        self.l2 = None
+        if FORWARDING_MODE == MODE_PROACTIVE:
+            self.l2 = ProactiveL2(self.flows, load_host_map(HOST_MAP_FILE, self.logger),
+                                  MAC_TTL, MAC_TTL // 2)
+
+        # Chiến lược polling: bình thường chỉ lấy số liệu tổng
+        self.poller = StatsPoller(POLL_MODE, PRE_THRESHOLD_PPS, POLL_COOKIE, POLL_COOKIE_MASK,
+                                  ACL_TABLE if self.l2 is not None else None)
         
-        # Danh sách IP đang bị chặn
-        self.blocked_ips = set()
+        self.pktin_count = 0
+        self.next_block_check = 0
+        self.next_wal_flush = 0
+        self.next_table_stats = 0
+        self.next_checkpoint = time.time() + CHECKPOINT_INTERVAL
+        self.next_state_report = time.time() + STATE_REPORT_INTERVAL
         
-        # Bảng MAC để chuyển mạch (Forwarding)
+        # Bảng MAC để chuyển mạch (Forwarding): {dpid: MacTable}
         self.mac_to_port = {}
 
+        # IP bị chặn của cả mạng (một hạn chung / IP) + luật prefix theo switch biên
+        self.locator = HostLocator(self.mac_to_port, MAX_HOSTS)
+        self.mitigation = MitigationManager(self.locator, MAX_BLOCK_RULES, MIN_BLOCK_PREFIX,
+                                            BLOCK_DURATION)
+        # Danh sách IP đang bị chặn: {ip: hạn chặn}
+        self.blocked_ips = self.mitigation.blocked
+        # Tập IP bị chặn theo switch -> luật prefix (xem prefix_planner.py)
+        self.planners = self.mitigation.planners
+
+        # Token bucket cho Packet-In theo (dpid, in_port)
+        self.pktin_guard = PacketInGuard(PACKET_IN_RATE, PACKET_IN_BURST,
+                                         SUPPRESS_AFTER, SUPPRESS_DURATION)
+
+        # Số liệu PPS / IP bị chặn cho Dashboard (xem metrics_store.py)
+        self.metrics = MetricsWriter('smart')
+        self.metrics.set(METRIC_BLOCKED, 0)
+        self.metrics_thread = hub.spawn(self.metrics.run)
+
+        # Counter / histogram vận hành cho GET /metrics (xem instrumentation.py)
+        stats = self.stats = Registry()
+        self.pktin_total = stats.counter('sdn_packet_in_total', 'Packet-In messages received')
+        self.pktin_dropped = stats.counter('sdn_packet_in_dropped_total',
+                                           'Packet-In rejected by the per-port budget')
+        self.reply_flows = stats.histogram('sdn_stats_reply_flows', 'Flows per flow stats reply',
+                                           SIZE_BUCKETS)
+        self.poll_lag = stats.histogram('sdn_poll_lag_seconds',
+                                        'Delay between a poll falling due and its request')
+        self.poll_latency = stats.histogram('sdn_poll_reply_seconds',
+                                            'Stats request to final reply')
+        # Chu kỳ polling thích nghi và timeout theo switch (MonitorScheduler.metrics())
+        stats.gauge('sdn_poll_interval_seconds', 'Shortest current poll interval of owned switches',
+                    fn=lambda: min((m['interval'] for m in self.scheduler.metrics().values()),
+                                   default=0))
+        stats.counter('sdn_poll_timeouts_total', 'Stats requests without a reply in time',
+                      fn=lambda: sum(m['timeouts'] for m in self.scheduler.metrics().values()))
+        stats.gauge('sdn_active_blocks', 'Source IPs currently blocked',
+                    fn=lambda: len(self.blocked_ips))
+        stats.gauge('sdn_switches', 'Connected switches owned by this controller',
+                    fn=lambda: len(self.datapaths))
+        self.reconciler = Reconciler(self.logger)
+        stats.gauge('sdn_reconciled_switches', 'Switches reconciled against their flow table',
+                    fn=lambda: self.reconciler.done)
+        instrument_flows(stats, self.flows)
+        stats.gauge('sdn_flow_table_entries', 'Flows on owned switches (tracked + table stats drift)',
+                    fn=lambda: sum(flows.total() for flows in self.capacity.switches.values()))
+        stats.counter('sdn_flows_evicted_total', 'Forwarding flows evicted near table capacity',
+                      fn=lambda: sum(flows.evicted for flows in self.capacity.switches.values()))
+        # Log theo từng IP nguồn / từng lần chặn: giới hạn số dòng, phần dư chỉ được đếm
+        self.log_limit = LogLimiter(self.logger, LOG_LINES, LOG_WINDOW,
+                                    stats.counter('sdn_log_suppressed_total',
+                                                  'Log lines dropped by the rate limiter'))
+        serve(self, kwargs.get('wsgi'))
+        # Sự kiện phát hiện / chặn / gỡ chặn cho GET /firewall/events (xem management_api.py)
+        self.events = EventFeed()
+        serve_management(self, kwargs.get('wsgi'))
+
+        # IP bị chặn + IP -> MAC nạp ngay; bảng MAC / bộ đếm của từng switch chỉ đọc
+        # từ checkpoint khi switch đó kết nối (_restore_switch)
+        self.snapshots = None
+        if SNAPSHOTS:
+            self.snapshots = StateSnapshots(SNAPSHOT_PREFIX, self.logger, SNAPSHOT_DIR)
+            stats.gauge('sdn_snapshot_bytes', 'Size of the last checkpoint',
+                        fn=lambda: self.snapshots.written)
+            self._restore()
+
         self.logger.info(">>> SDN SMART FIREWALL KHOI DONG <<<")
         self.logger.info(f"[CONFIG] PPS Limit: {THRESHOLD_PPS} | Block Time: {BLOCK_DURATION}s")
+        if SHARD_COUNT > 1:
+            self.logger.info(f"[CONFIG] Shard {SHARD_INDEX}/{SHARD_COUNT}")
+
+    def close(self):
+        if self.snapshots is not None:
+            self._checkpoint(time.time(), sync=True)
+            self.snapshots.close()
+
+    def _restore(self):
+        start = time.perf_counter()
+        checkpoint = self.snapshots.open()
+        now = time.time()
+        blocks = self.snapshots.blocks(now)
+        for ip, (until, edges) in blocks.items():
+            self.mitigation.restore(int_to_ip(ip), until, edges, now)
+        for ip, mac in self.snapshots.get(SEC_HOSTS).tolist():
+            self.locator.learn(ip, mac)
+        self.metrics.set(METRIC_BLOCKED, len(self.blocked_ips))
+        created = checkpoint.created if checkpoint is not None else 0.0
+        if created or blocks:
+            self.logger.info(f"[SNAPSHOT] Restored {len(blocks)} blocked IP(s), "
+                             f"{len(self.locator)} host(s) in "
+                             f"{(time.perf_counter() - start) * 1000:.1f} ms "
+                             + (f"(checkpoint age {now - created:.0f}s)" if created else "(WAL only)"))
+
+    def _restore_switch(self, dpid):
+        # Đọc lười: chỉ các section của switch vừa kết nối (cũng đúng khi kết nối lại giữa chừng)
+        if self.snapshots is None:
+            return
+        macs = restore_macs(self.mac_to_port[dpid], self.snapshots.get(SEC_MACS, dpid))
+        records = self.snapshots.get(SEC_SOURCES, dpid)
+        self.analyzer.restore(dpid, records, self.snapshots.get(SEC_DESTS, dpid))
+        sources = len(records)
+        if macs or sources:
+            self.logger.info(f"[SNAPSHOT] SW:{dpid} restored {macs} MAC(s), {sources} source(s)")
+
+    def _checkpoint(self, now, sync=False):
+        # Định kỳ (trong event loop) không fsync; close() thì có
+        mitigation = self.mitigation
+        sections = [(SEC_BLOCKS, 0, block_records(mitigation.blocked, mitigation.placement)),
+                    (SEC_HOSTS, 0, host_records(self.locator))]
+        for dpid, table in self.mac_to_port.items():
+            sections.append((SEC_MACS, dpid, mac_records(table)))
+        for dpid in self.datapaths:
+            sources, dests = self.analyzer.export(dpid)
+            sections.append((SEC_SOURCES, dpid, sources))
+            sections.append((SEC_DESTS, dpid, dests))
+        try:
+            size = self.snapshots.checkpoint(sections, now, sync)
+        except OSError as e:
+            self.logger.warning(f"[SNAPSHOT] Checkpoint failed: {e}")
+            return
+        self.logger.debug(f"[SNAPSHOT] {len(sections)} section(s), {format_bytes(size)} in "
+                          f"{self.snapshots.last_duration * 1000:.1f} ms")
 
     # ==========================================================================
     # PHẦN 1: THIẾT LẬP LUẬT CƠ BẢN (Dựa trên Darekar et al.)
     # ==========================================================================
     @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER)
+    @timed('switch_features')
     def switch_features_handler(self, ev):
         datapath = ev.msg.datapath
         ofproto = datapath.ofproto
         parser = datapath.ofproto_parser
+        if SHARD_COUNT > 1:
+            # Switch của shard khác: chỉ giữ kết nối dự phòng (SLAVE), không cài/poll gì
+            owner = shard_of(datapath.id, SHARD_COUNT)
+            self._request_role(datapath, owner == SHARD_INDEX)
+            if owner != SHARD_INDEX:
+                self.logger.info(f"-> Switch {datapath.id} owned by shard {owner} (slave).")
+                return
         self.datapaths[datapath.id] = datapath
+        self.scheduler.add(datapath.id)
+        self.mac_to_port[datapath.id] = MacTable(datapath.id, MAX_MACS_PER_SWITCH, MAC_TTL)
+        self._restore_switch(datapath.id)
 
         # Rule 0: Table-miss (Gói tin lạ gửi về Controller)
-        match = parser.OFPMatch()
-        actions = [parser.OFPActionOutput(ofproto.OFPP_CONTROLLER, ofproto.OFPCML_NO_BUFFER)]
-        self.add_flow(datapath, 0, match, actions)
-        
+        # Nếu bật Meter: switch tự bỏ Packet-In vượt PACKET_IN_METER_PPS
+        meter_id = None
+        if PACKET_IN_METER_PPS > 0:
+            bands = [parser.OFPMeterBandDrop(rate=PACKET_IN_METER_PPS,
+                                             burst_size=PACKET_IN_BURST)]
+            self.flows.send(datapath, parser.OFPMeterMod(datapath=datapath,
+                                                         command=ofproto.OFPMC_ADD,
+                                                         flags=ofproto.OFPMF_PKTPS | ofproto.OFPMF_BURST,
+                                                         meter_id=PACKET_IN_METER_ID, bands=bands))
+            meter_id = PACKET_IN_METER_ID
+        if self.l2 is not None:
+            # Bảng 0 miss -> bảng chuyển mạch; Packet-In chỉ từ miss của bảng 1 / 2
+            # Flow của host biết trước được cài sau khi đối chiếu (_reconciled)
+            self.l2.setup(datapath, meter_id, pin=False)
+            table = self.mac_to_port[datapath.id]
+            for mac, port, ip in self.l2.hosts(datapath.id):
+                table.learn(mac, port)
+                if ip is not None:
+                    self.locator.learn(ip, mac)
+        else:
+            match = parser.OFPMatch()
+            actions = [parser.OFPActionOutput(ofproto.OFPP_CONTROLLER, ofproto.OFPCML_NO_BUFFER)]
+            self.add_flow(datapath, 0, match, actions, meter_id=meter_id)
+
         # [REF: Darekar et al.] ARP Priority
         # Ưu tiên ARP (100) để mạng LAN không bị mất kết nối
         match_arp = parser.OFPMatch(eth_type=ether_types.ETH_TYPE_ARP)
         actions_arp = [parser.OFPActionOutput(ofproto.OFPP_NORMAL)]
         self.add_flow(datapath, 100, match_arp, actions_arp)
+        self.flows.flush(datapath)
+        # Luật chặn / flow L2 còn trên switch từ lần chạy trước: hỏi trước khi cài lại
+        self.reconciler.request(datapath, self._reconciled)
 
         self.logger.info(f"-> Switch {datapath.id} connected. Default rules installed.")
 
-    def add_flow(self, datapath, priority, match, actions, buffer_id=None, idle=0, hard=0):
+    def _reconciled(self, datapath, flows):
+        # flows = None: switch không trả lời kịp -> coi như trống, cài lại toàn bộ
+        dpid = datapath.id
+        if self.datapaths.get(dpid) is not datapath:
+            return
+        now = time.time()
+        installed = {}
+        for stat in cookie_flows(flows or (), COOKIE_BLOCK):
+            field = stat.match.get('ipv4_src')
+            if field is not None:
+                left = stat.hard_timeout - stat.duration_sec if stat.hard_timeout else float('inf')
+                installed[ipv4_src_prefix(field)] = now + max(left, 0)
+        # Planner giữ tập IP, coi luật thật là đang cài -> sync chỉ gửi phần chênh lệch
+        kept = self.mitigation.planner(dpid).adopt(installed)
+        self.capacity.adopt(dpid, flows or ())
+        self.mitigation.dirty.add(dpid)
+        pinned = 0
+        if self.l2 is not None:
+            pinned = self.l2.pin(datapath, ProactiveL2.forwarding(flows) if flows else None)
+            self.flows.flush(datapath)
+        self.logger.info(f"-> Switch {dpid} reconciled in {self.reconciler.last_latency * 1000:.1f} ms: "
+                         f"{kept}/{len(installed)} block rule(s) kept, {pinned} host flow(s) to install")
+        self._flush_mitigation()
+
+    def _request_role(self, datapath, master):
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        role = ofproto.OFPCR_ROLE_MASTER if master else ofproto.OFPCR_ROLE_SLAVE
+        # generation_id tăng dần theo thời điểm khởi động: shard khởi động lại vẫn giành được MASTER
+        datapath.send_msg(parser.OFPRoleRequest(datapath, role, self.role_generation))
+
+    def add_flow(self, datapath, priority, match, actions, buffer_id=None, idle=0, hard=0,
+                 meter_id=None, cookie=0, flags=0, now=False):
+        # now=True: gửi ngay (Packet-In); còn lại xếp lô trong FlowProgrammer
         ofproto = datapath.ofproto
         parser = datapath.ofproto_parser
         inst = [parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS, actions)]
+        if meter_id is not None:
+            inst.insert(0, parser.OFPInstructionMeter(meter_id))
         if buffer_id:
-            mod = parser.OFPFlowMod(datapath=datapath, buffer_id=buffer_id,
-                                    priority=priority, match=match,
+            mod = parser.OFPFlowMod(datapath=datapath, buffer_id=buffer_id, cookie=cookie,
+                                    priority=priority, match=match, flags=flags,
                                     instructions=inst, idle_timeout=idle, hard_timeout=hard)
         else:
-            mod = parser.OFPFlowMod(datapath=datapath, priority=priority,
-                                    match=match, instructions=inst, 
+            mod = parser.OFPFlowMod(datapath=datapath, priority=priority, cookie=cookie,
+                                    match=match, instructions=inst, flags=flags,
                                     idle_timeout=idle, hard_timeout=hard)
-        datapath.send_msg(mod)
+        if now:
+            self.flows.send_now(datapath, mod)
+        else:
+            self.flows.send(datapath, mod)
+
+    @set_ev_cls(ofp_event.EventOFPBarrierReply, [CONFIG_DISPATCHER, MAIN_DISPATCHER])
+    def _barrier_reply_handler(self, ev):
+        self.flows.barrier_reply(ev.msg)
+
+    @set_ev_cls(ofp_event.EventOFPErrorMsg, [CONFIG_DISPATCHER, MAIN_DISPATCHER])
+    def _error_msg_handler(self, ev):
+        msg = ev.msg
+        self.flows.error(msg)
+        ofproto = msg.datapath.ofproto
+        datapath = self.datapaths.get(msg.datapath.id)
+        if (datapath is not None and msg.type == ofproto.OFPET_FLOW_MOD_FAILED
+                and msg.code == ofproto.OFPFMFC_TABLE_FULL):
+            # Bảng thật nhỏ hơn TABLE_SIZE: hạ dung lượng theo số flow hiện có
+            flows = self.capacity.switch(datapath.id)
+            flows.table_full()
+            if self.log_limit.allow('table_full'):
+                self.logger.warning(f"[CAPACITY] SW:{datapath.id} flow table full at "
+                                    f"{flows.total()} flows")
+            self._enforce_capacity(datapath)
+            self._flush_mitigation()
 
     # ==========================================================================
     # PHẦN 2: GIÁM SÁT & PHÂN TÍCH (Dựa trên Sapkota & Iqbal)
     # ==========================================================================
     
     # [REF: Sapkota et al.] Vòng lặp Monitor (Polling) mỗi chu kỳ
+    # Chỉ gửi request cho các switch đến hạn thay vì dồn tất cả cùng lúc
     def _monitor(self):
         while True:
-            for dp in self.datapaths.values():
-                self._request_stats(dp)
-            hub.sleep(MONITOR_PERIOD)
+            now = time.time()
+            for dpid in self.scheduler.expire(now):
+                self.logger.warning(f"[MONITOR] Switch {dpid} stats reply timeout")
+            for dpid in self.scheduler.poll(now):
+                dp = self.datapaths.get(dpid)
+                if dp is not None:
+                    self.poll_lag.observe(self.scheduler.states[dpid].lag)
+                    self._request_stats(dp)
+            if now >= self.next_table_stats:
+                for dp in self.datapaths.values():
+                    dp.send_msg(dp.ofproto_parser.OFPTableStatsRequest(dp, 0))
+                self.next_table_stats = now + TABLE_STATS_INTERVAL
+            if now >= self.next_block_check:
+                self.reconciler.expire(now)
+                self.capacity.expire(now)
+                for dp in list(self.datapaths.values()):
+                    self._enforce_capacity(dp)
+                self._expire_blocks(now)
+                self._expire_state(now)
+                self.next_block_check = now + 1
+            if self.snapshots is not None:
+                if now >= self.next_wal_flush:
+                    self.snapshots.wal.flush()
+                    self.next_wal_flush = now + WAL_FLUSH_INTERVAL
+                if now >= self.next_checkpoint:
+                    self._checkpoint(now)
+                    self.next_checkpoint = now + CHECKPOINT_INTERVAL
+            if now >= self.next_state_report:
+                self._report_state()
+                self.next_state_report = now + STATE_REPORT_INTERVAL
+            hub.sleep(MONITOR_TICK)
+
+    @set_ev_cls(ofp_event.EventOFPStateChange, [MAIN_DISPATCHER, DEAD_DISPATCHER])
+    def _state_change_handler(self, ev):
+        datapath = ev.datapath
+        if ev.state == DEAD_DISPATCHER and datapath.id in self.datapaths:
+            del self.datapaths[datapath.id]
+            self.mac_to_port.pop(datapath.id, None)
+            self.pktin_guard.remove(datapath.id)
+            self.flows.remove(datapath.id)
+            self.reconciler.remove(datapath.id)
+            self.capacity.remove(datapath.id)
+            self.mitigation.remove(datapath.id)
+            self.samples.pop(datapath.id, None)
+            self.analysis_state.pop(datapath.id, None)
+            self.scheduler.remove(datapath.id)
+            self.poller.remove(datapath.id)
+            self.analyzer.remove(datapath.id)
+            if self.l2 is not None:
+                self.l2.remove(datapath.id)
+            self.logger.info(f"-> Switch {datapath.id} disconnected.")
+
+    def _enforce_capacity(self, datapath):
+        # Gần đầy / vượt ngân sách: xoá flow chuyển mạch cũ nhất; luật chặn không bị xoá
+        # mà planner được giới hạn ít luật hơn -> gộp prefix thô hơn ở lần sync tới
+        dpid = datapath.id
+        flows = self.capacity.switch(dpid)
+        degraded = flows.degraded
+        flows.update()
+        victims = flows.evict()
+        if victims:
+            ofproto = datapath.ofproto
+            parser = datapath.ofproto_parser
+            for table_id, priority, fields in victims:
+                self.flows.send(datapath, parser.OFPFlowMod(
+                    datapath=datapath, table_id=table_id, match=parser.OFPMatch(**fields),
+                    priority=priority,
+                    command=ofproto.OFPFC_DELETE_STRICT, out_port=ofproto.OFPP_ANY,
+                    out_group=ofproto.OFPG_ANY))
+            self.flows.flush(datapath)
+            if self.log_limit.allow('evict'):
+                self.logger.info(f"[CAPACITY] SW:{dpid} evicted {len(victims)} forwarding flow(s), "
+                                 f"{flows.total()}/{flows.capacity} flows")
+        planner = self.planners.get(dpid)
+        budget = flows.block_budget()
+        if planner is not None and planner.max_rules != budget:
+            planner.max_rules = budget
+            self.mitigation.dirty.add(dpid)
+        if flows.degraded != degraded:
+            self.logger.info(f"[CAPACITY] SW:{dpid} {flows.total()}/{flows.capacity} flows -> "
+                             + ("coarse rules (eth_dst forwarding, "
+                                f"<= {budget} block rules)" if flows.degraded else "detailed rules"))
+
+    def _expire_state(self, now):
+        # Bộ đếm của nguồn đã biến mất khỏi flow stats + MAC im lặng (kể cả
+        # switch không còn Packet-In để learn() tự dọn)
+        self.analyzer.expire(SOURCE_TTL, now)
+        if self.coordinator is not None:
+            self.coordinator.expire(now)
+            if self.to_publish:
+                self.to_publish = self.coordinator.publish(self.to_publish)
+        for table in self.mac_to_port.values():
+            table.expire(now)
+
+    def _report_state(self):
+        for dpid in self.datapaths:
+            # Số liệu của FlowAnalyzer ở epoch gần nhất (Verdict.state)
+            sources, evicted, size = self.analysis_state.get(dpid, (0, 0, 0))
+            table = self.mac_to_port.get(dpid)
+            planner = self.planners.get(dpid)
+            flows = self.capacity.switch(dpid)
+            size += ((table.memory() if table is not None else 0)
+                     + (planner.memory() if planner is not None else 0) + flows.memory())
+            self.metrics.publish(METRIC_STATE_BYTES, size, dpid)
+            self.logger.info(f"[STATE] SW:{dpid} sources={sources} (evicted {evicted}) "
+                             f"macs={len(table) if table is not None else 0} "
+                             f"blocked={len(planner) if planner is not None else 0} "
+                             f"flows={flows.total()}/{flows.capacity} "
+                             f"~{format_bytes(size)}")
+        mitigation = self.mitigation
+        self.logger.info(f"[STATE] blocks={len(mitigation)} (edge {mitigation.located}, "
+                         f"fallback {mitigation.unlocated}) hosts={len(self.locator)} "
+                         f"~{format_bytes(mitigation.memory())}")
 
     def _request_stats(self, datapath):
-        parser = datapath.ofproto_parser
-        req = parser.OFPFlowStatsRequest(datapath)
-        datapath.send_msg(req)
+        self.poller.request(datapath)
+
+    # Số liệu tổng rẻ: chỉ kéo Flow stats chi tiết khi switch vượt PRE_THRESHOLD_PPS
+    @set_ev_cls(ofp_event.EventOFPAggregateStatsReply, MAIN_DISPATCHER)
+    @timed('aggregate_stats')
+    def _aggregate_stats_reply_handler(self, ev):
+        datapath = ev.msg.datapath
+        if not self.poller.on_aggregate(datapath, ev.msg.body):
+            self._poll_done(datapath.id, self.poller.total_pps.get(datapath.id, 0))
+            self._end_epoch(datapath.id)
+
+    @set_ev_cls(ofp_event.EventOFPPortStatsReply, MAIN_DISPATCHER)
+    @timed('port_stats')
+    def _port_stats_reply_handler(self, ev):
+        datapath = ev.msg.datapath
+        if not self.poller.on_port_stats(datapath, ev.msg.body):
+            self._poll_done(datapath.id, self.poller.total_pps.get(datapath.id, 0))
+            self._end_epoch(datapath.id)
+
+    @set_ev_cls(ofp_event.EventOFPTableStatsReply, MAIN_DISPATCHER)
+    def _table_stats_reply_handler(self, ev):
+        # Số flow thật của switch: neo lại bộ đếm (flow cũ, FlowRemoved bị mất...)
+        msg = ev.msg
+        if msg.datapath.id in self.datapaths:
+            self.capacity.switch(msg.datapath.id).table_stats(
+                msg.body, not msg.flags & msg.datapath.ofproto.OFPMPF_REPLY_MORE)
+
+    def _poll_done(self, dpid, max_pps):
+        # Kết thúc một lượt poll: chu kỳ tiếp theo phụ thuộc độ gần ngưỡng
+        latency = self.scheduler.complete(dpid, max_pps / THRESHOLD_PPS)
+        if latency is not None:
+            self.poll_latency.observe(latency)
+        self.metrics.publish(METRIC_PPS, float(max_pps), dpid)
+
+    def _end_epoch(self, dpid):
+        # Tầng sketch: mỗi lượt poll (kể cả chỉ có số liệu tổng) là một epoch
+        if SKETCH_DETECTION:
+            self._on_verdict(self.analyzer.analyze(dpid, None, self._take_samples(dpid)))
+
+    def _take_samples(self, dpid):
+        samples = self.samples.pop(dpid, None)
+        return samples if samples is not None else ()
 
     # [REF: Iqbal et al.] Tính Delta để phân tích hành vi (Behavioral Investigation)
     @set_ev_cls(ofp_event.EventOFPFlowStatsReply, MAIN_DISPATCHER)
+    @timed('flow_stats')
     def _flow_stats_reply_handler(self, ev):
-        body = ev.msg.body
-        dpid = ev.msg.datapath.id
-        self.prev_stats.setdefault(dpid, {})
-        
-        # Gom nhóm packet theo IP nguồn (Source IP Aggregation)
-        current_traffic = {} 
-
-        for stat in body:
-            # Chỉ xét IPv4, bỏ qua các giao thức quản trị khác
-            if 'ipv4_src' in stat.match:
-                ip_src = stat.match['ipv4_src']
-                if ip_src not in current_traffic:
-                    current_traffic[ip_src] = {'pkts': 0, 'bytes': 0}
-                
-                current_traffic[ip_src]['pkts'] += stat.packet_count
-                current_traffic[ip_src]['bytes'] += stat.byte_count
-
-        # Tính toán tốc độ (Rate)
-        current_time = time.time()
-        
-        for ip, stats in current_traffic.items():
-            prev = self.prev_stats[dpid].get(ip)
-            
-            if prev:
-                prev_pkts, prev_bytes, prev_time = prev
-                
-                # [LOGIC] Tính Delta = Mới - Cũ
-                delta_pkts = stats['pkts'] - prev_pkts
-                time_diff = current_time - prev_time
-
-                # [AN TOÀN] Tránh chia cho 0
-                if time_diff > 0.1:
-                    # Packet Per Second (PPS) - Chỉ số quan trọng nhất trong Iqbal et al.
-                    pps = delta_pkts / time_diff 
-
-                    # Log nếu tốc độ đáng chú ý (>10 pps)
-                    if pps > 10: 
-                        self.logger.info(f"Analysis [SW:{dpid}] IP:{ip} -> PPS:{pps:.2f}")
-
-                    # Kiểm tra tấn công
-                    if pps > THRESHOLD_PPS:
-                        if ip not in self.blocked_ips:
-                            self.logger.warning(f"\n[!!!] ALERT: DDoS Detected from {ip} (PPS: {pps:.2f})")
-                            self._apply_mitigation(ev.msg.datapath, ip)
-
-            # Cập nhật số liệu cũ
-            self.prev_stats[dpid][ip] = (stats['pkts'], stats['bytes'], current_time)
+        if self.reconciler.reply(ev.msg):
+            return
+        datapath = ev.msg.datapath
+        dpid = datapath.id
+        self.reply_flows.observe(len(ev.msg.body))
+
+        # Một lượt duyệt reply -> mảng bản ghi; phần tính toán (NumPy) ở FlowAnalyzer
+        records = encode_stats(ev.msg.body)
+        # Reply nhiều phần (OFPMPF_REPLY_MORE): lượt poll chỉ xong ở phần cuối
+        last = not ev.msg.flags & datapath.ofproto.OFPMPF_REPLY_MORE
+        self._on_verdict(self.analyzer.analyze(dpid, records, self._take_samples(dpid),
+                                               epoch=last))
+
+    @timed('verdict')
+    def _on_verdict(self, verdict):
+        dpid = verdict.dpid
+        datapath = self.datapaths.get(dpid)
+        if datapath is None:
+            return    # Switch đã ngắt kết nối
+        if verdict.state is not None:
+            self.analysis_state[dpid] = verdict.state
+        if verdict.epoch and verdict.max_pps is not None:
+            self._poll_done(dpid, verdict.max_pps)
+
+        # Nguồn có tốc độ đáng chú ý (>10 pps): mọi nguồn vào Dashboard, còn log chỉ
+        # giữ các nguồn lớn nhất trong giới hạn LOG_LINES / LOG_WINDOW
+        loud = verdict.loud
+        if loud:
+            for ip, rate in loud:
+                self.metrics.publish(METRIC_SOURCE_PPS, float(rate), ip_to_int(ip))
+            for ip, rate in self.log_limit.top('analysis', loud, itemgetter(1)):
+                self.logger.info(f"Analysis [SW:{dpid}] IP:{ip} -> PPS:{rate:.2f}")
+
+        # Kiểm tra tấn công: so với baseline của chính IP đó (ngưỡng theo subnet)
+        # thay cho một hằng số chung
+        for ip, rate in verdict.blocks:
+            if ip not in self.blocked_ips:
+                if self.log_limit.allow('alert'):
+                    self.logger.warning(f"\n[!!!] ALERT: DDoS Detected from {ip} (PPS: {rate:.2f})")
+                self.events.publish(EV_ALERT, reason='source', dpid=dpid, ip=ip, pps=float(rate))
+                self._apply_mitigation(datapath, ip)
+        # Đích bất thường: chặn các nguồn đang dồn vào nó (tấn công rải mỏng)
+        for dst, rate, sources in verdict.victims:
+            sources = [ip for ip in sources if ip not in self.blocked_ips]
+            if len(sources) < VICTIM_MIN_SOURCES:
+                continue
+            self.logger.warning(f"\n[!!!] ALERT: Victim {dst} (PPS: {rate:.2f}) "
+                                f"<- {len(sources)} sources")
+            self.events.publish(EV_ALERT, reason='victim', dpid=dpid, dst=dst, pps=float(rate),
+                                sources=len(sources))
+            for ip in sources:
+                self._apply_mitigation(datapath, ip)
+        for alert in verdict.alerts:
+            self._handle_alert(datapath, alert)
+        # Mọi luật chặn của lô này đi chung một lượt sync mỗi switch
+        self._flush_mitigation()
 
     # ==========================================================================
     # PHẦN 3: GIẢM THIỂU TẤN CÔNG (Dựa trên Darekar & Sapkota)
     # ==========================================================================
-    def _apply_mitigation(self, datapath, ip_src):
+    def _handle_alert(self, datapath, alert):
+        # Chỉ chặn nguồn chưa bị chặn; trả về số IP mới bị chặn
+        new = [(int_to_ip(src), rate) for src, rate in alert.sources
+               if int_to_ip(src) not in self.blocked_ips]
+        if not new:
+            return 0
+        if alert.kind == ALERT_DISTRIBUTED:
+            self.logger.warning(f"\n[!!!] ALERT: Distributed flood -> {int_to_ip(alert.dst)} "
+                                f"(PPS: {alert.rate:.2f}) from {len(alert.sources)} sources "
+                                f"(H_src={alert.src_entropy:.2f}, H_dst={alert.dst_entropy:.2f} bit)")
+        else:
+            self.logger.warning(f"\n[!!!] ALERT: Heavy hitter {new[0][0]} (PPS: {new[0][1]:.2f})")
+        self.events.publish(EV_ALERT, reason=alert.kind, dpid=datapath.id,
+                            dst=int_to_ip(alert.dst) if alert.kind == ALERT_DISTRIBUTED else None,
+                            pps=float(alert.rate), sources=len(new))
+        for ip, _ in new:
+            self._apply_mitigation(datapath, ip)
+        return len(new)
+
+    def _apply_mitigation(self, datapath, ip_src, publish=True, fallback=None, duration=None,
+                          source='detector'):
+        # [REF: Sapkota et al.] Mỗi IP bị chặn BLOCK_DURATION giây rồi tự gỡ
+        # Luật đặt ở switch biên của nguồn; chưa định vị được thì ở switch phát hiện
+        # (hoặc mọi switch nếu NETWORK_WIDE_BLOCK). Luật thật trên switch do
+        # _sync_mitigation() sinh ra (gộp prefix) khi _flush_mitigation() được gọi
+        now = time.time()
+        if duration is None:
+            duration = BLOCK_DURATION
+        if fallback is None:
+            if NETWORK_WIDE_BLOCK:
+                fallback = list(self.datapaths)
+            else:
+                fallback = [datapath.id] if datapath is not None else []
+        edges = self.mitigation.block(ip_src, fallback, now, EDGE_MITIGATION, duration)
+        if not edges:
+            if EDGE_MITIGATION and ip_src in self.blocked_ips:
+                self._relocate_block(ip_src, now)
+            return edges
+        self.metrics.set(METRIC_BLOCKED, len(self.blocked_ips))
+        if self.snapshots is not None:
+            self.snapshots.wal.block(ip_to_int(ip_src), edges, now + duration)
+        self.events.publish(EV_BLOCK, now, ip=ip_src, until=now + duration, source=source,
+                            switches=sorted(edges))
+        if self.log_limit.allow('block', now):
+            self.logger.info(f"[>>>] BLOCKING {ip_src} for {duration:g}s on SW "
+                             f"{','.join(str(dpid) for dpid in sorted(edges))} (Auto-Removal Set).")
+        if publish and self.coordinator is not None:
+            self.to_publish.append((ip_src, now + duration))
+        return edges
+
+    def _relocate_block(self, ip_src, now):
+        # Nguồn đã bị chặn ở switch dự phòng (chưa định vị được lúc chặn) nay biết switch
+        # biên: luật chuyển về đó; _flush_mitigation() cài ở switch mới trước khi gỡ ở cũ
+        edges = self.mitigation.relocate(ip_src, now)
+        if not edges:
+            return
+        until = self.blocked_ips[ip_src]
+        if self.snapshots is not None:
+            # Cùng hạn thì WAL gộp switch: gỡ bản ghi cũ trước để chỉ còn nơi đặt mới
+            self.snapshots.wal.unblock(ip_to_int(ip_src))
+            self.snapshots.wal.block(ip_to_int(ip_src), edges, until)
+        if self.log_limit.allow('block', now):
+            self.logger.info(f"[>>>] Moving block of {ip_src} to edge SW "
+                             f"{','.join(str(dpid) for dpid in sorted(edges))}")
+
+    def _flush_mitigation(self):
+        # Hai pha: FlowMod ADD + Barrier cho mọi switch trước (các Barrier được chờ song
+        # song), chỉ khi cả lượt đã xác nhận mới gửi DELETE_STRICT. Gộp / tách prefix hay
+        # luật chuyển sang switch khác không có lúc nào luật cũ đã xoá mà luật mới chưa có
+        dirty = self.mitigation.take_dirty()
+        if dirty:
+            deletes = []
+            push = PushRound(lambda push: self._push_deletes(push, deletes))
+            for dpid in dirty:
+                datapath = self.datapaths.get(dpid)
+                if datapath is None:
+                    continue
+                if self.reconciler.waiting(dpid):
+                    self.mitigation.dirty.add(dpid)   # Sync khi đã biết switch đang có luật nào
+                    continue
+                self._sync_mitigation(datapath, push, deletes)
+            push.seal()
+            if not push.switches:
+                self._push_deletes(push, deletes)
+        if self.to_publish:
+            # Phần gửi lỗi được giữ lại, thử lại ở lần sau (hoặc ở _expire_state)
+            self.to_publish = self.coordinator.publish(self.to_publish)
+
+    def _push_done(self, push):
+        if push.switches > 1 or push.failed:
+            self.logger.info(f"[>>>] Block rules pushed to {push.switches} switch(es) in "
+                             f"{push.latency * 1000:.1f} ms"
+                             + (f", rejected by {push.failed}" if push.failed else ""))
+
+    def _push_deletes(self, push, deletes):
+        # Pha 2 của _flush_mitigation(): luật mới đã có trên mọi switch -> xoá luật cũ.
+        # Prefix được một lượt sync sau cài lại trong lúc chờ thì giữ nguyên
+        if push.switches:
+            self._push_done(push)
+        for datapath, planner, rules in deletes:
+            if self.datapaths.get(datapath.id) is not datapath:
+                continue
+            rules = [rule for rule in rules if rule not in planner.installed]
+            if not rules:
+                continue
+            ofproto = datapath.ofproto
+            parser = datapath.ofproto_parser
+            for net, plen in rules:
+                match = parser.OFPMatch(eth_type=ether_types.ETH_TYPE_IP,
+                                        ipv4_src=ipv4_src_field(net, plen))
+                self.flows.send(datapath, parser.OFPFlowMod(
+                    datapath=datapath, match=match, command=ofproto.OFPFC_DELETE_STRICT,
+                    priority=BLOCK_PRIORITY, out_port=ofproto.OFPP_ANY,
+                    out_group=ofproto.OFPG_ANY))
+            self.flows.flush(datapath, lambda batch, planner=planner, deleted=len(rules):
+                             self._mitigation_done(batch, planner, 0, deleted))
+
+    def _peer_block(self, ip, until):
+        # Shard khác đã chặn IP này -> chặn ở switch biên của nó nếu thuộc shard này,
+        # tới đúng hạn shard kia đặt
+        duration = until - time.time()
+        if ip in self.blocked_ips or duration <= 0:
+            return
+        self.logger.info(f"[SHARD] Peer block {ip} ({duration:.0f}s left)")
+        self._apply_mitigation(None, ip, publish=False, duration=duration, source='peer')
+        self._flush_mitigation()
+
+    def _sync_mitigation(self, datapath, push, deletes, now=None):
         ofproto = datapath.ofproto
         parser = datapath.ofproto_parser
-        
-        # [REF: Darekar et al.] Rule chặn dựa trên Source IP
-        match = parser.OFPMatch(eth_type=ether_types.ETH_TYPE_IP, ipv4_src=ip_src)
-        
-        # [REF: Sapkota et al.] Sử dụng Hard Timeout để tự động gỡ bỏ sau thời gian chặn
-        # Priority 200 > Priority 10 (Forwarding) -> Rule này sẽ được khớp trước
-        instructions = [] # Rỗng = DROP
-        
-        mod = parser.OFPFlowMod(
-            datapath=datapath,
-            match=match,
-            command=ofproto.OFPFC_ADD,
-            idle_timeout=0,
-            hard_timeout=BLOCK_DURATION,
-            priority=200, 
-            instructions=instructions
-        )
-        datapath.send_msg(mod)
-        
-        self.logger.info(f"[>>>] BLOCKED {ip_src} for {BLOCK_DURATION}s (Auto-Removal Set).\n")
-        self.blocked_ips.add(ip_src)
+        planner = self.mitigation.planner(datapath.id)
+        to_add, to_delete = planner.sync(now)
+
+        for net, plen, timeout in to_add:
+            # [REF: Darekar et al.] Rule chặn dựa trên Source IP (có mask nếu là prefix)
+            match = parser.OFPMatch(eth_type=ether_types.ETH_TYPE_IP,
+                                    ipv4_src=ipv4_src_field(net, plen))
+            # [REF: Sapkota et al.] Hard Timeout = hạn của IP bị chặn lâu nhất trong prefix
+            # Priority 200 > Priority 10 (Forwarding) -> Rule này sẽ được khớp trước
+            # SEND_FLOW_REM: switch báo khi luật hết hạn -> dọn blocked_ips ngay
+            self.flows.send(datapath, parser.OFPFlowMod(
+                datapath=datapath, match=match, command=ofproto.OFPFC_ADD, cookie=COOKIE_BLOCK,
+                idle_timeout=0, hard_timeout=timeout, priority=BLOCK_PRIORITY,
+                flags=ofproto.OFPFF_SEND_FLOW_REM,
+                instructions=[]))  # Rỗng = DROP
+
+        if to_add:
+            # Chỉ báo khi BarrierReply xác nhận luật đã có hiệu lực trên switch
+            push.expect()
+            self.flows.flush(datapath, lambda batch: self._mitigation_done(batch, planner,
+                                                                          len(to_add), 0, push))
+        # Prefix không còn trong kế hoạch (đã tách/co lại, chuyển switch) -> xoá ở pha 2
+        if to_delete:
+            deletes.append((datapath, planner, to_delete))
+
+    def _mitigation_done(self, batch, planner, added, deleted, push=None):
+        if batch.ok:
+            rules = ", ".join(prefix_text(net, plen) for net, plen in planner.rules()[:8])
+            self.logger.info(f"[>>>] SW:{batch.dpid} block rules live after "
+                             f"{batch.latency * 1000:.1f} ms (+{added}/-{deleted}): "
+                             f"{len(planner)} IP -> {len(planner.installed)} rule(s) [{rules}]\n")
+        else:
+            # Switch từ chối luật -> lần sync sau cài lại toàn bộ
+            self.logger.warning(f"[!!!] Block rules rejected by switch {batch.dpid}")
+            planner.invalidate()
+        if push is not None:
+            push.done(batch)
+
+    def _expire_blocks(self, now):
+        # IP hết hạn: bỏ khỏi blocked_ips (có thể bị chặn lại nếu tái phạm)
+        # và tách/co các prefix đang cài cho khớp với tập IP còn lại
+        gone = self.mitigation.expire(now)
+        if gone:
+            self.metrics.set(METRIC_BLOCKED, len(self.blocked_ips))
+            for ip in gone:
+                self.events.publish(EV_UNBLOCK, now, ip=ip, source='expired')
+        self._flush_mitigation()
+
+    @set_ev_cls(ofp_event.EventOFPFlowRemoved, MAIN_DISPATCHER)
+    @timed('flow_removed')
+    def _flow_removed_handler(self, ev):
+        msg = ev.msg
+        datapath = msg.datapath
+        self.capacity.removed(msg)
+        # Chỉ quan tâm luật chặn bị switch gỡ (hard timeout...); DELETE là do chính
+        # _sync_mitigation() gửi nên đã được tính trong planner
+        if msg.priority != BLOCK_PRIORITY or msg.reason == datapath.ofproto.OFPRR_DELETE:
+            return
+        planner = self.planners.get(datapath.id)
+        field = msg.match.get('ipv4_src')
+        if planner is None or field is None:
+            return
+        if planner.removed(*ipv4_src_prefix(field)):
+            # IP còn hạn trong prefix (nếu có) sẽ được cài lại ở lần sync này
+            self.mitigation.dirty.add(datapath.id)
+            self._expire_blocks(time.time())
+
+    def _suppress_port(self, datapath, in_port):
+        # Luật DROP ưu tiên thấp cho cổng đang flood: gói lạ từ cổng này không lên
+        # Controller nữa, còn flow Forwarding (10) / ARP (100) đã cài vẫn hoạt động
+        parser = datapath.ofproto_parser
+        if self.l2 is not None:
+            self.l2.suppress(datapath, in_port, SUPPRESS_DURATION, SUPPRESS_PRIORITY)
+        else:
+            match = parser.OFPMatch(in_port=in_port)
+            self.add_flow(datapath, SUPPRESS_PRIORITY, match, [], hard=SUPPRESS_DURATION)
+        self.flows.flush(datapath)
+        self.logger.warning(f"[!!!] PACKET-IN FLOOD [SW:{datapath.id}] port {in_port} "
+                            f"-> suppressed for {SUPPRESS_DURATION}s")
 
     # ==========================================================================
     # PHẦN 4: CHUYỂN MẠCH (L2 LEARNING)
     # ==========================================================================
     @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
+    @timed('packet_in')
     def packet_in_handler(self, ev):
         msg = ev.msg
         datapath = msg.datapath
         ofproto = datapath.ofproto
         parser = datapath.ofproto_parser
         in_port = msg.match['in_port']
+        if SHARD_COUNT > 1 and datapath.id not in self.datapaths:
+            return    # Switch của shard khác (SLAVE)
+        self.pktin_total.inc()
 
-        pkt = packet.Packet(msg.data)
-        eth = pkt.get_protocol(ethernet.ethernet)
-        
-        if eth.ethertype == ether_types.ETH_TYPE_LLDP:
+        # Kiểm soát ngân sách Packet-In trước mọi xử lý khác
+        verdict = self.pktin_guard.admit(datapath.id, in_port)
+        if verdict != ADMIT:
+            self.pktin_dropped.inc()
+            if verdict == SUPPRESS:
+                self._suppress_port(datapath, in_port)
+            return
+
+        # Fast path: chỉ đọc 14 byte header Ethernet (xem l2_fastpath.py)
+        eth = parse_eth(msg.data)
+        if eth is None:
+            return
+        dst, src, ethertype = eth
+
+        if ethertype == ETH_TYPE_LLDP:
             return
 
-        dst = eth.dst
-        src = eth.src
-        
         dpid = datapath.id
-        self.mac_to_port.setdefault(dpid, {})
-        self.mac_to_port[dpid][src] = in_port
+        if ethertype == ETH_TYPE_IP:
+            # IP nguồn -> MAC: để đặt luật chặn ở cổng biên của nguồn
+            if EDGE_MITIGATION:
+                addrs = ipv4_addrs(msg.data, ethertype)
+                if addrs is not None:
+                    self.locator.learn(addrs[0], src)
+            # Lấy mẫu Packet-In IPv4 cho tầng sketch (mỗi mẫu = PACKET_IN_SAMPLE gói)
+            if SKETCH_DETECTION:
+                self.pktin_count += 1
+                if self.pktin_count % PACKET_IN_SAMPLE == 0:
+                    addrs = ipv4_addrs(msg.data, ethertype)
+                    samples = self.samples.setdefault(dpid, [])
+                    if addrs is not None and len(samples) < MAX_SAMPLES:
+                        samples.append((addrs[0], addrs[1], PACKET_IN_SAMPLE))
 
-        out_port = ofproto.OFPP_FLOOD
-        if dst in self.mac_to_port[dpid]:
-            out_port = self.mac_to_port[dpid][dst]
+        table = self.mac_to_port.get(dpid)
+        if table is None:
+            table = self.mac_to_port[dpid] = MacTable(dpid, MAX_MACS_PER_SWITCH, MAC_TTL)
+        table.learn(src, in_port)
+
+        if self.l2 is not None:
+            # Chế độ proactive: nguồn vừa học -> flow eth_dst của nó trên switch
+            self.l2.learned(datapath, src, in_port)
+            if msg.table_id == LEARN_TABLE:
+                self.flows.flush(datapath)
+                return    # Chỉ để học nguồn: bảng 1 đã chuyển gói đi
+        out_port = table.get(dst, ofproto.OFPP_FLOOD)
 
         actions = [parser.OFPActionOutput(out_port)]
 
-        if out_port != ofproto.OFPP_FLOOD:
-            match = parser.OFPMatch(in_port=in_port, eth_dst=dst, eth_src=src)
+        if self.l2 is not None:
+            # Miss ở bảng 1 với đích đã biết = flow của đích đã hết hạn -> cài lại
+            if out_port != ofproto.OFPP_FLOOD:
+                self.l2.learned(datapath, dst, out_port)
+            self.flows.flush(datapath)
+        elif out_port != ofproto.OFPP_FLOOD:
+            flows = self.capacity.switch(dpid)
+            if flows.coarse_forwarding():
+                # Bảng gần đầy: một flow cho mỗi đích thay vì mỗi cặp nguồn / đích
+                match = parser.OFPMatch(eth_dst=mac_to_text(dst))
+                priority = COARSE_FORWARD_PRIORITY
+            else:
+                match = parser.OFPMatch(in_port=in_port, eth_dst=mac_to_text(dst),
+                                        eth_src=mac_to_text(src))
+                priority = 10
             # Idle Timeout 10s: Giúp bảng Flow Table không bị đầy (Sapkota et al. khuyến nghị)
-            self.add_flow(datapath, 10, match, actions, idle=10)
+            # SEND_FLOW_REM: flow hết hạn được trừ khỏi số đếm ngay (xem flow_capacity.py)
+            # Gửi ngay, không chờ FLUSH_INTERVAL: gói tiếp theo của luồng khỏi thành Packet-In
+            self.add_flow(datapath, priority, match, actions, idle=10, cookie=COOKIE_FORWARD,
+                          flags=ofproto.OFPFF_SEND_FLOW_REM, now=True)
+            if flows.pressure():
+                self._enforce_capacity(datapath)
 
         data = None
         if msg.buffer_id == ofproto.OFP_NO_BUFFER:
@@ -215,4 +997,50 @@ class SDNSmartFirewall(app_manager.RyuApp):
 
         out = parser.OFPPacketOut(datapath=datapath, buffer_id=msg.buffer_id,
                                   in_port=in_port, actions=actions, data=data)
-        datapath.send_msg(out)
\ No newline at end of file
+        datapath.send_msg(out)
+    # ==========================================================================
+    # PHẦN 5: REST API QUẢN TRỊ (xem management_api.py)
+    # ==========================================================================
+    def api_blocks(self, offset, limit):
+        # Chỉ duyệt tới trang cần trả, không sắp xếp / sao chép cả bảng
+        items = [{'ip': ip, 'until': until, 'switches': sorted(self.mitigation.placement.get(ip, ()))}
+                 for ip, until in islice(self.blocked_ips.items(), offset, offset + limit)]
+        return len(self.blocked_ips), items
+
+    def api_block(self, ips, duration=None):
+        # Chặn hàng loạt theo khúc: mỗi khúc một lượt sync (FlowMod theo lô) rồi nhường
+        # event loop; IP chưa định vị được bị chặn trên mọi switch của shard này
+        added = 0
+        for chunk in chunks(ips):
+            for ip in chunk:
+                if self._apply_mitigation(None, ip, fallback=list(self.datapaths),
+                                          duration=duration, source='api'):
+                    added += 1
+            self._flush_mitigation()
+        return {'added': added, 'skipped': len(ips) - added, 'blocked': len(self.blocked_ips)}
+
+    def api_unblock(self, ips):
+        # Chỉ gỡ trên switch của shard này (shard khác giữ luật tới hết hạn)
+        removed = 0
+        now = time.time()
+        for chunk in chunks(ips):
+            for ip in chunk:
+                if self.mitigation.unblock(ip):
+                    removed += 1
+                    if self.snapshots is not None:
+                        self.snapshots.wal.unblock(ip_to_int(ip))
+                    self.events.publish(EV_UNBLOCK, now, ip=ip, source='api')
+            self.metrics.set(METRIC_BLOCKED, len(self.blocked_ips))
+            self._flush_mitigation()
+        if removed:
+            self.logger.info(f"[<<<] UNBLOCKED {removed} IP(s) via API")
+        return {'removed': removed, 'skipped': len(ips) - removed, 'blocked': len(self.blocked_ips)}
+
+    def api_rules(self, offset, limit):
+        # Luật chặn (prefix) đang cài trên từng switch
+        total = sum(len(planner.installed) for planner in self.planners.values())
+        rules = ((dpid, net, plen, until) for dpid, planner in sorted(self.planners.items())
+                 for (net, plen), until in planner.installed.items())
+        items = [{'dpid': dpid, 'prefix': prefix_text(net, plen), 'until': until}
+                 for dpid, net, plen, until in islice(rules, offset, offset + limit)]
+        return total, items
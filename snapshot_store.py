@@ -0,0 +1,314 @@
+# Tên file: snapshot_store.py
+# Vai trò: Ảnh chụp trạng thái controller: checkpoint nhị phân (mmap) + write-ahead log
+# Mục đích: Khởi động lại controller từng làm mất IP đang bị chặn, bảng MAC, bộ đếm /
+#           baseline theo IP nguồn: vài lượt poll đầu bỏ sót tấn công đang diễn ra và
+#           cả bảng L2 phải flood để học lại. Ở đây:
+#             - Checkpoint định kỳ: các section mảng NumPy kích thước cố định (theo
+#               switch), ghi tmp + rename nên không bao giờ đọc phải file dở; chỉ
+#               fsync khi dừng app (định kỳ thì như WAL: chịu được controller chết).
+#             - WAL: thay đổi quan trọng giữa hai checkpoint (chặn / gỡ chặn), ghi theo
+#               lô, bị cắt về rỗng sau mỗi checkpoint.
+#             - Khôi phục lười: lúc khởi động chỉ mmap file và đọc thư mục section; dữ
+#               liệu của một switch chỉ được đọc (page-in) khi switch đó kết nối.
+
+import mmap
+import os
+import struct
+import time
+
+import numpy as np
+
+from prefix_planner import ip_to_int
+from rate_engine import RATES_DTYPE
+
+SNAPSHOT_DIR = 'state'           # Thư mục chứa checkpoint / WAL / cache ACL đã biên dịch
+CHECKPOINT_INTERVAL = 30.0       # Chu kỳ chụp checkpoint (Giây)
+WAL_FLUSH_INTERVAL = 1.0         # Chu kỳ ghi lô WAL xuống đĩa (Giây)
+
+# Checkpoint: MAGIC + HEADER + SECTION * n + dữ liệu các section
+MAGIC = b'SDNSNAP1'
+HEADER = struct.Struct('<dI')            # thời điểm chụp, số section
+SECTION = struct.Struct('<HQQI')         # loại, key (dpid hoặc 0), offset, số bản ghi
+# WAL: WAL_MAGIC + thời điểm của checkpoint mà WAL tiếp nối + các bản ghi
+WAL_MAGIC = b'SDNWAL1\n'
+WAL_BASE = struct.Struct('<d')
+WAL_RECORD = struct.Struct('<BIQd')      # op, ip, dpid, hạn chặn
+WAL_DTYPE = np.dtype([('op', 'u1'), ('ip', '<u4'), ('dpid', '<u8'), ('until', '<f8')])
+
+OP_BLOCK = 1
+OP_UNBLOCK = 2
+NO_SWITCH = 0      # dpid của bản ghi chặn chưa đặt luật trên switch nào
+
+# Các loại section
+SEC_BLOCKS = 1     # IP bị chặn x switch đặt luật (key 0)
+SEC_HOSTS = 2      # IP -> MAC để định vị nguồn (key 0)
+SEC_MACS = 3       # Bảng MAC của một switch (key = dpid)
+SEC_SOURCES = 4    # Bộ đếm / baseline theo IP nguồn của một switch (key = dpid)
+SEC_DESTS = 5      # ... theo IP đích
+
+BLOCK_DTYPE = np.dtype([('ip', '<u4'), ('dpid', '<u8'), ('until', '<f8')])
+HOST_DTYPE = np.dtype([('ip', '<u4'), ('mac', '<u8')])
+MAC_DTYPE = np.dtype([('mac', '<u8'), ('port', '<u4'), ('seen', '<f8')])
+
+SECTION_DTYPES = {
+    SEC_BLOCKS: BLOCK_DTYPE,
+    SEC_HOSTS: HOST_DTYPE,
+    SEC_MACS: MAC_DTYPE,
+    SEC_SOURCES: RATES_DTYPE,
+    SEC_DESTS: RATES_DTYPE,
+}
+
+
+def write_checkpoint(path, sections, now=None, sync=True):
+    """sections: [(loại, key, mảng)] -> file checkpoint; trả về số byte đã ghi."""
+    if now is None:
+        now = time.time()
+    arrays = [(kind, key, np.ascontiguousarray(array, SECTION_DTYPES[kind]))
+              for kind, key, array in sections]
+    offset = len(MAGIC) + HEADER.size + SECTION.size * len(arrays)
+    directory = bytearray()
+    for kind, key, array in arrays:
+        directory += SECTION.pack(kind, key, offset, len(array))
+        offset += array.nbytes
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC + HEADER.pack(now, len(arrays)) + directory)
+        for _, _, array in arrays:
+            f.write(array.tobytes())
+        f.flush()
+        if sync:
+            os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return offset
+
+
+class Checkpoint(object):
+    """
+    Checkpoint mở bằng mmap (chỉ đọc). File thiếu -> checkpoint rỗng; file hỏng ->
+    ValueError (bên gọi log và chạy với trạng thái trống).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.created = 0.0
+        self.sections = {}     # {(loại, key): (offset, số bản ghi)}
+        self._map = None
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            return
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if size < len(MAGIC) + HEADER.size or data[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"{path} is not a snapshot")
+            created, count = HEADER.unpack_from(data, len(MAGIC))
+            pos = len(MAGIC) + HEADER.size
+            if pos + count * SECTION.size > size:
+                raise ValueError(f"{path}: truncated section table")
+            for _ in range(count):
+                kind, key, offset, records = SECTION.unpack_from(data, pos)
+                pos += SECTION.size
+                dtype = SECTION_DTYPES.get(kind)
+                if dtype is None or offset + records * dtype.itemsize > size:
+                    raise ValueError(f"{path}: bad section {kind}/{key}")
+                self.sections[(kind, key)] = (offset, records)
+        except (ValueError, struct.error):
+            data.close()
+            self.sections = {}
+            raise
+        self._map = data
+        self.created = created
+
+    def __len__(self):
+        return len(self.sections)
+
+    def keys(self, kind):
+        return [key for section, key in self.sections if section == kind]
+
+    def get(self, kind, key=0):
+        """Bản sao các bản ghi của một section (mảng rỗng nếu không có)."""
+        dtype = SECTION_DTYPES[kind]
+        entry = self.sections.get((kind, key))
+        if entry is None:
+            return np.empty(0, dtype)
+        offset, records = entry
+        return np.frombuffer(self._map, dtype, records, offset).copy()
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self.sections = {}
+
+
+class WriteAheadLog(object):
+    """Nhật ký chặn / gỡ chặn giữa hai checkpoint: append() chỉ ghi vào bộ đệm RAM."""
+
+    def __init__(self, path):
+        self.path = path
+        self.pending = bytearray()
+        self.file = None
+        self.records = 0
+
+    def block(self, ip, dpids, until):
+        for dpid in dpids or (NO_SWITCH,):
+            self.pending += WAL_RECORD.pack(OP_BLOCK, ip, dpid, until)
+
+    def unblock(self, ip):
+        self.pending += WAL_RECORD.pack(OP_UNBLOCK, ip, 0, 0.0)
+
+    def flush(self):
+        """Ghi lô xuống đĩa (flush vào OS, không fsync: chịu được controller chết, không chịu mất điện)."""
+        if not self.pending:
+            return 0
+        if self.file is None:
+            self.file = open(self.path, 'ab')
+            if self.file.tell() == 0:
+                self.file.write(WAL_MAGIC + WAL_BASE.pack(0.0))
+        self.file.write(self.pending)
+        self.file.flush()
+        count = len(self.pending) // WAL_RECORD.size
+        self.pending.clear()
+        self.records += count
+        return count
+
+    def reset(self, base):
+        """Sau checkpoint `base`: mọi bản ghi cũ đã nằm trong checkpoint -> cắt WAL."""
+        if self.file is not None:
+            self.file.close()
+        self.pending.clear()
+        self.file = open(self.path, 'wb')
+        self.file.write(WAL_MAGIC + WAL_BASE.pack(base))
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def read_wal(path):
+    """(checkpoint nền, mảng WAL_DTYPE); bản ghi cuối bị ghi dở thì bỏ."""
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return 0.0, np.empty(0, WAL_DTYPE)
+    head = len(WAL_MAGIC) + WAL_BASE.size
+    if len(data) < head or not data.startswith(WAL_MAGIC):
+        return 0.0, np.empty(0, WAL_DTYPE)
+    base = WAL_BASE.unpack_from(data, len(WAL_MAGIC))[0]
+    count = (len(data) - head) // WAL_DTYPE.itemsize
+    return base, np.frombuffer(data, WAL_DTYPE, count, head)
+
+
+class StateSnapshots(object):
+    """
+    Checkpoint + WAL của một app trong SNAPSHOT_DIR (<prefix>.snap, <prefix>.wal).
+    - open(): mmap checkpoint gần nhất (lỗi -> log, trạng thái trống).
+    - blocks(now): IP còn hạn chặn = checkpoint rồi áp WAL theo thứ tự ghi.
+    - checkpoint(sections, sync): ghi checkpoint mới, cắt WAL, mở lại bản mmap
+      (sync=False: không fsync, cho checkpoint định kỳ trong event loop).
+    """
+
+    def __init__(self, prefix, logger, directory=SNAPSHOT_DIR):
+        self.logger = logger
+        self.directory = directory
+        self.path = os.path.join(directory, prefix + '.snap')
+        self.wal = WriteAheadLog(os.path.join(directory, prefix + '.wal'))
+        self.current = None
+        self.written = 0
+        self.last_duration = 0.0
+
+    def open(self):
+        try:
+            self.current = Checkpoint(self.path)
+        except ValueError as e:
+            self.logger.warning(f"[SNAPSHOT] {e} (starting with empty state)")
+            self.current = None
+        return self.current
+
+    def get(self, kind, key=0):
+        if self.current is None:
+            return np.empty(0, SECTION_DTYPES[kind])
+        return self.current.get(kind, key)
+
+    def blocks(self, now=None):
+        """{ip (int): (hạn chặn, {dpid})} còn hạn tại `now`."""
+        if now is None:
+            now = time.time()
+        out = {}
+        for ip, dpid, until in self.get(SEC_BLOCKS).tolist():
+            entry = out.get(ip)
+            if entry is None:
+                entry = out[ip] = (until, set())
+            if dpid != NO_SWITCH:
+                entry[1].add(dpid)
+        base, records = read_wal(self.wal.path)
+        # WAL cũ hơn checkpoint (chết giữa lúc ghi checkpoint và cắt WAL) đã nằm trong checkpoint
+        created = self.current.created if self.current is not None else 0.0
+        if base >= created:
+            for op, ip, dpid, until in records.tolist():
+                if op == OP_UNBLOCK:
+                    out.pop(ip, None)
+                    continue
+                entry = out.get(ip)
+                if entry is None or entry[0] != until:
+                    entry = out[ip] = (until, set())    # Lần chặn mới thay lần cũ
+                if dpid != NO_SWITCH:
+                    entry[1].add(dpid)
+        return {ip: entry for ip, entry in out.items() if entry[0] > now}
+
+    def checkpoint(self, sections, now=None, sync=True):
+        if now is None:
+            now = time.time()
+        start = time.perf_counter()
+        self.written = write_checkpoint(self.path, sections, now, sync)
+        self.wal.reset(now)
+        if self.current is not None:
+            self.current.close()
+        self.open()
+        self.last_duration = time.perf_counter() - start
+        return self.written
+
+    def close(self):
+        self.wal.close()
+        if self.current is not None:
+            self.current.close()
+
+
+def block_records(blocked, placement):
+    """
+    {ip: hạn} + {ip: {dpid}} của MitigationManager -> mảng BLOCK_DTYPE (một bản ghi /
+    switch; IP chưa đặt luật ở đâu vẫn có một bản ghi NO_SWITCH).
+    """
+    return np.array([(ip_to_int(ip), dpid, until) for ip, until in blocked.items()
+                     for dpid in placement.get(ip) or (NO_SWITCH,)], BLOCK_DTYPE)
+
+
+def mac_records(table):
+    """MacTable -> mảng MAC_DTYPE theo thứ tự LRU (cũ -> mới)."""
+    ports = table.ports
+    return np.array([(mac, ports[mac], seen) for mac, seen in table.seen.items()], MAC_DTYPE)
+
+
+def restore_macs(table, records, now=None):
+    """Học lại các MAC còn hạn TTL (giữ thứ tự LRU); trả về số MAC được nạp."""
+    if now is None:
+        now = time.time()
+    count = 0
+    for mac, port, seen in records.tolist():
+        if seen + table.ttl > now:
+            table.learn(mac, port, seen)
+            count += 1
+    return count
+
+
+def host_records(locator):
+    return np.array(list(locator.macs.items()), HOST_DTYPE)
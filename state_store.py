@@ -0,0 +1,81 @@
+# Tên file: state_store.py
+# Vai trò: Công cụ dùng chung cho trạng thái có hạn sống (TTL) trong controller
+# Mục đích: Bảng MAC, bộ đếm theo IP nguồn, tập IP bị chặn... không được lớn mãi
+#           khi nguồn bị giả mạo. TimerWheel cho phép hết hạn hàng loạt mà mỗi
+#           lần chỉ chạm vào các mục đến hạn, thay vì quét toàn bộ bảng mỗi giây.
+
+import sys
+
+WHEEL_TICK = 1.0     # Độ phân giải của timer wheel (Giây)
+WHEEL_SIZE = 64      # Số ô trong một vòng
+
+
+class TimerWheel(object):
+    """
+    Hashed timer wheel: mục có hạn `deadline` nằm ở ô (deadline // tick) % size.
+    - schedule(): O(1), không huỷ được -> bên gọi tự kiểm tra lại khi mục đến hạn
+      (gia hạn thì chỉ sửa hạn trong bảng của mình, không cần đặt lại timer).
+    - advance(now): trả về các key có deadline <= now; chỉ duyệt các ô đã trôi
+      qua và ô của tick hiện tại.
+    """
+
+    def __init__(self, tick=WHEEL_TICK, size=WHEEL_SIZE):
+        self.tick = tick
+        self.size = size
+        self.buckets = [[] for _ in range(size)]
+        self.current = None    # Mọi tick <= current đã xử lý xong
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def schedule(self, key, deadline):
+        index = int(deadline // self.tick)
+        if self.current is not None and index <= self.current:
+            # Hạn đã qua (hoặc rơi vào tick đã xử lý) -> đến hạn ở lần advance tới
+            index = self.current + 1
+        self.buckets[index % self.size].append((deadline, key))
+        self.count += 1
+
+    def advance(self, now):
+        due = []
+        target = int(now // self.tick)
+        if self.current is None:
+            self.current = target - self.size    # Lần đầu: duyệt cả vòng
+        steps = min(target - self.current, self.size)
+        for step in range(1, steps + 1):
+            slot = (self.current + step) % self.size
+            bucket = self.buckets[slot]
+            if not bucket:
+                continue
+            keep = []
+            for entry in bucket:
+                if entry[0] <= now:
+                    due.append(entry[1])
+                else:
+                    keep.append(entry)    # Thuộc các vòng sau
+            self.buckets[slot] = keep
+        # Tick hiện tại chưa trôi qua hết -> lần sau xét lại ô của nó
+        if target - 1 > self.current:
+            self.current = target - 1
+        self.count -= len(due)
+        return due
+
+    def memory(self):
+        return sys.getsizeof(self.buckets) + sum(sys.getsizeof(b) for b in self.buckets)
+
+
+def container_bytes(*containers):
+    """Ước lượng bộ nhớ (byte) của các dict/list/set: phần bảng băm + các key."""
+    total = 0
+    for c in containers:
+        total += sys.getsizeof(c)
+        if isinstance(c, dict):
+            total += sum(sys.getsizeof(k) for k in c)
+    return total
+
+
+def format_bytes(n):
+    if n >= 1 << 20:
+        return f"{n / (1 << 20):.1f} MB"
+    return f"{n / 1024:.1f} KB"
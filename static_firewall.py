@@ -1,67 +1,155 @@
 # Tên file: static_firewall.py
-import json
-import os
-import time
+from ryu.app.wsgi import WSGIApplication
 from ryu.base import app_manager
 from ryu.controller import ofp_event
-from ryu.controller.handler import CONFIG_DISPATCHER, set_ev_cls
+from ryu.controller.handler import CONFIG_DISPATCHER, MAIN_DISPATCHER, DEAD_DISPATCHER, set_ev_cls
 from ryu.ofproto import ofproto_v1_3
 from ryu.lib.packet import packet, ethernet, ether_types
 from ryu.lib import hub
+from flow_programmer import FlowProgrammer
+from acl_watcher import AclWatcher, push_diff, RELOAD_INTERVAL
+from metrics_store import MetricsWriter, METRIC_MODE, METRIC_BLOCKED, METRIC_FLOWS
+from instrumentation import Registry, timed, instrument_flows, serve
+from management_api import EventFeed, serve as serve_management, EV_ACL
+from flow_reconciler import Reconciler
+from snapshot_store import SNAPSHOT_DIR
 
 ARP_PRIORITY = 100
 ACLRULE_PRIORITY = 11
 DENY_PRIORITY = 10
+SAFE_MIN_BLOCKED = 5   # Số luật DENY tối thiểu để Dashboard hiển thị AN TOÀN
 
 class StaticFirewall(app_manager.RyuApp):
     OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
+    _CONTEXTS = {'wsgi': WSGIApplication}
 
     def __init__(self, *args, **kwargs):
         super(StaticFirewall, self).__init__(*args, **kwargs)
-        self.acl_rules = []
-        try:
-            with open('rules.json') as f:
-                self.acl_rules = json.load(f)
-        except: pass
-        
-        # Xóa log cũ
-        if os.path.exists("monitor.dat"):
-            os.remove("monitor.dat")
-        # Chạy luồng ghi log
-        self.monitor_thread = hub.spawn(self._monitor)
-        
+        # Biên dịch một lần (cache theo hash file), switch kết nối lại dùng lại ngay
+        # File sai định dạng -> log cảnh báo và giữ bộ luật hiện tại (không còn except: pass)
+        self.acl = AclWatcher('rules.json', ACLRULE_PRIORITY, self.logger, SNAPSHOT_DIR)
+        self.acl.load()
+        self.acl_rules = self.acl.raw_rules
+        self.datapaths = {}
+        # Switch kết nối (lại): chỉ gửi flow ACL mà switch chưa có (xem flow_reconciler.py)
+        self.reconciler = Reconciler(self.logger)
+
+        # FlowMod gửi theo lô + Barrier (xem flow_programmer.py)
+        self.flows = FlowProgrammer(self.logger)
+        self.flow_thread = hub.spawn(self.flows.run)
+        # Tự nạp lại rules.json khi file thay đổi
+        self.watch_thread = hub.spawn(self._watch_rules)
+
+        # Số liệu cho Dashboard: ring buffer + segment nhị phân xoay vòng (thay monitor.dat)
+        # Đọc bằng MetricsReader('static') hoặc: python metrics_store.py static 60
+        self.metrics = MetricsWriter('static')
+        self._update_metrics()
+        self.monitor_thread = hub.spawn(self.metrics.run)
+
+        # Số liệu vận hành cho GET /metrics (xem instrumentation.py)
+        self.stats = Registry()
+        instrument_flows(self.stats, self.flows)
+        self.stats.gauge('sdn_acl_flows', 'Compiled ACL flows per switch',
+                         fn=lambda: len(self.acl.flows))
+        self.stats.gauge('sdn_switches', 'Connected switches', fn=lambda: len(self.datapaths))
+        serve(self, kwargs.get('wsgi'))
+        # GET/POST/DELETE /firewall/rules + sự kiện đổi luật (xem management_api.py)
+        self.events = EventFeed()
+        serve_management(self, kwargs.get('wsgi'))
+
         self.logger.info(">>> STATIC FIREWALL STARTED (LOGGING ENABLED) <<<")
 
-    def _monitor(self):
-        while True:
-            # Logic hiển thị màu sắc trên Dashboard:
-            # - Nếu số luật chặn < 5 (Ví dụ chỉ chặn 2 IP): Coi như vẫn NGUY HIỂM (Mode 1 - Đỏ)
-            # - Nếu số luật chặn >= 5 (Chặn gần hết): Coi như AN TOÀN (Mode 2 - Xanh)
-            
-            num_blocked = 0
-            for r in self.acl_rules:
-                if r['action'] == 'DENY': num_blocked += 1
-            
-            mode = 1 if num_blocked < 5 else 2
-            
-            with open("monitor.dat", "a") as f:
-                f.write(f"{time.time()},{mode},{num_blocked}\n")
-            hub.sleep(1)
+    def _update_metrics(self):
+        # Logic hiển thị màu sắc trên Dashboard:
+        # - Nếu số luật chặn < 5 (Ví dụ chỉ chặn 2 IP): Coi như vẫn NGUY HIỂM (Mode 1 - Đỏ)
+        # - Nếu số luật chặn >= 5 (Chặn gần hết): Coi như AN TOÀN (Mode 2 - Xanh)
+        # Chỉ đếm lại khi bộ luật đổi; luồng metrics chụp gauge mỗi giây
+        num_blocked = sum(1 for r in self.acl_rules if r.get('action') == 'DENY')
+        self.metrics.set(METRIC_BLOCKED, num_blocked)
+        self.metrics.set(METRIC_MODE, 1 if num_blocked < SAFE_MIN_BLOCKED else 2)
+        self.metrics.set(METRIC_FLOWS, len(self.acl.flows))
 
     @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER)
+    @timed('switch_features')
     def switch_features_handler(self, ev):
         dp = ev.msg.datapath
         parser = dp.ofproto_parser
         self.add_flow(dp, ARP_PRIORITY, parser.OFPMatch(eth_type=ether_types.ETH_TYPE_ARP), 
                       [parser.OFPActionOutput(dp.ofproto.OFPP_NORMAL)])
+        self.flows.flush(dp)
+        # Switch có thể còn giữ ACL từ trước (controller khởi động lại): hỏi trước
+        self.reconciler.request(dp, self._reconciled)
 
-        for r in self.acl_rules:
-            if r['action'] == 'DENY':
-                self.add_flow(dp, ACLRULE_PRIORITY, parser.OFPMatch(eth_type=0x0800, ipv4_src=r['src_ip']), [])
-                self.logger.info(f" -> Rule: BLOCK {r['src_ip']}")
-
+    def _reconciled(self, dp, flows):
+        parser = dp.ofproto_parser
+        to_add, to_delete = self.acl.reconcile(flows)
+        self.logger.info(f" -> Rules: {len(self.acl_rules)} ACL entries -> "
+                         f"{len(self.acl.flows)} flows ({len(self.acl.flows) - len(to_add)} "
+                         f"already on switch {dp.id}, +{len(to_add)} / -{len(to_delete)})")
+        push_diff(self.flows, dp, to_add, to_delete, self._rules_installed)
+        # Luật mặc định sau ACL: switch mới không có lúc nào traffic bị cấm lọt qua
         self.add_flow(dp, 0, parser.OFPMatch(), [parser.OFPActionOutput(dp.ofproto.OFPP_NORMAL)])
+        self.flows.flush(dp)
+
+    def _rules_installed(self, batch):
+        if batch.ok:
+            self.logger.info(f" -> Switch {batch.dpid}: rules live after {batch.latency * 1000:.1f} ms")
+        else:
+            self.logger.warning(f" -> Switch {batch.dpid}: {len(batch.errors)} rule(s) rejected")
+
+    @set_ev_cls(ofp_event.EventOFPStateChange, [MAIN_DISPATCHER, DEAD_DISPATCHER])
+    def _state_change_handler(self, ev):
+        dp = ev.datapath
+        if ev.state == MAIN_DISPATCHER:
+            self.datapaths[dp.id] = dp
+        elif ev.state == DEAD_DISPATCHER:
+            self.datapaths.pop(dp.id, None)
+            self.flows.remove(dp.id)
+            self.reconciler.remove(dp.id)
+
+    def _watch_rules(self):
+        # Sửa rules.json khi đang chạy: chỉ gửi ADD / DELETE_STRICT cho phần thay đổi
+        while True:
+            hub.sleep(RELOAD_INTERVAL)
+            self.reconciler.expire()
+            change = self.acl.poll()
+            if change is None:
+                continue
+            self._push_change(*change, source='file')
+
+    def _push_change(self, to_add, to_delete, source):
+        # Gửi phần chênh lệch tới từng switch, nhường event loop giữa các switch
+        self.acl_rules = self.acl.raw_rules
+        self._update_metrics()
+        self.events.publish(EV_ACL, source=source, rules=len(self.acl_rules),
+                            added=len(to_add), deleted=len(to_delete))
+        self.logger.info(f"[ACL] Reload ({source}): +{len(to_add)} / -{len(to_delete)} flows "
+                         f"-> {len(self.datapaths)} switch(es)")
+        for dp in list(self.datapaths.values()):
+            push_diff(self.flows, dp, to_add, to_delete, self._rules_installed)
+            hub.sleep(0)
+
+    def api_rules(self, offset, limit):
+        return len(self.acl_rules), self.acl_rules[offset:offset + limit]
+
+    def api_update_rules(self, raw_rules):
+        to_add, to_delete = self.acl.update(raw_rules)
+        self._push_change(to_add, to_delete, 'api')
+        return {'rules': len(self.acl_rules), 'flows': len(self.acl.flows),
+                'added': len(to_add), 'deleted': len(to_delete)}
 
     def add_flow(self, dp, prio, match, actions):
         inst = [dp.ofproto_parser.OFPInstructionActions(dp.ofproto.OFPIT_APPLY_ACTIONS, actions)]
-        dp.send_msg(dp.ofproto_parser.OFPFlowMod(datapath=dp, priority=prio, match=match, instructions=inst))
\ No newline at end of file
+        self.flows.send(dp, dp.ofproto_parser.OFPFlowMod(datapath=dp, priority=prio, match=match, instructions=inst))
+
+    @set_ev_cls(ofp_event.EventOFPFlowStatsReply, MAIN_DISPATCHER)
+    def _flow_stats_reply_handler(self, ev):
+        self.reconciler.reply(ev.msg)
+
+    @set_ev_cls(ofp_event.EventOFPBarrierReply, [CONFIG_DISPATCHER, MAIN_DISPATCHER])
+    def _barrier_reply_handler(self, ev):
+        self.flows.barrier_reply(ev.msg)
+
+    @set_ev_cls(ofp_event.EventOFPErrorMsg, [CONFIG_DISPATCHER, MAIN_DISPATCHER])
+    def _error_msg_handler(self, ev):
+        self.flows.error(ev.msg)
\ No newline at end of file
@@ -1,31 +1,57 @@
 # Tên file: static_firewall2.py
-import json
+from ryu.app.wsgi import WSGIApplication
 from ryu.base import app_manager
 from ryu.controller import ofp_event
-from ryu.controller.handler import CONFIG_DISPATCHER, set_ev_cls
+from ryu.controller.handler import CONFIG_DISPATCHER, MAIN_DISPATCHER, DEAD_DISPATCHER, set_ev_cls
 from ryu.ofproto import ofproto_v1_3
 from ryu.lib.packet import packet, ethernet, ether_types
+from ryu.lib import hub
+from flow_programmer import FlowProgrammer
+from acl_watcher import AclWatcher, push_diff, RELOAD_INTERVAL
+from instrumentation import Registry, timed, instrument_flows, serve
+from management_api import EventFeed, serve as serve_management, EV_ACL
+from flow_reconciler import Reconciler
+from snapshot_store import SNAPSHOT_DIR
 
 # Mức ưu tiên
 ARP_PRIORITY = 100      # Cho phép ARP
-ACLRULE_PRIORITY = 11   # Luật chặn
+ACLRULE_PRIORITY = 11   # Luật ACL (tầng thấp nhất, xem acl_compiler.py)
 DEFAULT_PRIORITY = 0    # Mặc định
 
 class StaticFirewall2(app_manager.RyuApp):
     OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
+    _CONTEXTS = {'wsgi': WSGIApplication}
 
     def __init__(self, *args, **kwargs):
         super(StaticFirewall2, self).__init__(*args, **kwargs)
-        self.acl_rules = []
-        # ĐỌC FILE RULES2.JSON
-        try:
-            with open('rules2.json') as f:
-                self.acl_rules = json.load(f)
-                self.logger.info(f">>> Loaded {len(self.acl_rules)} rules from rules2.json <<<")
-        except Exception as e:
-            self.logger.info(f"Failed to load rules: {e}")
+        # ĐỌC + BIÊN DỊCH FILE RULES2.JSON (cache theo hash nội dung file)
+        # Lỗi đọc/kiểm tra được log trong AclWatcher.load()
+        self.acl = AclWatcher('rules2.json', ACLRULE_PRIORITY, self.logger, SNAPSHOT_DIR)
+        self.acl.load()
+        self.acl_rules = self.acl.raw_rules
+        self.datapaths = {}
+        # Switch kết nối (lại): chỉ gửi flow ACL mà switch chưa có (xem flow_reconciler.py)
+        self.reconciler = Reconciler(self.logger)
+
+        # FlowMod gửi theo lô + Barrier (xem flow_programmer.py)
+        self.flows = FlowProgrammer(self.logger)
+        self.flow_thread = hub.spawn(self.flows.run)
+        # Tự nạp lại rules2.json khi file thay đổi
+        self.watch_thread = hub.spawn(self._watch_rules)
+
+        # Số liệu vận hành cho GET /metrics (xem instrumentation.py)
+        self.stats = Registry()
+        instrument_flows(self.stats, self.flows)
+        self.stats.gauge('sdn_acl_flows', 'Compiled ACL flows per switch',
+                         fn=lambda: len(self.acl.flows))
+        self.stats.gauge('sdn_switches', 'Connected switches', fn=lambda: len(self.datapaths))
+        serve(self, kwargs.get('wsgi'))
+        # GET/POST/DELETE /firewall/rules + sự kiện đổi luật (xem management_api.py)
+        self.events = EventFeed()
+        serve_management(self, kwargs.get('wsgi'))
 
     @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER)
+    @timed('switch_features')
     def switch_features_handler(self, ev):
         dp = ev.msg.datapath
         parser = dp.ofproto_parser
@@ -33,22 +59,84 @@ class StaticFirewall2(app_manager.RyuApp):
         # 1. Cho phép ARP
         self.add_flow(dp, ARP_PRIORITY, parser.OFPMatch(eth_type=ether_types.ETH_TYPE_ARP), 
                       [parser.OFPActionOutput(dp.ofproto.OFPP_NORMAL)])
+        self.flows.flush(dp)
 
-        # 2. Nạp luật từ rules2.json
-        count = 0
-        for r in self.acl_rules:
-            if r['action'] == 'DENY':
-                match = parser.OFPMatch(eth_type=0x0800, ipv4_src=r['src_ip'])
-                self.add_flow(dp, ACLRULE_PRIORITY, match, []) # Action rỗng = DROP
-                self.logger.info(f" -> Installed Rule: BLOCK {r['src_ip']}")
-                count += 1
-        
-        self.logger.info(f">>> Total rules installed: {count} <<<")
+        # 2. Hỏi switch đang giữ flow ACL nào (controller khởi động lại / kết nối lại)
+        self.reconciler.request(dp, self._reconciled)
+
+    def _reconciled(self, dp, flows):
+        parser = dp.ofproto_parser
+
+        # 3. Chỉ gửi phần chênh lệch với luật đã biên dịch từ rules2.json
+        to_add, to_delete = self.acl.reconcile(flows)
+        self.logger.info(f">>> Rules: +{len(to_add)} / -{len(to_delete)} "
+                         f"({len(self.acl.flows) - len(to_add)} already installed) <<<")
+        push_diff(self.flows, dp, to_add, to_delete, self._rules_installed)
 
-        # 3. Luật mặc định
+        # 4. Luật mặc định (sau ACL) + Barrier
         self.add_flow(dp, DEFAULT_PRIORITY, parser.OFPMatch(), [parser.OFPActionOutput(dp.ofproto.OFPP_NORMAL)])
+        self.flows.flush(dp)
+
+    def _rules_installed(self, batch):
+        if batch.ok:
+            self.logger.info(f">>> Switch {batch.dpid}: {batch.size} flows live after "
+                             f"{batch.latency * 1000:.1f} ms <<<")
+        else:
+            self.logger.warning(f">>> Switch {batch.dpid}: {len(batch.errors)} flow(s) rejected <<<")
+
+    @set_ev_cls(ofp_event.EventOFPStateChange, [MAIN_DISPATCHER, DEAD_DISPATCHER])
+    def _state_change_handler(self, ev):
+        dp = ev.datapath
+        if ev.state == MAIN_DISPATCHER:
+            self.datapaths[dp.id] = dp
+        elif ev.state == DEAD_DISPATCHER:
+            self.datapaths.pop(dp.id, None)
+            self.flows.remove(dp.id)
+            self.reconciler.remove(dp.id)
+
+    def _watch_rules(self):
+        # Sửa rules2.json khi đang chạy: chỉ gửi ADD / DELETE_STRICT cho phần thay đổi
+        while True:
+            hub.sleep(RELOAD_INTERVAL)
+            self.reconciler.expire()
+            change = self.acl.poll()
+            if change is None:
+                continue
+            self._push_change(*change, source='file')
+
+    def _push_change(self, to_add, to_delete, source):
+        # Gửi phần chênh lệch tới từng switch, nhường event loop giữa các switch
+        self.acl_rules = self.acl.raw_rules
+        self.events.publish(EV_ACL, source=source, rules=len(self.acl_rules),
+                            added=len(to_add), deleted=len(to_delete))
+        self.logger.info(f"[ACL] Reload ({source}): +{len(to_add)} / -{len(to_delete)} flows "
+                         f"-> {len(self.datapaths)} switch(es)")
+        for dp in list(self.datapaths.values()):
+            push_diff(self.flows, dp, to_add, to_delete, self._rules_installed)
+            hub.sleep(0)
+
+    def api_rules(self, offset, limit):
+        return len(self.acl_rules), self.acl_rules[offset:offset + limit]
+
+    def api_update_rules(self, raw_rules):
+        to_add, to_delete = self.acl.update(raw_rules)
+        self._push_change(to_add, to_delete, 'api')
+        return {'rules': len(self.acl_rules), 'flows': len(self.acl.flows),
+                'added': len(to_add), 'deleted': len(to_delete)}
 
     def add_flow(self, dp, prio, match, actions):
         inst = [dp.ofproto_parser.OFPInstructionActions(dp.ofproto.OFPIT_APPLY_ACTIONS, actions)]
         mod = dp.ofproto_parser.OFPFlowMod(datapath=dp, priority=prio, match=match, instructions=inst)
-        dp.send_msg(mod)
\ No newline at end of file
+        self.flows.send(dp, mod)
+
+    @set_ev_cls(ofp_event.EventOFPFlowStatsReply, MAIN_DISPATCHER)
+    def _flow_stats_reply_handler(self, ev):
+        self.reconciler.reply(ev.msg)
+
+    @set_ev_cls(ofp_event.EventOFPBarrierReply, [CONFIG_DISPATCHER, MAIN_DISPATCHER])
+    def _barrier_reply_handler(self, ev):
+        self.flows.barrier_reply(ev.msg)
+
+    @set_ev_cls(ofp_event.EventOFPErrorMsg, [CONFIG_DISPATCHER, MAIN_DISPATCHER])
+    def _error_msg_handler(self, ev):
+        self.flows.error(ev.msg)
\ No newline at end of file
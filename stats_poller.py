@@ -0,0 +1,112 @@
+# Tên file: stats_poller.py
+# Vai trò: Chiến lược lấy thống kê (polling) cho SDNSmartFirewall
+# Mục đích: Bình thường chỉ lấy số liệu tổng (Aggregate/Port stats, vài chục byte),
+#           chỉ kéo chi tiết theo IP nguồn (Flow stats đã lọc) khi switch vượt ngưỡng sơ bộ.
+
+import time
+from ryu.lib.packet import ether_types
+
+# Các chế độ polling
+POLL_FLOW = 'flow'            # Dump toàn bộ bảng flow mỗi chu kỳ (cách cũ)
+POLL_FILTERED = 'filtered'    # Flow stats lọc theo match IPv4 (+ cookie nếu có)
+POLL_AGGREGATE = 'aggregate'  # OFPAggregateStatsRequest -> chi tiết khi vượt ngưỡng
+POLL_PORT = 'port'            # OFPPortStatsRequest -> chi tiết khi vượt ngưỡng
+POLL_MODES = (POLL_FLOW, POLL_FILTERED, POLL_AGGREGATE, POLL_PORT)
+
+
+class StatsPoller(object):
+    """
+    Gửi request thống kê theo chế độ đã chọn và quyết định khi nào cần chi tiết.
+    Ngưỡng sơ bộ an toàn: PPS của một nguồn không thể lớn hơn PPS tổng của switch,
+    nên pre_threshold = THRESHOLD_PPS không bỏ sót nguồn nào vượt ngưỡng.
+    """
+
+    def __init__(self, mode=POLL_AGGREGATE, pre_threshold=0, cookie=0, cookie_mask=0,
+                 table_id=None):
+        if mode not in POLL_MODES:
+            raise ValueError(f"Unknown poll mode: {mode}")
+        self.mode = mode
+        self.pre_threshold = pre_threshold
+        self.cookie = cookie
+        self.cookie_mask = cookie_mask
+        # Số liệu tổng chỉ trên một bảng (None = mọi bảng). Với pipeline nhiều bảng,
+        # một gói khớp flow ở mỗi bảng nó đi qua -> chỉ đếm ở bảng đầu tiên
+        self.table_id = table_id
+        # Số liệu tổng lần trước để tính tốc độ: {dpid: (packets, time)}
+        self.prev_totals = {}
+        # Tốc độ tổng gần nhất của từng switch: {dpid: pps}
+        self.total_pps = {}
+
+    def request(self, datapath):
+        """Gửi request của chu kỳ polling hiện tại cho một switch."""
+        if self.mode == POLL_FLOW:
+            parser = datapath.ofproto_parser
+            datapath.send_msg(parser.OFPFlowStatsRequest(datapath))
+        elif self.mode == POLL_FILTERED:
+            self.request_detail(datapath)
+        elif self.mode == POLL_AGGREGATE:
+            self._request_aggregate(datapath)
+        else:
+            self._request_ports(datapath)
+
+    def request_detail(self, datapath):
+        """Flow stats chỉ cho các flow IPv4 (bỏ qua flow L2 của packet_in_handler)."""
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        match = parser.OFPMatch(eth_type=ether_types.ETH_TYPE_IP)
+        req = parser.OFPFlowStatsRequest(datapath, 0, ofproto.OFPTT_ALL,
+                                         ofproto.OFPP_ANY, ofproto.OFPG_ANY,
+                                         self.cookie, self.cookie_mask, match)
+        datapath.send_msg(req)
+
+    def _request_aggregate(self, datapath):
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        table_id = ofproto.OFPTT_ALL if self.table_id is None else self.table_id
+        req = parser.OFPAggregateStatsRequest(datapath, 0, table_id,
+                                              ofproto.OFPP_ANY, ofproto.OFPG_ANY,
+                                              0, 0, parser.OFPMatch())
+        datapath.send_msg(req)
+
+    def _request_ports(self, datapath):
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        datapath.send_msg(parser.OFPPortStatsRequest(datapath, 0, ofproto.OFPP_ANY))
+
+    def _total_rate(self, dpid, packets, now):
+        prev = self.prev_totals.get(dpid)
+        self.prev_totals[dpid] = (packets, now)
+        if prev is None or now - prev[1] <= 0.1:
+            return None
+        pps = max(packets - prev[0], 0) / (now - prev[1])
+        self.total_pps[dpid] = pps
+        return pps
+
+    def on_total(self, datapath, packets, now=None):
+        """
+        Nhận số gói tổng của switch; gửi request chi tiết nếu vượt ngưỡng sơ bộ.
+        Trả về True nếu đã gửi request chi tiết.
+        """
+        if now is None:
+            now = time.time()
+        pps = self._total_rate(datapath.id, packets, now)
+        # Lần đầu chưa có mốc so sánh -> lấy chi tiết để RateEngine có mẫu gốc
+        if pps is None or pps > self.pre_threshold:
+            self.request_detail(datapath)
+            return True
+        return False
+
+    def on_aggregate(self, datapath, stats, now=None):
+        return self.on_total(datapath, stats.packet_count, now)
+
+    def on_port_stats(self, datapath, body, now=None):
+        ofproto = datapath.ofproto
+        packets = 0
+        for stat in body:
+            if stat.port_no <= ofproto.OFPP_MAX:
+                packets += stat.rx_packets
+        return self.on_total(datapath, packets, now)
+
+    def remove(self, dpid):
+        self.prev_totals.pop(dpid, None)
+        self.total_pps.pop(dpid, None)
@@ -0,0 +1,47 @@
+# Tên file: thresholds.py
+# Vai trò: Ngưỡng phát hiện theo subnet (điểm bất thường + giới hạn PPS)
+# Mục đích: Thay hằng số THRESHOLD_PPS dùng chung: máy chủ bận rộn hợp lệ và
+#           subnet khách có thể có ngưỡng khác nhau. Tra cứu vector hoá (NumPy)
+#           cho cả reply nhiều nghìn IP, prefix dài hơn được ưu tiên.
+
+import numpy as np
+
+from prefix_planner import ip_to_int, prefix_mask
+
+
+class ThresholdTable(object):
+    """
+    Mỗi mục: (subnet 'a.b.c.d/n', z, min_pps, max_pps). Một IP bất thường khi
+        rate > min_pps  và  (z-score > z  hoặc  rate > max_pps).
+    - min_pps: bỏ qua dao động của các nguồn quá nhỏ,
+    - max_pps: trần tuyệt đối (còn hiệu lực khi baseline chưa học xong).
+    """
+
+    def __init__(self, default, entries=()):
+        self.default = tuple(float(v) for v in default)
+        rules = []
+        for subnet, z, min_pps, max_pps in entries:
+            net, _, plen = subnet.partition('/')
+            plen = int(plen) if plen else 32
+            rules.append((plen, ip_to_int(net) & prefix_mask(plen), float(z),
+                          float(min_pps), float(max_pps)))
+        # Prefix ngắn trước -> prefix dài hơn ghi đè (longest prefix match)
+        self.rules = sorted(rules)
+
+    def lookup(self, addrs):
+        """(z, min_pps, max_pps) dạng mảng cho mảng IP uint32."""
+        n = len(addrs)
+        z = np.full(n, self.default[0])
+        low = np.full(n, self.default[1])
+        high = np.full(n, self.default[2])
+        for plen, net, rule_z, rule_low, rule_high in self.rules:
+            hit = (addrs & np.uint32(prefix_mask(plen))) == net
+            z[hit] = rule_z
+            low[hit] = rule_low
+            high[hit] = rule_high
+        return z, low, high
+
+    def flag(self, addrs, rates, scores):
+        """Mảng bool: IP nào bất thường theo ngưỡng của subnet của nó."""
+        z, low, high = self.lookup(addrs)
+        return (rates > low) & ((scores > z) | (rates > high))